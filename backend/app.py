@@ -3,18 +3,51 @@ import uuid
 import re
 import requests
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
-from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt, get_jwt_identity, verify_jwt_in_request
 from flask_mail import Mail, Message
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2.pool import SimpleConnectionPool
-from security.password_utils import hash_password, verify_password
+import psycopg2.errors
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from security.password_utils import MAX_ROUNDS, MIN_ROUNDS, DEFAULT_ROUNDS, HasherBusy, PasswordHasher, hash_rounds
+from security.login_throttle import LoginThrottle
+from services.health_metrics import BUCKETS, aggregate_metrics, downsample_metrics
+from services.partitions import PARTITIONED_TABLES, convert_to_partitioned, maintain_partitions
+from services.events import EventBroker, SeenEvents, fetch_missed_events, format_resync, format_sse, publish_event
+from services.notifications import (
+    create_notification, get_unread_count, list_notifications, mark_notifications_read
+)
+from services.stats import StatsService
+from services.patient_summary import SUMMARY_SECTIONS, build_summary
+from services.fieldsets import parse_fields, select_list
+from services.json_encoding import FastJSONProvider, json_list_response, raw_jsonb
+from services.compression import ResponseCompressor
+from services.invalidation import ChangeListener
+from services.reference_cache import ReferenceCache, cached_json_response
+from services.settings import SettingsService, load_system_settings
+from services.jobs import Worker, queue_stats, task
+from services.mailer import DELIVER_TASK, deliver_pending, purge_sent, queue_email
+from services.reminders import TICK_INTERVAL, purge_reminders, run_reminders
+from services.structured_logging import RequestLogger, configure_logging, get_logger
+from services.sync import (
+    SYNC_DEFAULT_LIMIT, SYNC_ENTITIES, SYNC_MAX_LIMIT, install_sync_triggers, purge_tombstones, sync_changes
+)
+from services.roster import get_roster, rebuild_roster, refresh_roster_entry
+from services.scheduling import OCCUPANCY_RESOLUTION, Scheduler, occupancy_bitmaps
+from services.conversations import (
+    get_conversation_messages, get_membership, list_conversations,
+    mark_conversation_read, rebuild_conversations, record_message
+)
 import random
 import string
+import click
 import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import numpy as np
 import pydicom
@@ -23,13 +56,29 @@ from io import BytesIO
 # Charger les variables d'environnement
 load_dotenv()
 
+# Journaux JSON écrits par un fil dédié (niveau : variable LOG_LEVEL)
+configure_logging(os.getenv('LOG_LEVEL', 'INFO').upper())
+logger = get_logger()
+
 app = Flask(__name__)
+# Derrière un proxy inverse, remote_addr est repris de X-Forwarded-For sur TRUSTED_PROXY_HOPS
+# niveaux seulement (0 : connexion directe, l'en-tête est ignoré et ne peut être falsifié)
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+# Identifiant de requête (X-Request-ID) et journal d'accès échantillonné
+request_logger = RequestLogger(app)
+# Encodage JSON des réponses (dates ISO 8601, Decimal, JSONB brut) : voir services/json_encoding.py
+app.json = FastJSONProvider(app)
+# Compression des réponses (paramètres compression_* de system_settings)
+response_compressor = ResponseCompressor(app)
 # Configuration CORS
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:3000"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "X-Request-ID"],
+        "expose_headers": ["X-Request-ID"],
         "supports_credentials": True
     }
 })
@@ -37,6 +86,8 @@ CORS(app, resources={
 # Configuration de Flask-JWT-Extended
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "super-secret")
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
+# EventSource ne permet pas d'envoyer d'en-tête Authorization : le jeton est aussi accepté en paramètre ?jwt=
+app.config["JWT_TOKEN_LOCATION"] = ["headers"]
 jwt = JWTManager(app)
 
 # Configuration des serveurs Orthanc
@@ -44,23 +95,26 @@ ORTHANC_SERVERS = [
     {"url": "http://localhost:8042", "name": "Orthanc Server 1", "auth": (os.getenv("ORTHANC_USERNAME", "orthanc"), os.getenv("ORTHANC_PASSWORD", "orthanc"))},
 ]
 
-# Configuration de Flask-Mail (simplifiée, sans rappels pour l'instant)
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+# Configuration de Flask-Mail : les e-mails sont envoyés par le worker (file 'email').
+# Pour tester sans serveur réel : python -m aiosmtpd -n -l localhost:1025 puis
+# MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
+app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', os.getenv('MAIL_USERNAME'))
 mail = Mail(app)
 
 # Connexion à PostgreSQL avec pool de connexions
-db_pool = SimpleConnectionPool(
-    minconn=1,
-    maxconn=20,
-    dbname="telemedicine",
-    user=os.getenv("DB_USER", "telemed_user"),
-    password=os.getenv("DB_PASSWORD", "telemed2025"),
-    host="localhost"
-)
+DB_CONFIG = {
+    "dbname": "telemedicine",
+    "user": os.getenv("DB_USER", "telemed_user"),
+    "password": os.getenv("DB_PASSWORD", "telemed2025"),
+    "host": "localhost"
+}
+# Pool partagé entre fils (serveur multi-fils, sous-requêtes /batch, écouteurs)
+db_pool = ThreadedConnectionPool(minconn=1, maxconn=20, **DB_CONFIG)
 
 def get_db_connection():
     return db_pool.getconn()
@@ -68,6 +122,56 @@ def get_db_connection():
 def release_db_connection(conn):
     db_pool.putconn(conn)
 
+# Écouteur LISTEN/NOTIFY partagé par les flux SSE du processus
+event_broker = EventBroker(DB_CONFIG)
+
+# Invalidation des caches en mémoire entre processus (triggers notify_table_change)
+change_listener = ChangeListener(DB_CONFIG)
+
+# Données de référence (médecins, paramètres, rôles) servies avec ETag, versionnées par table
+reference_cache = ReferenceCache(change_listener)
+
+# Paramètres système en mémoire, rechargés à chaque modification (tous processus)
+settings_service = SettingsService(get_db_connection, release_db_connection, change_listener)
+settings_service.on_reload(response_compressor.configure)
+
+# Hachage bcrypt sur un pool de fils dédié et borné (métriques : /admin/security/password-hashing)
+password_hasher = PasswordHasher()
+
+def bcrypt_rounds():
+    return min(max(settings_service.get_int('bcrypt_rounds', DEFAULT_ROUNDS), MIN_ROUNDS), MAX_ROUNDS)
+
+# Limitation des tentatives de connexion (par compte et par adresse), avant tout calcul bcrypt
+login_throttle = LoginThrottle(settings_service, get_db_connection, release_db_connection)
+# Purge des seaux partagés inactifs, par le worker de tâches (secondes)
+LOGIN_THROTTLE_PURGE_INTERVAL = 900
+
+# Statistiques des tableaux de bord admin et assistant (cache partagé)
+stats_service = StatsService(get_db_connection, release_db_connection)
+
+# Recherche de créneaux libres (cache par médecin et par jour)
+scheduler = Scheduler()
+
+# Durée maximale d'une recherche de créneaux (jours)
+MAX_SCHEDULE_RANGE_DAYS = 31
+# Nombre maximal de créneaux libres renvoyés par /schedule/free-slots (au-delà : plafonné)
+FREE_SLOTS_MAX_LIMIT = 200
+
+# Nombre maximal de médecins par vue agenda multi-médecins
+MAX_AGENDA_DOCTORS = 50
+
+# Intervalle des commentaires keep-alive envoyés sur les flux SSE (secondes)
+SSE_KEEPALIVE = 15
+
+# Requêtes groupées (/batch) : taille maximale d'un lot et nombre de sous-requêtes
+# de lecture exécutées en parallèle (chacune emprunte une connexion au pool)
+BATCH_MAX_REQUESTS = 20
+BATCH_CONCURRENCY = 4
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Routes non disponibles dans un lot (flux continus, lots imbriqués)
+BATCH_EXCLUDED_PREFIXES = ('/batch', '/events/')
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='batch')
+
 def validate_invitation_code(invitation_code):
     if not invitation_code:
         return False
@@ -77,15 +181,33 @@ def validate_invitation_code(invitation_code):
 DICOM_STORAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'storage', 'dicom')
 os.makedirs(DICOM_STORAGE_PATH, exist_ok=True)
 
+# Routes restant accessibles en mode maintenance (connexion et administration)
+MAINTENANCE_ALLOWED_PREFIXES = ('/login', '/admin/')
+
+@app.before_request
+def enforce_maintenance_mode():
+    # Lecture du paramètre en mémoire : aucun accès à la base par requête
+    if request.method == 'OPTIONS' or request.path == '/' or request.path.startswith(MAINTENANCE_ALLOWED_PREFIXES):
+        return None
+    if not settings_service.get_bool('maintenance_mode'):
+        return None
+    try:
+        verify_jwt_in_request(optional=True)
+        if get_jwt().get('role') == 'admin':
+            return None
+    except Exception:
+        pass
+    response = jsonify({"error": "Plateforme en maintenance, veuillez réessayer plus tard"})
+    response.headers['Retry-After'] = '300'
+    return response, 503
+
 @app.route('/')
 def home():
     return jsonify({"message": "Bienvenue sur la plateforme i-health !"})
 
 @app.route('/register', methods=['POST'])
 def register():
-    print("\n=== Début de l'inscription ===")
     data = request.get_json()
-    print(f"Données reçues: {data}")
 
     email = data.get('email')
     plain_password = data.get('password')
@@ -100,18 +222,6 @@ def register():
     medical_history = data.get('medical_history')
     allergies = data.get('allergies')
 
-    print(f"\nDonnées extraites:")
-    print(f"Email: {email}")
-    print(f"Rôle: {role}")
-    print(f"Nom: {name}")
-    print(f"Téléphone: {phone}")
-    print(f"Date de naissance: {birthdate}")
-    print(f"Code d'invitation: {invitation_code}")
-    if role == 'doctor':
-        print(f"Spécialité: {speciality}")
-        print(f"Numéro de licence: {license_number}")
-        print(f"Lieu de travail: {work_location}")
-
     # Validation des champs obligatoires
     if not all([email, plain_password, role, name]):
         missing_fields = []
@@ -120,50 +230,50 @@ def register():
         if not role: missing_fields.append('role')
         if not name: missing_fields.append('name')
         error_msg = f"Champs obligatoires manquants: {', '.join(missing_fields)}"
-        print(f"❌ {error_msg}")
+        logger.info("Inscription refusée : %s", error_msg)
         return jsonify({"error": error_msg}), 400
 
     if role not in ['patient', 'doctor', 'assistant', 'admin']:
         error_msg = f"Rôle invalide: {role}. Rôles autorisés: patient, doctor, assistant, admin"
-        print(f"❌ {error_msg}")
+        logger.info("Inscription refusée : %s", error_msg)
         return jsonify({"error": error_msg}), 400
 
     # Validation d'email
     email_regex = r'^[^\s@]+@[^\s@]+\.[^\s@]+$'
     if not re.match(email_regex, email):
         error_msg = f"Adresse email invalide: {email}"
-        print(f"❌ {error_msg}")
+        logger.info("Inscription refusée : %s", error_msg)
         return jsonify({"error": error_msg}), 400
 
     # Validation spécifique aux rôles
     if role == 'patient':
         if not phone or not re.match(r'^(7[0678])[0-9]{7}$', phone):
             error_msg = "Numéro de téléphone requis et invalide pour un patient"
-            print(f"❌ {error_msg}")
+            logger.info("Inscription refusée : %s", error_msg)
             return jsonify({"error": error_msg}), 400
         if not birthdate:
             error_msg = "Date de naissance requise pour un patient"
-            print(f"❌ {error_msg}")
+            logger.info("Inscription refusée : %s", error_msg)
             return jsonify({"error": error_msg}), 400
         try:
             birthdate_date = datetime.strptime(birthdate, '%Y-%m-%d')
             if birthdate_date > datetime.now():
                 error_msg = "Date de naissance doit être dans le passé"
-                print(f"❌ {error_msg}")
+                logger.info("Inscription refusée : %s", error_msg)
                 return jsonify({"error": error_msg}), 400
         except ValueError:
             error_msg = "Format de date invalide (YYYY-MM-DD)"
-            print(f"❌ {error_msg}")
+            logger.info("Inscription refusée : %s", error_msg)
             return jsonify({"error": error_msg}), 400
 
     if role in ['assistant', 'doctor']:
         if not invitation_code:
             error_msg = f"Code d'invitation requis pour les {role}s"
-            print(f"❌ {error_msg}")
+            logger.info("Inscription refusée : %s", error_msg)
             return jsonify({"error": error_msg}), 400
         if not validate_invitation_code(invitation_code):
             error_msg = f"Code d'invitation invalide pour un {role}. Format attendu: ASST-XXX"
-            print(f"❌ {error_msg}")
+            logger.info("Inscription refusée : %s", error_msg)
             return jsonify({"error": error_msg}), 400
         birthdate = None if not birthdate else birthdate
 
@@ -174,15 +284,17 @@ def register():
             if not license_number: missing_fields.append('numéro de licence')
             if not work_location: missing_fields.append('lieu de travail')
             error_msg = f"Champs requis manquants pour un médecin: {', '.join(missing_fields)}"
-            print(f"❌ {error_msg}")
+            logger.info("Inscription refusée : %s", error_msg)
             return jsonify({"error": error_msg}), 400
 
-    hashed_password = hash_password(plain_password)
+    try:
+        hashed_password = password_hasher.hash(plain_password, bcrypt_rounds())
+    except HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
 
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        print("\nTentative d'insertion dans la base de données...")
         if role == 'doctor':
             cur.execute(
                 """INSERT INTO users 
@@ -200,7 +312,6 @@ def register():
                 (email, hashed_password, role, name, phone, birthdate)
             )
         user_id = cur.fetchone()['id']
-        print(f"✅ Utilisateur créé avec succès, ID: {user_id}")
 
         # Insérer dans medical_records pour les patients
         if role == 'patient' and (medical_history or allergies):
@@ -210,37 +321,47 @@ def register():
                    ON CONFLICT (patient_id) DO NOTHING""",
                 (user_id, medical_history or None, allergies or None, None, None)
             )
-            print("✅ Dossier médical créé avec succès")
 
         conn.commit()
-        print("✅ Transaction validée")
+        reference_cache.bump('users')
+        logger.info("Utilisateur inscrit", extra={"user_id": user_id, "role": role})
         return jsonify({"message": "Inscription réussie.", "user_id": user_id}), 201
 
     except psycopg2.IntegrityError as e:
         conn.rollback()
         error_msg = str(e)
-        print(f"❌ Erreur d'intégrité: {error_msg}")
+        logger.warning("Inscription refusée par la base : %s", error_msg)
         if "users_email_key" in error_msg:
             return jsonify({"error": "Cette adresse email est déjà utilisée"}), 400
         return jsonify({"error": f"Erreur de base de données: {error_msg}"}), 400
     except Exception as e:
         conn.rollback()
         error_msg = str(e)
-        print(f"❌ Erreur inattendue: {error_msg}")
+        logger.exception("Erreur lors de l'inscription")
         return jsonify({"error": f"Erreur lors de l'inscription: {error_msg}"}), 500
     finally:
         cur.close()
         release_db_connection(conn)
-        print("=== Fin de l'inscription ===\n")
 
 @app.route('/login', methods=['POST'])
 def login():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     email = data.get('email')
     plain_password = data.get('password')
 
     if not all([email, plain_password]):
         return jsonify({"error": "Email et mot de passe requis"}), 400
+    if not isinstance(email, str) or not isinstance(plain_password, str):
+        return jsonify({"error": "Email et mot de passe doivent être des chaînes de caractères"}), 400
+
+    # Adresse du client : remote_addr corrigé par ProxyFix derrière un proxy de confiance
+    address = request.remote_addr or 'unknown'
+    retry_after = login_throttle.check(email, address)
+    if retry_after:
+        return jsonify({
+            "error": "Trop de tentatives de connexion, veuillez réessayer plus tard",
+            "retry_after": retry_after
+        }), 429, {"Retry-After": str(retry_after)}
 
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -253,10 +374,23 @@ def login():
         if not user:
             return jsonify({"error": "Utilisateur non trouvé ou désactivé"}), 401
 
-        if user and verify_password(plain_password, user['password']):
-            access_token = create_access_token(identity=user['id'], additional_claims={'role': user['role']})
+        if user and password_hasher.verify(plain_password, user['password']):
+            # Facteur de coût modifié depuis le dernier hachage : mise à niveau transparente
+            rounds = bcrypt_rounds()
+            if hash_rounds(user['password']) != rounds:
+                cur.execute(
+                    "UPDATE users SET password = %s WHERE id = %s",
+                    (password_hasher.hash(plain_password, rounds), user['id'])
+                )
+            # Durée de session configurable (session_timeout, en minutes)
+            access_token = create_access_token(
+                identity=user['id'],
+                additional_claims={'role': user['role']},
+                expires_delta=timedelta(minutes=settings_service.get_int('session_timeout', 60))
+            )
             cur.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s", (user['id'],))
             conn.commit()
+            login_throttle.succeeded(email, address)
             return jsonify({
                 "message": "Connexion réussie",
                 "access_token": access_token,
@@ -269,6 +403,11 @@ def login():
             }), 200
         else:
             return jsonify({"error": "Email ou mot de passe incorrect"}), 401
+    except HasherBusy as e:
+        conn.rollback()
+        # La surcharge du serveur ne compte pas comme une tentative échouée
+        login_throttle.abandoned(email, address)
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
@@ -313,9 +452,37 @@ def get_patient_profile(patient_id):
         cur.close()
         release_db_connection(conn)
 
-@app.route('/doctors', methods=['GET'])
+@app.route('/patient/<int:patient_id>/summary', methods=['GET'])
 @jwt_required()
-def get_doctors():
+def get_patient_summary(patient_id):
+    # ?include=appointments,prescriptions,metrics,unread_messages,unread_notifications,doctors
+    current_user_id = get_jwt_identity()
+    include = request.args.get('include')
+    sections = [s.strip() for s in include.split(',') if s.strip()] if include else list(SUMMARY_SECTIONS)
+    unknown = [s for s in sections if s not in SUMMARY_SECTIONS]
+    if unknown:
+        return jsonify({"error": f"Sections inconnues: {', '.join(unknown)}. Valeurs autorisées: {', '.join(SUMMARY_SECTIONS)}"}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        # Une seule transaction en lecture seule : toutes les sections voient le même instantané
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+        current_user_role = cur.fetchone()['role']
+        if current_user_role not in ('admin', 'doctor') and current_user_id != patient_id:
+            return jsonify({"error": "Non autorisé à voir le tableau de bord de ce patient"}), 403
+
+        summary = build_summary(cur, patient_id, sections)
+        return jsonify(summary), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        conn.rollback()
+        cur.close()
+        release_db_connection(conn)
+
+def load_doctors():
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
@@ -323,14 +490,49 @@ def get_doctors():
             """SELECT id, name, speciality, work_location 
                FROM users WHERE role = 'doctor' AND is_active = TRUE"""
         )
-        doctors = cur.fetchall()
-        return jsonify({"doctors": doctors}), 200
-    except Exception as e:
-        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+        return {"doctors": cur.fetchall()}
+    finally:
+        conn.rollback()
+        cur.close()
+        release_db_connection(conn)
+
+def load_user_role(user_id):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+        user = cur.fetchone()
+        return user['role'] if user else None
     finally:
+        conn.rollback()
         cur.close()
         release_db_connection(conn)
 
+def get_cached_role(user_id):
+    return reference_cache.get(('role', user_id), ('users',), lambda: load_user_role(user_id))['value']
+
+@app.route('/doctors', methods=['GET'])
+@jwt_required()
+def get_doctors():
+    # Réponse mise en cache jusqu'à la prochaine modification de users ; 304 sans accès à la base
+    try:
+        return cached_json_response(reference_cache.get('doctors', ('users',), load_doctors))
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+
+# Nombre de créneaux proposés en cas de conflit de réservation
+ALTERNATIVE_SLOTS = 5
+
+def suggest_alternative_slots(cur, doctor_id, requested_datetime, duration):
+    # Créneaux libres les plus proches après l'horaire demandé
+    try:
+        start = datetime.fromisoformat(str(requested_datetime))
+        scheduler.invalidate(doctor_id)
+        return scheduler.next_free_slots(cur, [int(doctor_id)], start, start + timedelta(days=7), ALTERNATIVE_SLOTS, int(duration))
+    except Exception as e:
+        logger.exception("Erreur lors de la recherche de créneaux alternatifs")
+        return []
+
 @app.route('/appointments', methods=['POST'])
 @jwt_required()
 def create_appointment():
@@ -340,6 +542,12 @@ def create_appointment():
     doctor_id = data.get('doctor_id')
     appointment_datetime = data.get('appointment_datetime')
     reason = data.get('reason')
+    duration = data.get('duration')
+    if duration is None:
+        duration = settings_service.get_int('appointment_duration', 30)
+    # Entier strictement positif : une plage vide ou inversée échapperait à appointments_no_overlap
+    if not isinstance(duration, int) or isinstance(duration, bool) or duration <= 0:
+        return jsonify({"error": "duration doit être un nombre entier de minutes strictement positif"}), 400
 
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -360,16 +568,55 @@ def create_appointment():
         else:
             return jsonify({"error": "Non autorisé à créer ce rendez-vous"}), 403
 
+        # Plafond journalier par médecin (max_appointments_per_day, 0 = illimité) : le verrou
+        # (médecin, jour) sérialise uniquement les réservations concurrentes de cette journée
+        max_per_day = settings_service.get_int('max_appointments_per_day', 0)
+        if max_per_day > 0:
+            cur.execute(
+                "SELECT pg_advisory_xact_lock(%s, (%s::timestamp)::date - DATE '2000-01-01')",
+                (doctor_id, appointment_datetime)
+            )
+            cur.execute(
+                """
+                SELECT COUNT(*) AS count
+                FROM appointments
+                WHERE doctor_id = %s
+                  AND appointment_datetime >= date_trunc('day', %s::timestamp)
+                  AND appointment_datetime < date_trunc('day', %s::timestamp) + INTERVAL '1 day'
+                  AND status NOT IN ('cancelled', 'no_show')""",
+                (doctor_id, appointment_datetime, appointment_datetime)
+            )
+            if cur.fetchone()['count'] >= max_per_day:
+                conn.rollback()
+                return jsonify({"error": f"Le médecin a atteint le nombre maximum de rendez-vous pour cette journée ({max_per_day})"}), 409
+
+        # Le chevauchement est refusé par la contrainte d'exclusion appointments_no_overlap
         cur.execute(
             """
-            INSERT INTO appointments (patient_id, doctor_id, appointment_datetime, reason) 
-            VALUES (%s, %s, %s, %s) RETURNING id""",
-            (patient_id, doctor_id, appointment_datetime, reason)
+            INSERT INTO appointments (patient_id, doctor_id, appointment_datetime, reason, duration) 
+            VALUES (%s, %s, %s, %s, %s) RETURNING id""",
+            (patient_id, doctor_id, appointment_datetime, reason, duration)
         )
         appointment_id = cur.fetchone()['id']
+        refresh_roster_entry(cur, doctor_id, patient_id)
+        publish_event(cur, [patient_id, doctor_id], 'appointment_created', {
+            "id": appointment_id,
+            "patient_id": patient_id,
+            "doctor_id": doctor_id,
+            "appointment_datetime": appointment_datetime,
+            "reason": reason,
+            "status": "scheduled"
+        })
         conn.commit()
+        scheduler.invalidate(doctor_id)
 
         return jsonify({"message": "Rendez-vous créé", "appointment_id": appointment_id}), 201
+    except psycopg2.errors.ExclusionViolation:
+        conn.rollback()
+        return jsonify({
+            "error": "Ce créneau est déjà réservé",
+            "alternatives": suggest_alternative_slots(cur, doctor_id, appointment_datetime, duration)
+        }), 409
     except Exception as e:
         conn.rollback()
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
@@ -384,23 +631,18 @@ def get_appointments(user_id):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        print(f"\n🔍 GET /appointments/{user_id} - User {current_user_id} requesting appointments")
-        
         cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
         current_user_role = cur.fetchone()['role']
-        print(f"🔍 Current user role: {current_user_role}")
-        
+
         if current_user_role != 'admin' and current_user_id != user_id:
-            print("❌ Unauthorized access attempt")
+            logger.warning("Accès refusé aux rendez-vous", extra={"user_id": current_user_id, "target_user_id": user_id})
             return jsonify({"error": "Non autorisé à voir ces rendez-vous"}), 403
 
         # Déterminer si l'utilisateur est un médecin ou un patient
         cur.execute("SELECT role FROM users WHERE id = %s", (user_id,))
         user_role = cur.fetchone()['role']
-        print(f"🔍 Requested user role: {user_role}")
-        
+
         if user_role == 'doctor':
-            print("🔍 Fetching appointments for doctor")
             # Pour un médecin, retourner tous ses rendez-vous
             cur.execute(
                 """
@@ -426,7 +668,6 @@ def get_appointments(user_id):
                 (user_id,)
             )
         else:
-            print("🔍 Fetching appointments for patient")
             # Pour un patient, retourner ses rendez-vous
             cur.execute(
                 """
@@ -452,13 +693,9 @@ def get_appointments(user_id):
                 (user_id,)
             )
         appointments = cur.fetchall()
-        print(f"🔍 Found {len(appointments)} appointments:")
-        for apt in appointments:
-            print(f"  - RDV {apt['id']}: {apt['appointment_datetime']} - Dr. {apt['doctor_name']} - Patient: {apt['patient_name']}")
-        
         return jsonify(appointments), 200
     except Exception as e:
-        print(f"❌ Error in get_appointments: {str(e)}")
+        logger.exception("Erreur dans get_appointments")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -482,30 +719,11 @@ def get_doctor_patients(doctor_id):
             return jsonify({"error": "Non autorisé à voir les patients d'un autre médecin"}), 403
             
         # Récupérer les patients du médecin avec leurs informations médicales
-        cur.execute("""
-            SELECT DISTINCT 
-                u.id,
-                u.name,
-                u.email,
-                u.phone,
-                u.birthdate,
-                mr.medical_history,
-                mr.allergies,
-                COUNT(a.id) as total_appointments,
-                MAX(a.appointment_datetime) as last_appointment,
-                MIN(CASE WHEN a.appointment_datetime >= CURRENT_TIMESTAMP THEN a.appointment_datetime END) as next_appointment
-            FROM users u
-            JOIN appointments a ON u.id = a.patient_id
-            LEFT JOIN medical_records mr ON u.id = mr.patient_id
-            WHERE a.doctor_id = %s AND u.role = 'patient'
-            GROUP BY u.id, u.name, u.email, u.phone, u.birthdate, mr.medical_history, mr.allergies
-            ORDER BY u.name
-        """, (doctor_id,))
-        patients = cur.fetchall()
+        patients = get_roster(cur, doctor_id)
         return jsonify({"patients": patients}), 200
         
     except Exception as e:
-        print(f"❌ Error in get_doctor_patients: {str(e)}")
+        logger.exception("Erreur dans get_doctor_patients")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -571,12 +789,11 @@ def create_medical_record(patient_id):
         ))
         medical_record = cursor.fetchone()
         conn.commit()
-        print("✅ Dossier médical créé avec succès")
         return jsonify(medical_record), 201
 
     except Exception as e:
         conn.rollback()
-        print(f"❌ Error in create_medical_record: {str(e)}")
+        logger.exception("Erreur dans create_medical_record")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cursor.close()
@@ -623,16 +840,43 @@ def get_patient_consultations(patient_id):
         return jsonify({"consultations": consultations}), 200
 
     except Exception as e:
-        print(f"❌ Error in get_patient_consultations: {str(e)}")
+        logger.exception("Erreur dans get_patient_consultations")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
         release_db_connection(conn)
 
+# Champs proposés par ?fields= sur la liste des rendez-vous du médecin
+DOCTOR_APPOINTMENT_FIELDS = {
+    'id': 'a.id',
+    'patient_id': 'a.patient_id',
+    'doctor_id': 'a.doctor_id',
+    'appointment_datetime': 'a.appointment_datetime',
+    'reason': 'a.reason',
+    'status': 'a.status',
+    'duration': 'a.duration',
+    'is_urgent': 'a.is_urgent',
+    'notes': 'a.notes',
+    'created_at': 'a.created_at',
+    'updated_at': 'a.updated_at',
+    'patient_name': 'p.name',
+    'patient_phone': 'p.phone',
+    'patient_email': 'p.email',
+}
+DOCTOR_APPOINTMENT_DEFAULT_FIELDS = (
+    'id', 'patient_id', 'appointment_datetime', 'reason', 'status', 'duration',
+    'is_urgent', 'notes', 'patient_name', 'patient_phone', 'patient_email'
+)
+
 @app.route('/doctor/appointments', methods=['GET'])
 @jwt_required()
 def get_doctor_appointments():
     current_user_id = get_jwt_identity()
+    try:
+        fields = parse_fields(request.args.get('fields'), DOCTOR_APPOINTMENT_FIELDS, DOCTOR_APPOINTMENT_DEFAULT_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
@@ -643,22 +887,19 @@ def get_doctor_appointments():
             return jsonify({"error": "Non autorisé à voir les rendez-vous"}), 403
 
         # Récupérer les rendez-vous du médecin
-        cur.execute("""
-            SELECT 
-                a.*,
-                p.name as patient_name,
-                p.phone as patient_phone,
-                p.email as patient_email
+        cur.execute(f"""
+            SELECT
+                {select_list(fields, DOCTOR_APPOINTMENT_FIELDS)}
             FROM appointments a
             JOIN users p ON a.patient_id = p.id
             WHERE a.doctor_id = %s
             ORDER BY a.appointment_datetime DESC
         """, (current_user_id,))
         appointments = cur.fetchall()
-        return jsonify(appointments), 200
+        return json_list_response(appointments)
 
     except Exception as e:
-        print(f"❌ Error in get_doctor_appointments: {str(e)}")
+        logger.exception("Erreur dans get_doctor_appointments")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -676,16 +917,310 @@ def get_agenda(doctor_id):
         if current_user_role != 'admin' and current_user_role != 'doctor' and current_user_id != doctor_id:
             return jsonify({"error": "Non autorisé à consulter cet agenda"}), 403
 
+        # Créneaux matérialisés sur la période consultée uniquement (par défaut 7 jours)
+        try:
+            first_day = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else datetime.now().date()
+            last_day = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else first_day + timedelta(days=6)
+        except ValueError:
+            return jsonify({"error": "Format de date invalide (YYYY-MM-DD)"}), 400
+        if last_day < first_day or (last_day - first_day).days >= MAX_SCHEDULE_RANGE_DAYS:
+            return jsonify({"error": f"La période doit être comprise entre 1 et {MAX_SCHEDULE_RANGE_DAYS} jours"}), 400
+
+        duration = request.args.get('duration', 30, type=int)
+        if duration <= 0:
+            return jsonify({"error": "Durée invalide"}), 400
+        slots = scheduler.materialize(cur, doctor_id, first_day, last_day, duration)
+        return jsonify({"agenda": slots}), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+def can_manage_agenda(cur, current_user_id, doctor_id):
+    cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+    current_user_role = cur.fetchone()['role']
+    return current_user_role == 'admin' or (current_user_role == 'doctor' and current_user_id == doctor_id)
+
+@app.route('/agenda/<int:doctor_id>/templates', methods=['GET', 'POST'])
+@jwt_required()
+def manage_availability_templates(doctor_id):
+    current_user_id = get_jwt_identity()
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if not can_manage_agenda(cur, current_user_id, doctor_id):
+            return jsonify({"error": "Non autorisé à gérer cet agenda"}), 403
+
+        if request.method == 'GET':
+            cur.execute("""
+                SELECT id, weekday, start_time, end_time, valid_from, valid_until
+                FROM availability_templates
+                WHERE doctor_id = %s
+                ORDER BY weekday, start_time
+            """, (doctor_id,))
+            templates = cur.fetchall()
+            for template in templates:
+                template['start_time'] = template['start_time'].strftime('%H:%M')
+                template['end_time'] = template['end_time'].strftime('%H:%M')
+            return jsonify({"templates": templates}), 200
+
+        # Plusieurs plages hebdomadaires en une seule insertion :
+        # {"templates": [{"weekday": 0, "start_time": "09:00", "end_time": "12:00", "valid_from": ..., "valid_until": ...}]}
+        data = request.get_json()
+        templates = data.get('templates') or []
+        rows = []
+        for template in templates:
+            try:
+                weekday = int(template['weekday'])
+                start_time = datetime.strptime(template['start_time'], '%H:%M').time()
+                end_time = datetime.strptime(template['end_time'], '%H:%M').time()
+            except (KeyError, TypeError, ValueError):
+                return jsonify({"error": "Chaque plage requiert weekday (0-6), start_time et end_time (HH:MM)"}), 400
+            if not 0 <= weekday <= 6 or start_time >= end_time:
+                return jsonify({"error": "Plage horaire invalide"}), 400
+            rows.append((doctor_id, weekday, start_time, end_time, template.get('valid_from'), template.get('valid_until')))
+        if not rows:
+            return jsonify({"error": "Aucune plage fournie"}), 400
+
+        ids = execute_values(cur, """
+            INSERT INTO availability_templates (doctor_id, weekday, start_time, end_time, valid_from, valid_until)
+            VALUES %s
+            RETURNING id
+        """, rows, fetch=True)
+        conn.commit()
+        scheduler.invalidate(doctor_id)
+        return jsonify({"message": f"{len(ids)} plage(s) ajoutée(s)", "template_ids": [row['id'] for row in ids]}), 201
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/agenda/<int:doctor_id>/templates/<int:template_id>', methods=['DELETE'])
+@jwt_required()
+def delete_availability_template(doctor_id, template_id):
+    current_user_id = get_jwt_identity()
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if not can_manage_agenda(cur, current_user_id, doctor_id):
+            return jsonify({"error": "Non autorisé à gérer cet agenda"}), 403
+
+        cur.execute("DELETE FROM availability_templates WHERE id = %s AND doctor_id = %s", (template_id, doctor_id))
+        if cur.rowcount == 0:
+            return jsonify({"error": "Plage non trouvée"}), 404
+        conn.commit()
+        scheduler.invalidate(doctor_id)
+        return jsonify({"message": "Plage supprimée"}), 200
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/agenda/<int:doctor_id>/exceptions', methods=['GET', 'POST'])
+@jwt_required()
+def manage_availability_exceptions(doctor_id):
+    current_user_id = get_jwt_identity()
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if not can_manage_agenda(cur, current_user_id, doctor_id):
+            return jsonify({"error": "Non autorisé à gérer cet agenda"}), 403
+
+        if request.method == 'GET':
+            cur.execute("""
+                SELECT id, start_datetime, end_datetime, reason
+                FROM availability_exceptions
+                WHERE doctor_id = %s AND end_datetime >= CURRENT_TIMESTAMP
+                ORDER BY start_datetime
+            """, (doctor_id,))
+            return jsonify({"exceptions": cur.fetchall()}), 200
+
+        # Congés ou fermeture ponctuelle : {"start_datetime": ..., "end_datetime": ..., "reason": ...}
+        data = request.get_json()
+        try:
+            start = datetime.fromisoformat(data.get('start_datetime'))
+            end = datetime.fromisoformat(data.get('end_datetime'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "start_datetime et end_datetime requis (format ISO)"}), 400
+        if start >= end:
+            return jsonify({"error": "La date de fin doit suivre la date de début"}), 400
+
+        cur.execute("""
+            INSERT INTO availability_exceptions (doctor_id, start_datetime, end_datetime, reason)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        """, (doctor_id, start, end, data.get('reason')))
+        exception_id = cur.fetchone()['id']
+        conn.commit()
+        scheduler.invalidate(doctor_id)
+        return jsonify({"message": "Indisponibilité ajoutée", "exception_id": exception_id}), 201
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/agenda/<int:doctor_id>/exceptions/<int:exception_id>', methods=['DELETE'])
+@jwt_required()
+def delete_availability_exception(doctor_id, exception_id):
+    current_user_id = get_jwt_identity()
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if not can_manage_agenda(cur, current_user_id, doctor_id):
+            return jsonify({"error": "Non autorisé à gérer cet agenda"}), 403
+
+        cur.execute("DELETE FROM availability_exceptions WHERE id = %s AND doctor_id = %s", (exception_id, doctor_id))
+        if cur.rowcount == 0:
+            return jsonify({"error": "Indisponibilité non trouvée"}), 404
+        conn.commit()
+        scheduler.invalidate(doctor_id)
+        return jsonify({"message": "Indisponibilité supprimée"}), 200
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/doctors/<int:doctor_id>/schedule/<date_str>', methods=['GET'])
+@jwt_required()
+def get_doctor_schedule(doctor_id, date_str):
+    try:
+        day = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Format de date invalide (YYYY-MM-DD)"}), 400
+    duration = request.args.get('duration', 30, type=int)
+    if duration <= 0:
+        return jsonify({"error": "Durée invalide"}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        slots = scheduler.day_schedule(cur, doctor_id, day, duration)
+        return jsonify({
+            "doctor_id": doctor_id,
+            "date": day.isoformat(),
+            "availableSlots": slots
+        }), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/schedule/free-slots', methods=['GET'])
+@jwt_required()
+def search_free_slots():
+    # ?doctor_ids=1,2 ou ?speciality=Cardiologie, période from/to, limit, duration
+    try:
+        doctor_ids = [int(i) for i in request.args.get('doctor_ids', '').split(',') if i.strip()]
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else datetime.now()
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=7)
+    except ValueError as e:
+        return jsonify({"error": f"Paramètre invalide: {str(e)}"}), 400
+    speciality = request.args.get('speciality')
+    limit = min(request.args.get('limit', 10, type=int), FREE_SLOTS_MAX_LIMIT)
+    duration = request.args.get('duration', 30, type=int)
+    if duration <= 0 or start >= end:
+        return jsonify({"error": "Période ou durée invalide"}), 400
+    if limit <= 0:
+        return jsonify({"error": "limit doit être un entier strictement positif"}), 400
+    if end - start > timedelta(days=MAX_SCHEDULE_RANGE_DAYS):
+        return jsonify({"error": f"La période ne peut pas dépasser {MAX_SCHEDULE_RANGE_DAYS} jours"}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        # Médecins actifs correspondant aux critères
         cur.execute(
             """
-            SELECT slot_date, duration, status
-            FROM availability_slots
-            WHERE doctor_id = %s
-            ORDER BY slot_date""",
-            (doctor_id,)
+            SELECT id, name, speciality
+            FROM users
+            WHERE role = 'doctor' AND is_active = TRUE
+              AND (%s::int[] = '{}' OR id = ANY(%s::int[]))
+              AND (%s::text IS NULL OR speciality ILIKE %s)""",
+            (doctor_ids, doctor_ids, speciality, speciality)
         )
-        slots = cur.fetchall()
-        return jsonify({"agenda": slots}), 200
+        doctors = {row['id']: row for row in cur.fetchall()}
+        if not doctors:
+            return jsonify({"slots": []}), 200
+
+        slots = scheduler.next_free_slots(cur, sorted(doctors), start, end, limit, duration)
+        for slot in slots:
+            slot['doctor_name'] = doctors[slot['doctor_id']]['name']
+            slot['speciality'] = doctors[slot['doctor_id']]['speciality']
+        return jsonify({"slots": slots}), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/agenda/range', methods=['GET'])
+@jwt_required()
+def get_agenda_range():
+    # Vue semaine multi-médecins : ?doctor_ids=1,2,3&from=YYYY-MM-DD&to=YYYY-MM-DD
+    current_user_id = get_jwt_identity()
+    try:
+        doctor_ids = sorted({int(i) for i in request.args.get('doctor_ids', '').split(',') if i.strip()})
+        first_day = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else datetime.now().date()
+        last_day = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else first_day + timedelta(days=6)
+    except ValueError:
+        return jsonify({"error": "Paramètres invalides (doctor_ids=1,2 ; dates YYYY-MM-DD)"}), 400
+    days = (last_day - first_day).days + 1
+    if not doctor_ids or len(doctor_ids) > MAX_AGENDA_DOCTORS:
+        return jsonify({"error": f"Entre 1 et {MAX_AGENDA_DOCTORS} médecins requis"}), 400
+    if days < 1 or days > MAX_SCHEDULE_RANGE_DAYS:
+        return jsonify({"error": f"La période doit être comprise entre 1 et {MAX_SCHEDULE_RANGE_DAYS} jours"}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+        current_user_role = cur.fetchone()['role']
+        if current_user_role not in ('admin', 'assistant') and doctor_ids != [current_user_id]:
+            return jsonify({"error": "Non autorisé à consulter ces agendas"}), 403
+
+        start = datetime.combine(first_day, datetime.min.time())
+        end = start + timedelta(days=days)
+        # Une seule requête pour tous les médecins de la période
+        cur.execute(
+            """
+            SELECT
+                a.id,
+                a.doctor_id,
+                a.patient_id,
+                a.appointment_datetime,
+                a.duration,
+                a.status,
+                a.reason,
+                p.name AS patient_name
+            FROM appointments a
+            JOIN users p ON a.patient_id = p.id
+            WHERE a.doctor_id = ANY(%s)
+              AND a.appointment_datetime < %s
+              AND a.appointment_datetime + a.duration * INTERVAL '1 minute' > %s
+            ORDER BY a.appointment_datetime""",
+            (doctor_ids, end, start)
+        )
+        appointments = cur.fetchall()
+        occupancy = occupancy_bitmaps(doctor_ids, appointments, start, days)
+
+        return jsonify({
+            "from": first_day.isoformat(),
+            "to": last_day.isoformat(),
+            "resolution_minutes": OCCUPANCY_RESOLUTION,
+            "slots_per_day": 24 * 60 // OCCUPANCY_RESOLUTION,
+            "appointments": appointments,
+            "occupancy": {str(doctor_id): value for doctor_id, value in occupancy.items()}
+        }), 200
     except Exception as e:
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
@@ -718,6 +1253,7 @@ def add_availability_slot():
         )
         slot_id = cur.fetchone()['id']
         conn.commit()
+        scheduler.invalidate(doctor_id)
         return jsonify({"message": "Créneau ajouté", "slot_id": slot_id}), 201
     except Exception as e:
         conn.rollback()
@@ -834,23 +1370,34 @@ def get_medical_assistance(patient_id):
 @jwt_required()
 def send_message():
     current_user_id = get_jwt_identity()
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     receiver_id = data.get('receiver_id')
     content = data.get('content')
 
     if not all([receiver_id, content]):
         return jsonify({"error": "Destinataire et contenu requis"}), 400
+    try:
+        receiver_id = int(receiver_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "receiver_id doit être un entier"}), 400
+    if receiver_id == current_user_id:
+        return jsonify({"error": "Impossible de s'envoyer un message à soi-même"}), 400
 
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cur.execute(
-            "INSERT INTO messages (sender_id, receiver_id, content) VALUES (%s, %s, %s) RETURNING id",
-            (current_user_id, receiver_id, content)
-        )
-        message_id = cur.fetchone()['id']
+        conversation_id, message = record_message(cur, current_user_id, receiver_id, content)
+        message_id = message['id']
+        publish_event(cur, [current_user_id, receiver_id], 'message', {
+            "id": message_id,
+            "conversation_id": conversation_id,
+            "sender_id": current_user_id,
+            "receiver_id": receiver_id,
+            "content": content,
+            "sent_at": message['sent_at']
+        })
         conn.commit()
-        return jsonify({"message": "Message envoyé", "message_id": message_id}), 201
+        return jsonify({"message": "Message envoyé", "message_id": message_id, "conversation_id": conversation_id}), 201
     except Exception as e:
         conn.rollback()
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
@@ -880,106 +1427,363 @@ def get_health_metrics(user_id):
             (user_id,)
         )
         metrics = cur.fetchall()
-        return jsonify(metrics), 200
+        return json_list_response(metrics)
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+def parse_metrics_range():
+    # Paramètres communs aux routes d'agrégation : metric_type, from, to
+    metric_type = request.args.get('metric_type')
+    if not metric_type:
+        raise ValueError("Le paramètre metric_type est requis")
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else datetime.min
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.max
+    except ValueError as e:
+        raise ValueError(f"Format de date invalide: {str(e)}")
+    if start >= end:
+        raise ValueError("La date de début doit précéder la date de fin")
+    return metric_type, start, end
+
+@app.route('/health-metrics/<int:user_id>/aggregate', methods=['GET'])
+@jwt_required()
+def aggregate_health_metrics(user_id):
+    current_user_id = get_jwt_identity()
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"Intervalle invalide: {bucket}. Valeurs autorisées: {', '.join(BUCKETS)}"}), 400
+    try:
+        metric_type, start, end = parse_metrics_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+        current_user_role = cur.fetchone()['role']
+
+        if current_user_role != 'admin' and current_user_id != user_id:
+            return jsonify({"error": "Non autorisé à voir ces données de santé"}), 403
+
+        buckets = aggregate_metrics(cur, user_id, metric_type, start, end, bucket)
+        return jsonify({"metric_type": metric_type, "bucket": bucket, "buckets": buckets}), 200
     except Exception as e:
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
         release_db_connection(conn)
 
+@app.route('/health-metrics/<int:user_id>/downsample', methods=['GET'])
+@jwt_required()
+def downsample_health_metrics(user_id):
+    current_user_id = get_jwt_identity()
+    points = request.args.get('points', 500, type=int)
+    if points < 3:
+        return jsonify({"error": "Le paramètre points doit être supérieur ou égal à 3"}), 400
+    try:
+        metric_type, start, end = parse_metrics_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+        current_user_role = cur.fetchone()['role']
+
+        if current_user_role != 'admin' and current_user_id != user_id:
+            return jsonify({"error": "Non autorisé à voir ces données de santé"}), 403
+
+        series, total = downsample_metrics(conn, user_id, metric_type, start, end, points)
+        conn.commit()
+        return jsonify({
+            "metric_type": metric_type,
+            "total_points": total,
+            "points": series
+        }), 200
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
 @app.route('/health-metrics', methods=['POST'])
 @jwt_required()
 def add_health_metric():
     current_user_id = get_jwt_identity()
     data = request.get_json()
-    print(f"\n🔍 POST /health-metrics - Données reçues: {data}")
-    
+
     user_id = data.get('user_id')
     metric_type = data.get('metric_type')
     value = data.get('value')
     recorded_at_str = data.get('recorded_at')
     notes = data.get('notes')
 
-    print(f"🔍 Données extraites: user_id={user_id}, metric_type={metric_type}, value={value}, recorded_at={recorded_at_str}, notes={notes}")
-
     if not all([user_id, metric_type, value]):
-        print("❌ Données manquantes")
         return jsonify({"error": "Données manquantes"}), 400
 
     # Convertir la chaîne en timestamp
     try:
         from datetime import datetime
         recorded_at = datetime.strptime(recorded_at_str, '%Y-%m-%d %H:%M')
-        print(f"🔍 Timestamp converti: {recorded_at}")
     except ValueError as e:
-        print(f"❌ Erreur de conversion de la date: {str(e)}")
         return jsonify({"error": f"Format de date invalide: {str(e)}"}), 400
 
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
-        current_user_role = cur.fetchone()['role']
-        print(f"🔍 Rôle de l'utilisateur: {current_user_role}")
-
-        if current_user_role != 'admin' and current_user_id != user_id:
-            print("❌ Accès non autorisé")
-            return jsonify({"error": "Non autorisé à ajouter cette donnée"}), 403
-
-        print("🔍 Tentative d'insertion dans la base de données...")
-        cur.execute(
-            """
-            INSERT INTO health_metrics (user_id, metric_type, value, recorded_at, notes) 
-            VALUES (%s, %s, %s, %s, %s) 
-            RETURNING id""",
-            (user_id, metric_type, value, recorded_at, notes)
-        )
-        metric_id = cur.fetchone()['id']
+        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+        current_user_role = cur.fetchone()['role']
+
+        if current_user_role != 'admin' and current_user_id != user_id:
+            logger.warning("Accès refusé à l'ajout de métrique", extra={"user_id": current_user_id, "target_user_id": user_id})
+            return jsonify({"error": "Non autorisé à ajouter cette donnée"}), 403
+
+        cur.execute(
+            """
+            INSERT INTO health_metrics (user_id, metric_type, value, recorded_at, notes) 
+            VALUES (%s, %s, %s, %s, %s) 
+            RETURNING id""",
+            (user_id, metric_type, value, recorded_at, notes)
+        )
+        metric_id = cur.fetchone()['id']
+        conn.commit()
+        return jsonify({"message": "Donnée de santé ajoutée", "metric_id": metric_id}), 201
+    except Exception as e:
+        conn.rollback()
+        logger.exception("Erreur lors de l'ajout de la métrique")
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/health-metrics/<int:metric_id>', methods=['DELETE'])
+@jwt_required()
+def delete_health_metric(metric_id):
+    current_user_id = get_jwt_identity()
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    try:
+        # Vérifier que la métrique appartient bien à l'utilisateur
+        cur.execute(
+            "SELECT user_id FROM health_metrics WHERE id = %s",
+            (metric_id,)
+        )
+        metric = cur.fetchone()
+        
+        if not metric:
+            return jsonify({"error": "Métrique non trouvée"}), 404
+            
+        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+        current_user_role = cur.fetchone()['role']
+        
+        # Vérifier les autorisations
+        if current_user_role != 'admin' and current_user_id != metric['user_id']:
+            return jsonify({"error": "Non autorisé à supprimer cette métrique"}), 403
+        
+        # Supprimer la métrique
+        cur.execute("DELETE FROM health_metrics WHERE id = %s", (metric_id,))
+        conn.commit()
+        
+        return jsonify({"message": "Métrique supprimée avec succès"}), 200
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/messages/<int:user_id>', methods=['GET'])
+@jwt_required()
+def get_messages(user_id):
+    current_user_id = get_jwt_identity()
+    if current_user_id != user_id:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+            current_user_role = cur.fetchone()['role']
+            if current_user_role != 'admin':
+                return jsonify({"error": "Non autorisé à voir ces messages"}), 403
+        finally:
+            cur.close()
+            release_db_connection(conn)
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute(
+            """
+            SELECT m.id, m.content, m.sent_at, u1.name as sender_name, u2.name as receiver_name
+            FROM messages m
+            JOIN users u1 ON m.sender_id = u1.id
+            JOIN users u2 ON m.receiver_id = u2.id
+            WHERE m.sender_id = %s OR m.receiver_id = %s
+            ORDER BY m.sent_at""",
+            (user_id, user_id)
+        )
+        messages = cur.fetchall()
+        return jsonify({"messages": messages}), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/messages/<int:user_id>/conversations', methods=['GET'])
+@jwt_required()
+def get_conversations(user_id):
+    current_user_id = get_jwt_identity()
+    limit = request.args.get('limit', 50, type=int)
+    before = request.args.get('before')
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if current_user_id != user_id:
+            cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+            current_user_role = cur.fetchone()['role']
+            if current_user_role != 'admin':
+                return jsonify({"error": "Non autorisé à voir ces messages"}), 403
+
+        conversations = list_conversations(cur, user_id, limit, before)
+        return jsonify({"conversations": conversations}), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/conversations/<int:conversation_id>/messages', methods=['GET'])
+@jwt_required()
+def get_thread_messages(conversation_id):
+    current_user_id = get_jwt_identity()
+    since = request.args.get('since', type=int)
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', 50, type=int)
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if not get_membership(cur, conversation_id, current_user_id):
+            cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+            current_user_role = cur.fetchone()['role']
+            if current_user_role != 'admin':
+                return jsonify({"error": "Non autorisé à voir cette conversation"}), 403
+
+        messages = get_conversation_messages(cur, conversation_id, since, before, limit)
+        return jsonify({
+            "conversation_id": conversation_id,
+            "messages": messages,
+            # Curseurs pour la synchronisation incrémentale et l'historique
+            "next_since": messages[-1]['id'] if messages else since,
+            "next_before": messages[0]['id'] if messages else None
+        }), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/conversations/<int:conversation_id>/read', methods=['POST'])
+@jwt_required()
+def read_conversation(conversation_id):
+    current_user_id = get_jwt_identity()
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if not mark_conversation_read(cur, conversation_id, current_user_id):
+            return jsonify({"error": "Conversation non trouvée"}), 404
+        conn.commit()
+        return jsonify({"message": "Conversation marquée comme lue"}), 200
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/notifications/<int:user_id>', methods=['GET'])
+@jwt_required()
+def get_notifications(user_id):
+    current_user_id = get_jwt_identity()
+    if current_user_id != user_id:
+        return jsonify({"error": "Non autorisé à voir ces notifications"}), 403
+
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    before = request.args.get('before')
+    unread_only = request.args.get('unread') == 'true'
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        notifications = list_notifications(cur, user_id, limit, before, unread_only)
+        unread_count = get_unread_count(cur, user_id)
+        # Le compteur a pu être recréé par get_unread_count
+        conn.commit()
+        return jsonify({
+            "notifications": notifications,
+            "unread_count": unread_count
+        }), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/notifications/<int:user_id>/unread-count', methods=['GET'])
+@jwt_required()
+def get_notifications_unread_count(user_id):
+    current_user_id = get_jwt_identity()
+    if current_user_id != user_id:
+        return jsonify({"error": "Non autorisé à voir ces notifications"}), 403
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        unread_count = get_unread_count(cur, user_id)
+        # Le compteur a pu être recréé par get_unread_count
         conn.commit()
-        print(f"✅ Métrique ajoutée avec succès, id={metric_id}")
-        return jsonify({"message": "Donnée de santé ajoutée", "metric_id": metric_id}), 201
+        return jsonify({"unread_count": unread_count}), 200
     except Exception as e:
-        conn.rollback()
-        print(f"❌ Erreur lors de l'ajout de la métrique: {str(e)}")
-        print(f"❌ Type d'erreur: {type(e)}")
-        import traceback
-        print(f"❌ Traceback complet:\n{traceback.format_exc()}")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
         release_db_connection(conn)
 
-@app.route('/health-metrics/<int:metric_id>', methods=['DELETE'])
+@app.route('/notifications/<int:user_id>/read', methods=['POST'])
 @jwt_required()
-def delete_health_metric(metric_id):
+def read_notifications(user_id):
     current_user_id = get_jwt_identity()
+    if current_user_id != user_id:
+        return jsonify({"error": "Non autorisé à modifier ces notifications"}), 403
+
+    # {"ids": [...]} et/ou {"before": "..."} ; corps vide -> tout marquer comme lu
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    before = data.get('before')
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({"error": "Le champ ids doit être une liste d'identifiants"}), 400
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    
     try:
-        # Vérifier que la métrique appartient bien à l'utilisateur
-        cur.execute(
-            "SELECT user_id FROM health_metrics WHERE id = %s",
-            (metric_id,)
-        )
-        metric = cur.fetchone()
-        
-        if not metric:
-            return jsonify({"error": "Métrique non trouvée"}), 404
-            
-        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
-        current_user_role = cur.fetchone()['role']
-        
-        # Vérifier les autorisations
-        if current_user_role != 'admin' and current_user_id != metric['user_id']:
-            return jsonify({"error": "Non autorisé à supprimer cette métrique"}), 403
-        
-        # Supprimer la métrique
-        cur.execute("DELETE FROM health_metrics WHERE id = %s", (metric_id,))
+        marked, unread_count = mark_notifications_read(cur, user_id, ids, before)
+        if marked:
+            publish_event(cur, [user_id], 'notifications_read', {"unread_count": unread_count})
         conn.commit()
-        
-        return jsonify({"message": "Métrique supprimée avec succès"}), 200
-        
+        return jsonify({
+            "message": f"{marked} notification(s) marquée(s) comme lue(s)",
+            "marked": marked,
+            "unread_count": unread_count
+        }), 200
     except Exception as e:
         conn.rollback()
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
@@ -987,37 +1791,156 @@ def delete_health_metric(metric_id):
         cur.close()
         release_db_connection(conn)
 
-@app.route('/messages/<int:user_id>', methods=['GET'])
-@jwt_required()
-def get_messages(user_id):
+# EventSource ne peut pas envoyer d'en-tête : jeton accepté en ?jwt= sur cette route seulement
+@app.route('/events/<int:user_id>', methods=['GET'])
+@jwt_required(locations=["headers", "query_string"])
+def stream_events(user_id):
     current_user_id = get_jwt_identity()
     if current_user_id != user_id:
+        return jsonify({"error": "Non autorisé à suivre ces événements"}), 403
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID invalide"}), 400
+
+    # Abonnement avant la relecture pour ne rien perdre entre les deux
+    subscriber = event_broker.subscribe(user_id)
+    missed = []
+    truncated = False
+    if last_event_id is not None:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         try:
-            cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
-            current_user_role = cur.fetchone()['role']
-            if current_user_role != 'admin':
-                return jsonify({"error": "Non autorisé à voir ces messages"}), 403
+            missed, truncated = fetch_missed_events(cur, user_id, last_event_id)
+        except Exception as e:
+            event_broker.unsubscribe(user_id, subscriber)
+            return jsonify({"error": f"Erreur : {str(e)}"}), 500
         finally:
             cur.close()
             release_db_connection(conn)
 
+    def generate():
+        seen = SeenEvents()
+        try:
+            yield "retry: 3000\n\n"
+            if truncated:
+                # Trop d'événements manqués : le client recharge son état plutôt que de tout rejouer
+                yield format_resync()
+            else:
+                for event in missed:
+                    seen.add(event['id'])
+                    yield format_sse(event)
+            while True:
+                try:
+                    event = subscriber.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if seen.add(event['id']):
+                    yield format_sse(event)
+        finally:
+            event_broker.unsubscribe(user_id, subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route('/sync/<int:user_id>', methods=['POST'])
+@jwt_required()
+def sync_user_data(user_id):
+    # {"tokens": {"appointments": "<jeton>", ...}, "entities": [...], "limit": 500}
+    # Renvoie, par entité, les lignes créées ou modifiées et les identifiants supprimés
+    # depuis le jeton, ainsi que le nouveau jeton à présenter au prochain appel
+    current_user_id = get_jwt_identity()
+    if current_user_id != user_id:
+        return jsonify({"error": "Non autorisé à synchroniser ces données"}), 403
+
+    data = request.get_json(silent=True) or {}
+    tokens = data.get('tokens') or {}
+    entities = data.get('entities') or list(SYNC_ENTITIES)
+    if not isinstance(tokens, dict) or not isinstance(entities, list):
+        return jsonify({"error": "Format de requête invalide"}), 400
+    unknown = [entity for entity in entities if entity not in SYNC_ENTITIES]
+    if unknown:
+        return jsonify({"error": f"Entités inconnues: {', '.join(map(str, unknown))}. Valeurs autorisées: {', '.join(SYNC_ENTITIES)}"}), 400
+    try:
+        limit = min(max(int(data.get('limit', SYNC_DEFAULT_LIMIT)), 1), SYNC_MAX_LIMIT)
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit doit être un entier"}), 400
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cur.execute(
-            """
-            SELECT m.id, m.content, m.sent_at, u1.name as sender_name, u2.name as receiver_name
-            FROM messages m
-            JOIN users u1 ON m.sender_id = u1.id
-            JOIN users u2 ON m.receiver_id = u2.id
-            WHERE m.sender_id = %s OR m.receiver_id = %s
-            ORDER BY m.sent_at""",
-            (user_id, user_id)
-        )
-        messages = cur.fetchall()
-        return jsonify({"messages": messages}), 200
+        # Toutes les entités lues dans le même instantané
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        changes = sync_changes(cur, user_id, tokens, entities, limit)
+        return jsonify(changes), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+    finally:
+        conn.rollback()
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/admin/security/password-hashing', methods=['GET'])
+@jwt_required()
+def get_password_hashing_stats():
+    # Charge du pool de hachage de ce processus : file d'attente, temps d'attente, refus
+    if get_cached_role(get_jwt_identity()) != 'admin':
+        return jsonify({"error": "Accès non autorisé"}), 403
+    stats = password_hasher.stats()
+    stats["rounds"] = bcrypt_rounds()
+    return jsonify(stats), 200
+
+@app.route('/admin/security/lockouts', methods=['GET'])
+@jwt_required()
+def get_login_lockouts():
+    # Comptes et adresses actuellement bloqués, avec le délai restant (secondes)
+    if get_cached_role(get_jwt_identity()) != 'admin':
+        return jsonify({"error": "Accès non autorisé"}), 403
+    try:
+        lockouts = sorted(login_throttle.lockouts(), key=lambda lockout: -lockout['retry_after'])
+        return jsonify({"lockouts": lockouts, "shared": settings_service.get_bool('login_throttle_shared')}), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+
+@app.route('/admin/security/lockouts/<path:key>', methods=['DELETE'])
+@jwt_required()
+def delete_login_lockout(key):
+    # Débloque un compte ("account:<email>") ou une adresse ("ip:<adresse>")
+    if get_cached_role(get_jwt_identity()) != 'admin':
+        return jsonify({"error": "Accès non autorisé"}), 403
+    if not key.startswith(('account:', 'ip:')):
+        return jsonify({"error": "Clé invalide"}), 400
+    try:
+        login_throttle.unlock(key)
+        return jsonify({"message": "Blocage levé"}), 200
+    except Exception as e:
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
+
+@app.route('/admin/jobs', methods=['GET'])
+@jwt_required()
+def get_job_queues():
+    # État des files de tâches d'arrière-plan et dernières tâches en échec
+    if get_cached_role(get_jwt_identity()) != 'admin':
+        return jsonify({"error": "Accès non autorisé"}), 403
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        queues = queue_stats(cur)
+        cur.execute("""
+            SELECT id, queue, task, attempts, last_error, finished_at
+            FROM jobs
+            WHERE status = 'failed'
+            ORDER BY finished_at DESC
+            LIMIT 20
+        """)
+        return jsonify({"queues": queues, "failed": cur.fetchall()}), 200
     except Exception as e:
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
@@ -1038,36 +1961,8 @@ def get_admin_stats():
         if not user or user['role'] != 'admin':
             return jsonify({"error": "Accès non autorisé"}), 403
 
-        # Récupérer les statistiques
-        stats = {}
-        
-        # Total utilisateurs par rôle
-        cur.execute("""
-            SELECT role, COUNT(*) as count 
-            FROM users 
-            GROUP BY role
-        """)
-        role_counts = cur.fetchall()
-        stats['totalUsers'] = sum(r['count'] for r in role_counts)
-        stats['totalDoctors'] = next((r['count'] for r in role_counts if r['role'] == 'doctor'), 0)
-        stats['totalPatients'] = next((r['count'] for r in role_counts if r['role'] == 'patient'), 0)
-        stats['totalAssistants'] = next((r['count'] for r in role_counts if r['role'] == 'assistant'), 0)
-        
-        # Rendez-vous
-        cur.execute("SELECT COUNT(*) as count FROM appointments")
-        stats['totalAppointments'] = cur.fetchone()['count']
-        
-        # Rendez-vous aujourd'hui
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM appointments 
-            WHERE DATE(appointment_datetime) = CURRENT_DATE
-        """)
-        stats['todayAppointments'] = cur.fetchone()['count']
-        
-        # Utilisateurs actifs
-        cur.execute("SELECT COUNT(*) as count FROM users WHERE is_active = true")
-        stats['activeUsers'] = cur.fetchone()['count']
+        # Récupérer les statistiques (cache partagé avec le tableau de bord assistant)
+        stats = stats_service.get()
         
         # État du système (simplifié pour l'exemple)
         stats['systemStatus'] = 'healthy'
@@ -1094,23 +1989,12 @@ def get_assistant_stats():
             return jsonify({"error": "Accès non autorisé"}), 403
 
         # Récupérer les statistiques
-        stats = {}
-        
-        # Rendez-vous aujourd'hui
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM appointments 
-            WHERE DATE(appointment_datetime) = CURRENT_DATE
-        """)
-        stats['todayAppointments'] = cur.fetchone()['count']
-        
-        # Total rendez-vous
-        cur.execute("SELECT COUNT(*) as count FROM appointments")
-        stats['totalAppointments'] = cur.fetchone()['count']
-        
-        # Total patients
-        cur.execute("SELECT COUNT(*) as count FROM users WHERE role = 'patient'")
-        stats['totalPatients'] = cur.fetchone()['count']
+        all_stats = stats_service.get()
+        stats = {
+            'todayAppointments': all_stats['todayAppointments'],
+            'totalAppointments': all_stats['totalAppointments'],
+            'totalPatients': all_stats['totalPatients']
+        }
         
         # Tâches en attente (simplifié pour l'exemple)
         stats['pendingTasks'] = 0
@@ -1162,7 +2046,7 @@ def manage_users():
 
             # Générer un mot de passe temporaire
             temp_password = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-            hashed_password = hash_password(temp_password)
+            hashed_password = password_hasher.hash(temp_password, bcrypt_rounds())
 
             # Insérer le nouvel utilisateur
             cur.execute("""
@@ -1184,16 +2068,27 @@ def manage_users():
                 data.get('is_active', True)
             ))
             new_user_id = cur.fetchone()['id']
+
+            # Le mot de passe temporaire est envoyé par e-mail (validé avec la création du compte)
+            queue_email(
+                cur,
+                [data['email']],
+                "Votre compte de télémédecine",
+                f"Bonjour {data['name']},\n\n"
+                f"Un compte a été créé pour vous. Votre mot de passe temporaire est : {temp_password}\n"
+                "Veuillez le modifier lors de votre première connexion."
+            )
             conn.commit()
+            reference_cache.bump('users')
 
-            # TODO: Envoyer un email avec le mot de passe temporaire
-            # Pour l'instant, on le retourne dans la réponse
             return jsonify({
-                "message": "Utilisateur créé avec succès",
-                "user_id": new_user_id,
-                "temp_password": temp_password
+                "message": "Utilisateur créé avec succès, mot de passe temporaire envoyé par e-mail",
+                "user_id": new_user_id
             }), 201
 
+    except HasherBusy as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
         conn.rollback()
         return jsonify({"error": str(e)}), 500
@@ -1241,6 +2136,7 @@ def manage_user(user_id):
                     WHERE id = %s
                 """, update_values)
                 conn.commit()
+                reference_cache.bump('users')
                 return jsonify({"message": "Utilisateur modifié avec succès"})
 
         elif request.method == 'DELETE':
@@ -1249,6 +2145,7 @@ def manage_user(user_id):
             if cur.rowcount == 0:
                 return jsonify({"error": "Utilisateur non trouvé"}), 404
             conn.commit()
+            reference_cache.bump('users')
             return jsonify({"message": "Utilisateur supprimé avec succès"})
 
     except Exception as e:
@@ -1263,6 +2160,15 @@ def manage_user(user_id):
 @jwt_required()
 def manage_system_settings():
     current_user_id = get_jwt_identity()
+    if request.method == 'GET':
+        # Rôle et paramètres servis depuis le cache versionné ; 304 sans accès à la base
+        try:
+            if get_cached_role(current_user_id) != 'admin':
+                return jsonify({"error": "Accès non autorisé"}), 403
+            return cached_json_response(reference_cache.get('system_settings', ('system_settings',), load_settings_snapshot))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
@@ -1272,30 +2178,7 @@ def manage_system_settings():
         if not user or user['role'] != 'admin':
             return jsonify({"error": "Accès non autorisé"}), 403
 
-        if request.method == 'GET':
-            # Récupérer les paramètres système
-            cur.execute("""
-                SELECT setting_key, setting_value, setting_type, description
-                FROM system_settings
-                ORDER BY setting_key
-            """)
-            settings = cur.fetchall()
-            
-            # Convertir les valeurs selon leur type
-            formatted_settings = {}
-            for setting in settings:
-                value = setting['setting_value']
-                if setting['setting_type'] == 'boolean':
-                    value = value.lower() == 'true'
-                elif setting['setting_type'] == 'integer':
-                    value = int(value)
-                elif setting['setting_type'] == 'float':
-                    value = float(value)
-                formatted_settings[setting['setting_key']] = value
-            
-            return jsonify(formatted_settings)
-
-        elif request.method == 'PUT':
+        if request.method == 'PUT':
             # Mettre à jour les paramètres système
             data = request.get_json()
             
@@ -1339,6 +2222,8 @@ def manage_system_settings():
                 """, (str(value), key))
             
             conn.commit()
+            reference_cache.bump('system_settings')
+            settings_service.invalidate()
             return jsonify({"message": "Paramètres mis à jour avec succès"})
 
     except Exception as e:
@@ -1348,6 +2233,16 @@ def manage_system_settings():
         cur.close()
         release_db_connection(conn)
 
+def load_settings_snapshot():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        return load_system_settings(cur)
+    finally:
+        conn.rollback()
+        cur.close()
+        release_db_connection(conn)
+
 # Script d'initialisation des paramètres système
 def init_system_settings():
     conn = get_db_connection()
@@ -1378,6 +2273,10 @@ def init_system_settings():
             ('require_special_chars', 'true', 'boolean', 'Caractères spéciaux requis dans les mots de passe'),
             ('session_timeout', '30', 'integer', 'Délai d\'expiration de session en minutes'),
             ('max_login_attempts', '3', 'integer', 'Nombre maximum de tentatives de connexion'),
+            ('bcrypt_rounds', '12', 'integer', 'Facteur de coût bcrypt des mots de passe (10 à 15)'),
+            ('max_login_attempts_per_ip', '30', 'integer', 'Nombre maximum de tentatives de connexion par adresse IP'),
+            ('login_throttle_window', '15', 'integer', 'Délai de récupération des tentatives de connexion en minutes'),
+            ('login_throttle_shared', 'false', 'boolean', 'Partager les compteurs de tentatives entre processus (table login_throttle)'),
             
             # Paramètres de notification
             ('email_notifications', 'true', 'boolean', 'Activer les notifications par email'),
@@ -1387,6 +2286,12 @@ def init_system_settings():
             # Paramètres système
             ('backup_frequency', 'daily', 'string', 'Fréquence des sauvegardes'),
             ('log_retention_days', '30', 'integer', 'Durée de conservation des logs en jours'),
+            ('health_metrics_retention_days', '0', 'integer', 'Durée de conservation des métriques de santé en jours (0 = illimitée)'),
+            ('messages_retention_days', '0', 'integer', 'Durée de conservation des messages en jours (0 = illimitée)'),
+            ('partition_archive_mode', 'archive', 'string', 'Traitement des partitions expirées (archive ou drop)'),
+            ('compression_enabled', 'true', 'boolean', 'Compression des réponses (brotli, gzip, deflate)'),
+            ('compression_min_size', '1024', 'integer', 'Taille minimale des réponses compressées en octets'),
+            ('compression_level', '6', 'integer', 'Niveau de compression (1 à 9)'),
             ('debug_mode', 'false', 'boolean', 'Mode debug')
         ]
         
@@ -1399,11 +2304,11 @@ def init_system_settings():
             """, (key, value, type_, description))
         
         conn.commit()
-        print("✅ Paramètres système initialisés avec succès")
+        logger.info("Paramètres système initialisés")
         
     except Exception as e:
         conn.rollback()
-        print(f"❌ Erreur lors de l'initialisation des paramètres système: {str(e)}")
+        logger.exception("Erreur lors de l'initialisation des paramètres système")
     finally:
         cur.close()
         release_db_connection(conn)
@@ -1411,6 +2316,110 @@ def init_system_settings():
 # Appeler l'initialisation au démarrage de l'application
 init_system_settings()
 
+# Commandes de maintenance du partitionnement (flask partition-tables / flask maintain-partitions)
+@app.cli.command('partition-tables')
+def partition_tables_command():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        for table in PARTITIONED_TABLES:
+            if convert_to_partitioned(cur, table):
+                if table in SYNC_ENTITIES:
+                    install_sync_triggers(cur, table)
+                print(f"✅ Table {table} convertie en table partitionnée")
+            else:
+                print(f"Table {table} déjà partitionnée")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise click.ClickException(f"Erreur lors du partitionnement: {str(e)}")
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.cli.command('rebuild-conversations')
+def rebuild_conversations_command():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        count = rebuild_conversations(cur)
+        conn.commit()
+        print(f"✅ {count} conversation(s) reconstruite(s)")
+    except Exception as e:
+        conn.rollback()
+        raise click.ClickException(f"Erreur lors de la reconstruction des conversations: {str(e)}")
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.cli.command('rebuild-roster')
+def rebuild_roster_command():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        count = rebuild_roster(cur)
+        conn.commit()
+        print(f"✅ {count} relation(s) médecin-patient reconstruite(s)")
+    except Exception as e:
+        conn.rollback()
+        raise click.ClickException(f"Erreur lors de la reconstruction des patients par médecin: {str(e)}")
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.cli.command('maintain-partitions')
+def maintain_partitions_command():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        report = maintain_partitions(cur, load_system_settings(cur))
+        purged = purge_tombstones(cur)
+        purged_emails = purge_sent(cur)
+        purge_reminders(cur)
+        conn.commit()
+        for table, result in report.items():
+            print(f"✅ {table}: {len(result['created'])} partition(s) vérifiée(s), {len(result['expired'])} expirée(s)")
+        print(f"✅ {purged} tombstone(s) de synchronisation purgé(s)")
+        print(f"✅ {purged_emails} e-mail(s) envoyé(s) purgé(s)")
+    except Exception as e:
+        conn.rollback()
+        raise click.ClickException(f"Erreur lors de la maintenance des partitions: {str(e)}")
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+# Tâches d'arrière-plan exécutées par le worker
+@task(DELIVER_TASK)
+def deliver_emails_task(payload, job):
+    sent, failed = deliver_pending(get_db_connection, release_db_connection, mail)
+    if sent or failed:
+        logger.info("E-mails traités", extra={"sent": sent, "failed": failed})
+
+def send_appointment_reminders():
+    count = run_reminders(get_db_connection, release_db_connection, settings_service)
+    if count:
+        logger.info("Rappels de rendez-vous envoyés", extra={"count": count})
+
+# Worker de tâches d'arrière-plan, lancé dans des processus séparés de l'API :
+# flask jobs-worker --queues default:4,email:1 (limites par file, tous workers confondus)
+@app.cli.command('jobs-worker')
+@click.option('--queues', default='default:4,email:1', help="Files et concurrence maximale : nom:limite,...")
+@click.option('--threads', default=None, type=int, help="Fils d'exécution de ce processus (défaut : somme des limites)")
+def jobs_worker_command(queues, threads):
+    global db_pool
+    limits = {}
+    for item in queues.split(','):
+        name, _, limit = item.strip().partition(':')
+        limits[name] = int(limit or 1)
+    worker = Worker(DB_CONFIG, limits, threads=threads, app=app)
+    worker.every(TICK_INTERVAL, send_appointment_reminders)
+    worker.every(LOGIN_THROTTLE_PURGE_INTERVAL, login_throttle.purge)
+    # Tâches, tâches périodiques et rechargement des paramètres s'exécutent dans des fils
+    # distincts : pool dédié, dimensionné pour que chaque fil obtienne une connexion
+    db_pool.closeall()
+    db_pool = ThreadedConnectionPool(minconn=1, maxconn=worker.threads + len(worker.periodic) + 2, **DB_CONFIG)
+    worker.run()
+
 # Nouvelle route pour générer des codes d'invitation (admin uniquement)
 @app.route('/admin/generate-invitation', methods=['POST'])
 @jwt_required()
@@ -1483,7 +2492,7 @@ def update_appointment_status(appointment_id):
 
         # Vérifier que le rendez-vous appartient au médecin
         cur.execute("""
-            SELECT doctor_id FROM appointments 
+            SELECT doctor_id, patient_id, appointment_datetime FROM appointments 
             WHERE id = %s
         """, (appointment_id,))
         appointment = cur.fetchone()
@@ -1502,7 +2511,22 @@ def update_appointment_status(appointment_id):
         """, (new_status, appointment_id))
         
         updated = cur.fetchone()
+        if updated:
+            refresh_roster_entry(cur, current_user_id, appointment['patient_id'])
+            publish_event(cur, [appointment['patient_id'], current_user_id], 'appointment_status', {
+                "id": updated['id'],
+                "status": updated['status']
+            })
+            create_notification(
+                cur,
+                appointment['patient_id'],
+                'appointment_status',
+                "Mise à jour de votre rendez-vous",
+                f"Le statut de votre rendez-vous du {appointment['appointment_datetime'].strftime('%d/%m/%Y %H:%M')} est maintenant : {updated['status']}",
+                {"appointment_id": updated['id'], "status": updated['status']}
+            )
         conn.commit()
+        scheduler.invalidate(current_user_id, appointment['appointment_datetime'].date())
 
         if updated:
             return jsonify({
@@ -1515,9 +2539,12 @@ def update_appointment_status(appointment_id):
         else:
             return jsonify({"error": "Erreur lors de la mise à jour du statut"}), 500
 
+    except psycopg2.errors.ExclusionViolation:
+        conn.rollback()
+        return jsonify({"error": "Ce créneau a été réservé entre-temps, le rendez-vous ne peut pas être réactivé"}), 409
     except Exception as e:
         conn.rollback()
-        print(f"❌ Error in update_appointment_status: {str(e)}")
+        logger.exception("Erreur dans update_appointment_status")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -1531,7 +2558,8 @@ def get_prescriptions():
         
     current_user_id = get_jwt_identity()
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    # medications (JSONB) est renvoyé tel qu'il est stocké, sans décodage
+    cur = raw_jsonb(conn.cursor(cursor_factory=RealDictCursor))
     try:
         # Vérifier que l'utilisateur est un médecin
         cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
@@ -1554,16 +2582,10 @@ def get_prescriptions():
             ORDER BY p.created_at DESC
         """, (current_user_id,))
         prescriptions = cur.fetchall()
-        
-        # Convertir les médicaments de JSON string en objet pour chaque prescription
-        for prescription in prescriptions:
-            if prescription['medications']:
-                prescription['medications'] = json.loads(prescription['medications'])
-                
         return jsonify({"prescriptions": prescriptions}), 200
 
     except Exception as e:
-        print(f"❌ Error in get_prescriptions: {str(e)}")
+        logger.exception("Erreur dans get_prescriptions")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -1578,7 +2600,8 @@ def create_prescription():
     current_user_id = get_jwt_identity()
     data = request.get_json()
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    # medications (JSONB) est renvoyé tel qu'il est stocké, sans décodage
+    cur = raw_jsonb(conn.cursor(cursor_factory=RealDictCursor))
     try:
         # Vérifier que l'utilisateur est un médecin
         cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
@@ -1608,16 +2631,11 @@ def create_prescription():
         
         new_prescription = cur.fetchone()
         conn.commit()
-
-        # Convertir les médicaments de JSON string en objet pour la réponse
-        if new_prescription and 'medications' in new_prescription:
-            new_prescription['medications'] = json.loads(new_prescription['medications'])
-
         return jsonify(new_prescription), 201
 
     except Exception as e:
         conn.rollback()
-        print(f"❌ Error in create_prescription: {str(e)}")
+        logger.exception("Erreur dans create_prescription")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -1631,7 +2649,8 @@ def get_patient_prescriptions(patient_id):
         
     current_user_id = get_jwt_identity()
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    # medications (JSONB) est renvoyé tel qu'il est stocké, sans décodage
+    cur = raw_jsonb(conn.cursor(cursor_factory=RealDictCursor))
     try:
         # Vérifier que l'utilisateur est un médecin
         cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
@@ -1654,21 +2673,49 @@ def get_patient_prescriptions(patient_id):
             ORDER BY p.created_at DESC
         """, (patient_id, current_user_id))
         prescriptions = cur.fetchall()
-        
-        # Convertir les médicaments de JSON string en objet pour chaque prescription
-        for prescription in prescriptions:
-            if prescription['medications']:
-                prescription['medications'] = json.loads(prescription['medications'])
-                
         return jsonify({"prescriptions": prescriptions}), 200
 
     except Exception as e:
-        print(f"❌ Error in get_patient_prescriptions: {str(e)}")
+        logger.exception("Erreur dans get_patient_prescriptions")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
         release_db_connection(conn)
 
+# Champs proposés par ?fields= sur les listes de fichiers DICOM ; dicom_metadata et file_path
+# ne sont servis que par le détail d'un fichier
+DICOM_LIST_FIELDS = {
+    'id': 'df.id',
+    'patient_id': 'df.patient_id',
+    'doctor_id': 'df.doctor_id',
+    'appointment_id': 'df.appointment_id',
+    'file_name': 'df.file_name',
+    'file_size': 'df.file_size',
+    'mime_type': 'df.mime_type',
+    'study_date': 'df.study_date',
+    'modality': 'df.modality',
+    'body_part': 'df.body_part',
+    'description': 'df.description',
+    'study_instance_uid': 'df.study_instance_uid',
+    'series_instance_uid': 'df.series_instance_uid',
+    'created_at': 'df.created_at',
+    'updated_at': 'df.updated_at',
+    'patient_name': 'p.name',
+    'doctor_name': 'd.name',
+}
+DICOM_LIST_DEFAULT_FIELDS = (
+    'id', 'file_name', 'file_size', 'mime_type', 'study_date', 'modality',
+    'body_part', 'description', 'created_at', 'updated_at', 'patient_name', 'doctor_name'
+)
+
+# Détail d'un fichier : tous les champs par défaut, colonnes lourdes comprises
+DICOM_DETAIL_FIELDS = {
+    **DICOM_LIST_FIELDS,
+    'file_path': 'df.file_path',
+    'sop_instance_uid': 'df.sop_instance_uid',
+    'dicom_metadata': 'df.dicom_metadata',
+}
+
 @app.route('/doctor/patients/<int:patient_id>/dicom-files', methods=['GET', 'OPTIONS'])
 @jwt_required()
 def get_patient_dicom_files(patient_id):
@@ -1676,6 +2723,11 @@ def get_patient_dicom_files(patient_id):
         return '', 200
 
     current_user_id = get_jwt_identity()
+    try:
+        fields = parse_fields(request.args.get('fields'), DICOM_LIST_FIELDS, DICOM_LIST_DEFAULT_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
@@ -1685,42 +2737,21 @@ def get_patient_dicom_files(patient_id):
         if not user or user['role'] != 'doctor':
             return jsonify({"error": "Non autorisé à accéder aux fichiers DICOM"}), 403
 
-        # Récupérer les fichiers DICOM du patient
-        cur.execute("""
-            SELECT 
-                df.id,
-                df.file_name,
-                df.file_path,
-                df.file_size,
-                df.mime_type,
-                df.dicom_metadata,
-                df.study_date,
-                df.modality,
-                df.body_part,
-                df.description,
-                df.created_at,
-                df.updated_at,
-                d.name as doctor_name
+        # Récupérer les fichiers DICOM du patient (métadonnées complètes : GET /api/doctor/dicom-files/<id>)
+        cur.execute(f"""
+            SELECT
+                {select_list(fields, DICOM_LIST_FIELDS)}
             FROM dicom_files df
+            JOIN users p ON df.patient_id = p.id
             JOIN users d ON df.doctor_id = d.id
             WHERE df.patient_id = %s
             ORDER BY df.created_at DESC
         """, (patient_id,))
         dicom_files = cur.fetchall()
-
-        # Convertir les objets datetime en chaînes ISO
-        for file in dicom_files:
-            if file['created_at']:
-                file['created_at'] = file['created_at'].isoformat()
-            if file['updated_at']:
-                file['updated_at'] = file['updated_at'].isoformat()
-            if file['study_date']:
-                file['study_date'] = file['study_date'].isoformat()
-
-        return jsonify(dicom_files), 200
+        return json_list_response(dicom_files)
 
     except Exception as e:
-        print(f"❌ Error in get_patient_dicom_files: {str(e)}")
+        logger.exception("Erreur dans get_patient_dicom_files")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -1766,7 +2797,7 @@ def serve_dicom_file(filename):
         )
 
     except Exception as e:
-        print(f"❌ Error in serve_dicom_file: {str(e)}")
+        logger.exception("Erreur dans serve_dicom_file")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -1789,40 +2820,11 @@ def get_doctor_patients_list():
             return jsonify({"error": "Non autorisé à voir les patients"}), 403
 
         # Récupérer les patients du médecin
-        cur.execute("""
-            SELECT DISTINCT 
-                u.id,
-                u.name,
-                u.email,
-                u.phone,
-                u.birthdate,
-                mr.medical_history,
-                mr.allergies,
-                COUNT(a.id) as total_appointments,
-                MAX(a.appointment_datetime) as last_appointment,
-                MIN(CASE WHEN a.appointment_datetime >= CURRENT_TIMESTAMP THEN a.appointment_datetime END) as next_appointment
-            FROM users u
-            JOIN appointments a ON u.id = a.patient_id
-            LEFT JOIN medical_records mr ON u.id = mr.patient_id
-            WHERE a.doctor_id = %s AND u.role = 'patient'
-            GROUP BY u.id, u.name, u.email, u.phone, u.birthdate, mr.medical_history, mr.allergies
-            ORDER BY u.name
-        """, (current_user_id,))
-        patients = cur.fetchall()
-
-        # Convertir les dates en format ISO
-        for patient in patients:
-            if patient['birthdate']:
-                patient['birthdate'] = patient['birthdate'].isoformat()
-            if patient['last_appointment']:
-                patient['last_appointment'] = patient['last_appointment'].isoformat()
-            if patient['next_appointment']:
-                patient['next_appointment'] = patient['next_appointment'].isoformat()
-
-        return jsonify(patients), 200
+        patients = get_roster(cur, current_user_id)
+        return json_list_response(patients)
 
     except Exception as e:
-        print(f"❌ Error in get_doctor_patients_list: {str(e)}")
+        logger.exception("Erreur dans get_doctor_patients_list")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
@@ -1835,6 +2837,11 @@ def get_all_dicom_files():
         return '', 200
 
     current_user_id = get_jwt_identity()
+    try:
+        fields = parse_fields(request.args.get('fields'), DICOM_LIST_FIELDS, DICOM_LIST_DEFAULT_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
@@ -1845,22 +2852,9 @@ def get_all_dicom_files():
             return jsonify({"error": "Non autorisé à accéder aux fichiers DICOM"}), 403
 
         # Récupérer tous les fichiers DICOM accessibles au médecin
-        cur.execute("""
-            SELECT 
-                df.id,
-                df.file_name,
-                df.file_path,
-                df.file_size,
-                df.mime_type,
-                df.dicom_metadata,
-                df.study_date,
-                df.modality,
-                df.body_part,
-                df.description,
-                df.created_at,
-                df.updated_at,
-                p.name as patient_name,
-                d.name as doctor_name
+        cur.execute(f"""
+            SELECT
+                {select_list(fields, DICOM_LIST_FIELDS)}
             FROM dicom_files df
             JOIN users p ON df.patient_id = p.id
             JOIN users d ON df.doctor_id = d.id
@@ -1873,21 +2867,57 @@ def get_all_dicom_files():
             ORDER BY df.created_at DESC
         """, (current_user_id, current_user_id))
         dicom_files = cur.fetchall()
+        return json_list_response(dicom_files)
+
+    except Exception as e:
+        logger.exception("Erreur dans get_all_dicom_files")
+        return jsonify({"error": f"Erreur lors du chargement des fichiers DICOM : {str(e)}"}), 500
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+@app.route('/api/doctor/dicom-files/<int:file_id>', methods=['GET'])
+@jwt_required()
+def get_dicom_file(file_id):
+    # Détail d'un fichier DICOM, avec ses métadonnées complètes (?fields= pour en limiter les champs)
+    current_user_id = get_jwt_identity()
+    try:
+        fields = parse_fields(request.args.get('fields'), DICOM_DETAIL_FIELDS, DICOM_DETAIL_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Convertir les dates en format ISO
-        for file in dicom_files:
-            if file['created_at']:
-                file['created_at'] = file['created_at'].isoformat()
-            if file['updated_at']:
-                file['updated_at'] = file['updated_at'].isoformat()
-            if file['study_date']:
-                file['study_date'] = file['study_date'].isoformat()
+    conn = get_db_connection()
+    cur = raw_jsonb(conn.cursor(cursor_factory=RealDictCursor))
+    try:
+        cur.execute("SELECT role FROM users WHERE id = %s", (current_user_id,))
+        user = cur.fetchone()
+        if not user or user['role'] != 'doctor':
+            return jsonify({"error": "Non autorisé à accéder aux fichiers DICOM"}), 403
+
+        cur.execute(f"""
+            SELECT
+                {select_list(fields, DICOM_DETAIL_FIELDS)}
+            FROM dicom_files df
+            JOIN users p ON df.patient_id = p.id
+            JOIN users d ON df.doctor_id = d.id
+            WHERE df.id = %s
+              AND (
+                  df.doctor_id = %s
+                  OR EXISTS (
+                      SELECT 1 FROM appointments
+                      WHERE doctor_id = %s AND patient_id = df.patient_id
+                  )
+              )
+        """, (file_id, current_user_id, current_user_id))
+        dicom_file = cur.fetchone()
+        if not dicom_file:
+            return jsonify({"error": "Fichier DICOM non trouvé"}), 404
 
-        return jsonify(dicom_files), 200
+        return jsonify(dicom_file), 200
 
     except Exception as e:
-        print(f"❌ Erreur lors du chargement des fichiers DICOM (get_all_dicom_files) : {str(e)}")
-        return jsonify({"error": f"Erreur lors du chargement des fichiers DICOM : {str(e)}"}), 500
+        logger.exception("Erreur dans get_dicom_file")
+        return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         cur.close()
         release_db_connection(conn)
@@ -1916,17 +2946,14 @@ def get_dicom_preview(file_id):
         # Plutôt que le répertoire courant du backend (Telemedecine/backend)
         project_root = os.path.dirname(os.getcwd())
         full_path = os.path.join(project_root, file_path)
-        
-        print(f"🔍 TENTATIVE DE LECTURE DICOM: {full_path}")
 
         if not os.path.exists(full_path):
-            print(f"❌ Erreur: Fichier non trouvé sur le serveur à {full_path}")
+            logger.warning("Fichier DICOM absent du stockage", extra={"file_id": file_id})
             return jsonify({"error": "Fichier non trouvé sur le serveur"}), 404
 
         # Lire le fichier DICOM
         try:
             ds = pydicom.dcmread(full_path)
-            print(f"✅ Fichier DICOM lu avec succès: {full_path}")
             
             # Convertir en image PIL
             pixel_array = ds.pixel_array
@@ -1952,7 +2979,7 @@ def get_dicom_preview(file_id):
             )
             
         except Exception as e:
-            print(f"❌ Erreur lors de la conversion DICOM: {str(e)}")
+            logger.exception("Erreur lors de la conversion DICOM", extra={"file_id": file_id})
             # En cas d'erreur, renvoyer une image de placeholder
             placeholder = Image.new('RGB', (512, 512), color='gray')
             img_io = BytesIO()
@@ -1966,7 +2993,7 @@ def get_dicom_preview(file_id):
             )
             
     except Exception as e:
-        print(f"❌ Erreur serveur (get_dicom_preview): {str(e)}")
+        logger.exception("Erreur dans get_dicom_preview")
         return jsonify({"error": f"Erreur : {str(e)}"}), 500
     finally:
         if 'cur' in locals():
@@ -1974,5 +3001,79 @@ def get_dicom_preview(file_id):
         if 'conn' in locals():
             release_db_connection(conn)
 
+def dispatch_sub_request(sub_request, headers, remote_addr):
+    # Exécute une sous-requête dans le processus, avec le même jeton et la même adresse
+    # cliente que la requête /batch (limitation des connexions, journaux)
+    with app.test_request_context(
+        sub_request['path'],
+        method=sub_request['method'],
+        json=sub_request.get('body'),
+        headers=headers,
+        environ_base={'REMOTE_ADDR': remote_addr}
+    ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            return {"status": 500, "body": {"error": f"Erreur : {str(e)}"}}
+        try:
+            result = {"status": response.status_code}
+            if response.is_json:
+                result["body"] = response.get_json()
+            else:
+                result["content_type"] = response.mimetype
+            return result
+        finally:
+            response.close()
+
+@app.route('/batch', methods=['POST'])
+@jwt_required()
+def batch_requests():
+    # {"requests": [{"id": "rdv", "method": "GET", "path": "/appointments/12"}, ...]}
+    # Les lectures consécutives sont exécutées en parallèle ; chaque écriture attend
+    # les précédentes et s'exécute seule, dans l'ordre du lot
+    data = request.get_json(silent=True) or {}
+    sub_requests = data.get('requests')
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({"error": "Le champ requests doit être une liste non vide"}), 400
+    if len(sub_requests) > BATCH_MAX_REQUESTS:
+        return jsonify({"error": f"Un lot ne peut pas dépasser {BATCH_MAX_REQUESTS} requêtes"}), 400
+
+    for index, sub_request in enumerate(sub_requests):
+        if not isinstance(sub_request, dict):
+            return jsonify({"error": f"Requête {index} invalide"}), 400
+        sub_request['method'] = str(sub_request.get('method', 'GET')).upper()
+        path = sub_request.get('path')
+        if sub_request['method'] not in BATCH_METHODS:
+            return jsonify({"error": f"Requête {index} : méthode non autorisée"}), 400
+        if not isinstance(path, str) or not path.startswith('/'):
+            return jsonify({"error": f"Requête {index} : chemin invalide"}), 400
+        if path.startswith(BATCH_EXCLUDED_PREFIXES):
+            return jsonify({"error": f"Requête {index} : route non disponible dans un lot"}), 400
+
+    # Le jeton déjà vérifié est transmis tel quel à chaque sous-requête
+    headers = {"Authorization": request.headers.get('Authorization')}
+    remote_addr = request.remote_addr
+
+    responses = [None] * len(sub_requests)
+    pending = []
+
+    def flush_reads():
+        futures = [(index, batch_executor.submit(dispatch_sub_request, sub_requests[index], headers, remote_addr)) for index in pending]
+        for index, future in futures:
+            responses[index] = future.result()
+        pending.clear()
+
+    for index, sub_request in enumerate(sub_requests):
+        if sub_request['method'] == 'GET':
+            pending.append(index)
+        else:
+            flush_reads()
+            responses[index] = dispatch_sub_request(sub_request, headers, remote_addr)
+    flush_reads()
+
+    for index, sub_request in enumerate(sub_requests):
+        responses[index]["id"] = sub_request.get('id', index)
+    return jsonify({"responses": responses}), 200
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
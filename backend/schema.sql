@@ -257,4 +257,325 @@ INSERT INTO dicom_files (
     'CT',
     'CHEST',
     'CT Thorax sans injection - Consultation Dr. Luomen'
-); 
\ No newline at end of file
+); 
+
+-- Index pour l'agrégation des métriques de santé par type et par période
+CREATE INDEX IF NOT EXISTS idx_health_metrics_user_type_recorded
+    ON health_metrics(user_id, metric_type, recorded_at);
+
+-- Les tables health_metrics, messages et notifications sont partitionnées par mois
+-- (voir services/partitions.py) : `flask partition-tables` pour la migration initiale,
+-- puis `flask maintain-partitions` quotidiennement (création à l'avance et rétention).
+
+-- Journal des événements temps réel (flux SSE, reprise via Last-Event-ID)
+CREATE TABLE IF NOT EXISTS user_events (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    event_type VARCHAR(50) NOT NULL,
+    data JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_events_user_id_id ON user_events(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_user_events_created_at ON user_events(created_at);
+
+-- Fils de discussion : un fil par paire d'utilisateurs, résumé du dernier message
+CREATE TABLE IF NOT EXISTS conversations (
+    id SERIAL PRIMARY KEY,
+    user_low INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    user_high INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    last_message_id INTEGER,
+    last_sender_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    last_message_preview TEXT,
+    last_message_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(user_low, user_high),
+    CONSTRAINT conversation_users_ordered CHECK (user_low < user_high)
+);
+
+-- État par participant : compteur de non-lus et date du dernier message pour le tri
+CREATE TABLE IF NOT EXISTS conversation_members (
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    other_user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    last_message_at TIMESTAMP,
+    last_read_at TIMESTAMP,
+    PRIMARY KEY (conversation_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_members_user_recent
+    ON conversation_members(user_id, last_message_at DESC);
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS conversation_id INTEGER REFERENCES conversations(id);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_sender_sent ON messages(sender_id, sent_at);
+CREATE INDEX IF NOT EXISTS idx_messages_receiver_sent ON messages(receiver_id, sent_at);
+
+-- Compteurs de notifications non lues, maintenus à l'insertion et à la lecture
+CREATE TABLE IF NOT EXISTS notification_counters (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    unread_count INTEGER NOT NULL DEFAULT 0 CHECK (unread_count >= 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO notification_counters (user_id, unread_count)
+SELECT user_id, COUNT(*) FILTER (WHERE is_read = FALSE)
+FROM notifications
+GROUP BY user_id
+ON CONFLICT (user_id) DO NOTHING;
+
+-- L'index sur is_read seul est peu sélectif : remplacé par un index partiel des non-lues
+DROP INDEX IF EXISTS idx_notifications_is_read;
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread
+    ON notifications(user_id, created_at) WHERE is_read = FALSE;
+
+-- Patients par médecin, maintenus à la création et au changement de statut des rendez-vous
+-- (reconstruction complète : `flask rebuild-roster`)
+CREATE TABLE IF NOT EXISTS doctor_patients (
+    doctor_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    patient_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    total_appointments INTEGER NOT NULL DEFAULT 0,
+    last_appointment TIMESTAMP,
+    next_appointment TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (doctor_id, patient_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_appointments_doctor_patient
+    ON appointments(doctor_id, patient_id, appointment_datetime);
+
+INSERT INTO doctor_patients (doctor_id, patient_id, total_appointments, last_appointment, next_appointment)
+SELECT
+    doctor_id,
+    patient_id,
+    COUNT(*),
+    MAX(appointment_datetime),
+    MIN(appointment_datetime) FILTER (
+        WHERE appointment_datetime >= CURRENT_TIMESTAMP AND status NOT IN ('cancelled', 'no_show')
+    )
+FROM appointments
+GROUP BY doctor_id, patient_id
+ON CONFLICT (doctor_id, patient_id) DO NOTHING;
+
+-- Recherche de créneaux libres par médecin et par période
+CREATE INDEX IF NOT EXISTS idx_availability_slots_doctor_date ON availability_slots(doctor_id, slot_date);
+CREATE INDEX IF NOT EXISTS idx_appointments_doctor_datetime ON appointments(doctor_id, appointment_datetime);
+
+-- Plages de disponibilité hebdomadaires récurrentes (développées à la demande sur la période consultée)
+CREATE TABLE IF NOT EXISTS availability_templates (
+    id SERIAL PRIMARY KEY,
+    doctor_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    weekday SMALLINT NOT NULL CHECK (weekday BETWEEN 0 AND 6), -- 0 = lundi
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    valid_from DATE,
+    valid_until DATE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT valid_template_hours CHECK (start_time < end_time)
+);
+
+CREATE INDEX IF NOT EXISTS idx_availability_templates_doctor_id ON availability_templates(doctor_id);
+
+-- Exceptions aux plages récurrentes : congés, fermetures ponctuelles
+CREATE TABLE IF NOT EXISTS availability_exceptions (
+    id SERIAL PRIMARY KEY,
+    doctor_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    start_datetime TIMESTAMP NOT NULL,
+    end_datetime TIMESTAMP NOT NULL,
+    reason TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT valid_exception_period CHECK (start_datetime < end_datetime)
+);
+
+CREATE INDEX IF NOT EXISTS idx_availability_exceptions_doctor_period
+    ON availability_exceptions(doctor_id, start_datetime, end_datetime);
+
+-- Prévention des doubles réservations : deux rendez-vous actifs d'un même médecin ne peuvent pas se chevaucher.
+-- La contrainte d'exclusion est vérifiée par l'index GiST sans verrouiller l'agenda du médecin.
+-- (les chevauchements existants doivent être résolus avant l'ajout de la contrainte)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS time_range tsrange
+    GENERATED ALWAYS AS (tsrange(appointment_datetime, appointment_datetime + duration * INTERVAL '1 minute', '[)')) STORED;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'appointments_no_overlap') THEN
+        ALTER TABLE appointments ADD CONSTRAINT appointments_no_overlap
+        EXCLUDE USING gist (doctor_id WITH =, time_range WITH &&)
+        WHERE (status NOT IN ('cancelled', 'no_show'));
+    END IF;
+END $$;
+
+-- Médecins consultés par un patient (tableau de bord patient)
+CREATE INDEX IF NOT EXISTS idx_doctor_patients_patient_id ON doctor_patients(patient_id);
+CREATE INDEX IF NOT EXISTS idx_prescriptions_patient_created ON prescriptions(patient_id, created_at DESC);
+
+-- Synchronisation différentielle (/sync) : updated_at maintenu par trigger et tombstones des suppressions
+ALTER TABLE health_metrics ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    entity VARCHAR(50) NOT NULL,
+    row_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_entity ON sync_tombstones(user_id, entity, id);
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted_at ON sync_tombstones(deleted_at);
+
+-- clock_timestamp() plutôt que CURRENT_TIMESTAMP : l'heure de l'écriture, pas du début de la transaction
+CREATE OR REPLACE FUNCTION sync_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Arguments : nom de l'entité puis colonnes désignant les utilisateurs concernés
+CREATE OR REPLACE FUNCTION sync_record_tombstone() RETURNS trigger AS $$
+DECLARE
+    owner_column TEXT;
+    owner_id INTEGER;
+BEGIN
+    FOREACH owner_column IN ARRAY TG_ARGV[1:] LOOP
+        owner_id := (to_jsonb(OLD) ->> owner_column)::INTEGER;
+        IF owner_id IS NOT NULL THEN
+            INSERT INTO sync_tombstones (entity, row_id, user_id) VALUES (TG_ARGV[0], OLD.id, owner_id);
+        END IF;
+    END LOOP;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS appointments_sync_touch ON appointments;
+CREATE TRIGGER appointments_sync_touch BEFORE INSERT OR UPDATE ON appointments
+    FOR EACH ROW EXECUTE FUNCTION sync_touch_updated_at();
+DROP TRIGGER IF EXISTS appointments_sync_tombstone ON appointments;
+CREATE TRIGGER appointments_sync_tombstone AFTER DELETE ON appointments
+    FOR EACH ROW EXECUTE FUNCTION sync_record_tombstone('appointments', 'patient_id', 'doctor_id');
+
+DROP TRIGGER IF EXISTS prescriptions_sync_touch ON prescriptions;
+CREATE TRIGGER prescriptions_sync_touch BEFORE INSERT OR UPDATE ON prescriptions
+    FOR EACH ROW EXECUTE FUNCTION sync_touch_updated_at();
+DROP TRIGGER IF EXISTS prescriptions_sync_tombstone ON prescriptions;
+CREATE TRIGGER prescriptions_sync_tombstone AFTER DELETE ON prescriptions
+    FOR EACH ROW EXECUTE FUNCTION sync_record_tombstone('prescriptions', 'patient_id', 'doctor_id');
+
+DROP TRIGGER IF EXISTS medical_records_sync_touch ON medical_records;
+CREATE TRIGGER medical_records_sync_touch BEFORE INSERT OR UPDATE ON medical_records
+    FOR EACH ROW EXECUTE FUNCTION sync_touch_updated_at();
+DROP TRIGGER IF EXISTS medical_records_sync_tombstone ON medical_records;
+CREATE TRIGGER medical_records_sync_tombstone AFTER DELETE ON medical_records
+    FOR EACH ROW EXECUTE FUNCTION sync_record_tombstone('medical_records', 'patient_id');
+
+-- health_metrics : recréés par `flask partition-tables` après la conversion en table partitionnée
+DROP TRIGGER IF EXISTS health_metrics_sync_touch ON health_metrics;
+CREATE TRIGGER health_metrics_sync_touch BEFORE INSERT OR UPDATE ON health_metrics
+    FOR EACH ROW EXECUTE FUNCTION sync_touch_updated_at();
+DROP TRIGGER IF EXISTS health_metrics_sync_tombstone ON health_metrics;
+CREATE TRIGGER health_metrics_sync_tombstone AFTER DELETE ON health_metrics
+    FOR EACH ROW EXECUTE FUNCTION sync_record_tombstone('health_metrics', 'user_id');
+
+-- Parcours par utilisateur dans l'ordre des jetons (updated_at, id)
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_updated ON appointments(patient_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_appointments_doctor_updated ON appointments(doctor_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_prescriptions_patient_updated ON prescriptions(patient_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_prescriptions_doctor_updated ON prescriptions(doctor_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_medical_records_patient_updated ON medical_records(patient_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_health_metrics_user_updated ON health_metrics(user_id, updated_at, id);
+
+-- Invalidation des caches en mémoire (services/invalidation.py) : NOTIFY table_changes à chaque modification
+-- (pour users, uniquement les colonnes servies par les données de référence : pas last_login)
+CREATE TABLE IF NOT EXISTS system_settings (
+    setting_key VARCHAR(50) PRIMARY KEY,
+    setting_value TEXT NOT NULL,
+    setting_type VARCHAR(20) NOT NULL,
+    description TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('table_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_notify_change ON users;
+CREATE TRIGGER users_notify_change
+    AFTER INSERT OR DELETE OR UPDATE OF role, name, speciality, work_location, is_active ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS system_settings_notify_change ON system_settings;
+CREATE TRIGGER system_settings_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON system_settings
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change();
+
+-- Limitation des tentatives de connexion partagée entre processus (paramètre login_throttle_shared)
+CREATE TABLE IF NOT EXISTS login_throttle (
+    bucket_key VARCHAR(320) PRIMARY KEY, -- "account:<email>" ou "ip:<adresse>"
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_login_throttle_locked ON login_throttle(bucket_key) WHERE tokens < 1;
+
+-- File de tâches d'arrière-plan (services/jobs.py, flask jobs-worker)
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    queue VARCHAR(50) NOT NULL DEFAULT 'default',
+    task VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    priority SMALLINT NOT NULL DEFAULT 0, -- plus grand = plus prioritaire
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    locked_by VARCHAR(100),
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    finished_at TIMESTAMP
+);
+
+-- Réservation : seules les tâches en attente sont indexées, dans l'ordre de réservation
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(queue, priority DESC, run_at, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs(queue, locked_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at) WHERE status = 'done';
+
+-- E-mails sortants, écrits dans la transaction qui les déclenche (services/mailer.py)
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    recipients TEXT[] NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL, -- vidé après envoi
+    html TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'sent', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    sent_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_email_outbox_pending ON email_outbox(next_attempt_at, id) WHERE status = 'queued';
+
+-- Rappels de rendez-vous déjà envoyés (services/reminders.py) : la clé primaire rend la
+-- réservation idempotente entre workers ; un rendez-vous déplacé obtient une nouvelle clé
+CREATE TABLE IF NOT EXISTS appointment_reminders (
+    appointment_id INTEGER NOT NULL,
+    appointment_datetime TIMESTAMP NOT NULL,
+    sent_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    PRIMARY KEY (appointment_id, appointment_datetime)
+);
+
+CREATE INDEX IF NOT EXISTS idx_appointment_reminders_datetime ON appointment_reminders(appointment_datetime);
+
+-- Fenêtre de rappel : plage sur les seuls rendez-vous planifiés
+CREATE INDEX IF NOT EXISTS idx_appointments_scheduled_datetime
+    ON appointments(appointment_datetime) WHERE status = 'scheduled';
@@ -0,0 +1,238 @@
+# security/login_throttle.py
+# Limitation des tentatives de connexion par compte et par adresse (seaux à jetons),
+# vérifiée avant toute recherche d'utilisateur ou tout calcul bcrypt
+import math
+import threading
+import time
+
+# Nombre maximal de seaux conservés en mémoire (les seaux pleins sont oubliés en premier)
+MAX_BUCKETS = 100000
+
+
+class TokenBuckets:
+    # Seaux en mémoire du processus : capacité `capacity`, remplis entièrement en `window` secondes
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def refill(self, bucket, capacity, rate, now):
+        tokens, updated = bucket
+        return min(capacity, tokens + (now - updated) * rate)
+
+    def consume(self, key, capacity, rate):
+        # Renvoie 0 si la tentative est autorisée, sinon le délai d'attente en secondes
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            tokens = capacity if bucket is None else self.refill(bucket, capacity, rate, now)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                return math.ceil((1 - tokens) / rate)
+            self.buckets[key] = (tokens - 1, now)
+            if len(self.buckets) > MAX_BUCKETS:
+                self.prune(capacity, rate, now)
+            return 0
+
+    def prune(self, capacity, rate, now):
+        for key, bucket in list(self.buckets.items()):
+            if self.refill(bucket, capacity, rate, now) >= capacity:
+                del self.buckets[key]
+
+    def refund(self, key, capacity, rate):
+        # Rend le jeton consommé par une tentative finalement réussie
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                self.buckets[key] = (min(capacity, self.refill(bucket, capacity, rate, now) + 1), now)
+
+    def reset(self, key):
+        with self.lock:
+            self.buckets.pop(key, None)
+
+    def locked(self, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            items = list(self.buckets.items())
+        locked = []
+        for key, bucket in items:
+            tokens = self.refill(bucket, capacity(key), rate(key), now)
+            if tokens < 1:
+                locked.append({"key": key, "retry_after": math.ceil((1 - tokens) / rate(key))})
+        return locked
+
+
+class SharedTokenBuckets:
+    # Même algorithme, état partagé entre processus dans la table login_throttle
+
+    def __init__(self, get_connection, release_connection):
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+
+    def consume(self, key, capacity, rate):
+        conn = self.get_connection()
+        cur = conn.cursor()
+        try:
+            # Le remplissage et la consommation se font dans le même UPDATE (ligne verrouillée)
+            cur.execute(
+                """
+                INSERT INTO login_throttle (bucket_key, tokens, updated_at)
+                VALUES (%(key)s, %(capacity)s - 1, clock_timestamp())
+                ON CONFLICT (bucket_key) DO UPDATE SET
+                    tokens = LEAST(%(capacity)s, login_throttle.tokens
+                        + EXTRACT(EPOCH FROM clock_timestamp() - login_throttle.updated_at) * %(rate)s) - 1,
+                    updated_at = clock_timestamp()
+                WHERE LEAST(%(capacity)s, login_throttle.tokens
+                        + EXTRACT(EPOCH FROM clock_timestamp() - login_throttle.updated_at) * %(rate)s) >= 1
+                RETURNING tokens""",
+                {"key": key, "capacity": capacity, "rate": rate}
+            )
+            allowed = cur.fetchone() is not None
+            retry_after = 0
+            if not allowed:
+                cur.execute(
+                    """
+                    SELECT LEAST(%(capacity)s, tokens
+                        + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * %(rate)s)
+                    FROM login_throttle WHERE bucket_key = %(key)s""",
+                    {"key": key, "capacity": capacity, "rate": rate}
+                )
+                tokens = float(cur.fetchone()[0])
+                retry_after = max(math.ceil((1 - tokens) / rate), 1)
+            conn.commit()
+            return retry_after
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            self.release_connection(conn)
+
+    def refund(self, key, capacity, rate):
+        conn = self.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                UPDATE login_throttle SET
+                    tokens = LEAST(%(capacity)s, tokens
+                        + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * %(rate)s + 1),
+                    updated_at = clock_timestamp()
+                WHERE bucket_key = %(key)s""",
+                {"key": key, "capacity": capacity, "rate": rate}
+            )
+            conn.commit()
+        finally:
+            cur.close()
+            self.release_connection(conn)
+
+    def reset(self, key):
+        conn = self.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("DELETE FROM login_throttle WHERE bucket_key = %s", (key,))
+            conn.commit()
+        finally:
+            cur.close()
+            self.release_connection(conn)
+
+    def locked(self, capacity, rate):
+        conn = self.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT bucket_key, tokens, EXTRACT(EPOCH FROM clock_timestamp() - updated_at)
+                FROM login_throttle
+                WHERE tokens < 1"""
+            )
+            rows = cur.fetchall()
+            conn.rollback()
+        finally:
+            cur.close()
+            self.release_connection(conn)
+        locked = []
+        for key, tokens, elapsed in rows:
+            tokens = min(capacity(key), float(tokens) + float(elapsed) * rate(key))
+            if tokens < 1:
+                locked.append({"key": key, "retry_after": math.ceil((1 - tokens) / rate(key))})
+        return locked
+
+    def purge(self, window):
+        # Seaux redevenus pleins : inutile de les conserver
+        conn = self.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "DELETE FROM login_throttle WHERE updated_at < clock_timestamp() - make_interval(secs => %s)",
+                (window,)
+            )
+            count = cur.rowcount
+            conn.commit()
+            return count
+        finally:
+            cur.close()
+            self.release_connection(conn)
+
+
+class LoginThrottle:
+    # Deux seaux par tentative : "account:<email>" (max_login_attempts) et "ip:<adresse>"
+    # (max_login_attempts_per_ip), remplis sur login_throttle_window minutes. Les jetons sont
+    # pris avant la vérification (bcrypt) puis rendus en cas de succès : seuls les échecs
+    # comptent, et une adresse partagée (NAT, proxy) n'est pas bloquée par des connexions valides
+
+    def __init__(self, settings, get_connection, release_connection):
+        self.settings = settings
+        self.local = TokenBuckets()
+        self.shared = SharedTokenBuckets(get_connection, release_connection)
+
+    @property
+    def store(self):
+        return self.shared if self.settings.get_bool('login_throttle_shared') else self.local
+
+    def window(self):
+        return max(self.settings.get_int('login_throttle_window', 15), 1) * 60
+
+    def capacity(self, key):
+        if key.startswith('ip:'):
+            return max(self.settings.get_int('max_login_attempts_per_ip', 30), 1)
+        return max(self.settings.get_int('max_login_attempts', 3), 1)
+
+    def rate(self, key):
+        return self.capacity(key) / self.window()
+
+    def check(self, email, address):
+        # Consomme un jeton par seau ; renvoie le délai d'attente (secondes) si l'un est vide
+        store = self.store
+        retry_after = 0
+        for key in (f"ip:{address}", f"account:{email.strip().lower()}"):
+            retry_after = store.consume(key, self.capacity(key), self.rate(key))
+            if retry_after:
+                break
+        return retry_after
+
+    def succeeded(self, email, address):
+        # Connexion réussie : le compte retrouve toutes ses tentatives, l'adresse son jeton
+        store = self.store
+        store.reset(f"account:{email.strip().lower()}")
+        key = f"ip:{address}"
+        store.refund(key, self.capacity(key), self.rate(key))
+
+    def abandoned(self, email, address):
+        # Tentative non évaluée (serveur surchargé) : ni l'adresse ni le compte ne sont débités
+        store = self.store
+        for key in (f"ip:{address}", f"account:{email.strip().lower()}"):
+            store.refund(key, self.capacity(key), self.rate(key))
+
+    def purge(self):
+        # Seaux partagés inactifs depuis une fenêtre entière (donc pleins)
+        if self.settings.get_bool('login_throttle_shared'):
+            return self.shared.purge(self.window())
+        return 0
+
+    def unlock(self, key):
+        self.store.reset(key)
+
+    def lockouts(self):
+        return self.store.locked(self.capacity, self.rate)
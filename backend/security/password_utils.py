@@ -1,10 +1,105 @@
 # security/password_utils.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
 import bcrypt
 
-def hash_password(plain_password):
-    salt = bcrypt.gensalt()
+# Facteur de coût par défaut (paramètre système bcrypt_rounds)
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 10
+MAX_ROUNDS = 15
+
+def hash_password(plain_password, rounds=DEFAULT_ROUNDS):
+    salt = bcrypt.gensalt(rounds=rounds)
     hashed = bcrypt.hashpw(plain_password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 def verify_password(plain_password, hashed_password):
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def hash_rounds(hashed_password):
+    # "$2b$12$..." -> 12
+    try:
+        return int(hashed_password.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class HasherBusy(Exception):
+    # File d'attente pleine ou attente trop longue : la requête est refusée plutôt que mise en attente
+    pass
+
+
+class PasswordHasher:
+    # Borne le nombre de calculs bcrypt simultanés du processus. Le fil de la requête attend
+    # toujours le résultat (WSGI synchrone) : le gain n'est pas de libérer ce fil, mais de
+    # limiter les calculs concurrents à `workers` fils, ce qui laisse du temps CPU aux autres
+    # requêtes pendant un afflux de connexions ; l'excédent est refusé (HasherBusy -> 503)
+
+    def __init__(self, workers=None, max_queue=64, max_wait=5.0):
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.run_time_total = 0.0
+
+    def run(self, function, *args):
+        with self.lock:
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise HasherBusy("Trop de demandes d'authentification en cours")
+            self.pending += 1
+        submitted = time.monotonic()
+
+        def task():
+            started = time.monotonic()
+            try:
+                return function(*args)
+            finally:
+                finished = time.monotonic()
+                with self.lock:
+                    self.completed += 1
+                    self.queue_time_total += started - submitted
+                    self.queue_time_max = max(self.queue_time_max, started - submitted)
+                    self.run_time_total += finished - started
+
+        try:
+            future = self.executor.submit(task)
+            try:
+                return future.result(timeout=self.max_wait)
+            except FutureTimeoutError:
+                if future.cancel():
+                    with self.lock:
+                        self.rejected += 1
+                    raise HasherBusy("Délai d'attente de vérification du mot de passe dépassé")
+                return future.result()
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def hash(self, plain_password, rounds=DEFAULT_ROUNDS):
+        return self.run(hash_password, plain_password, rounds)
+
+    def verify(self, plain_password, hashed_password):
+        return self.run(verify_password, plain_password, hashed_password)
+
+    def stats(self):
+        with self.lock:
+            completed = self.completed
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "completed": completed,
+                "rejected": self.rejected,
+                "avg_queue_ms": round(self.queue_time_total / completed * 1000, 2) if completed else 0,
+                "max_queue_ms": round(self.queue_time_max * 1000, 2),
+                "avg_hash_ms": round(self.run_time_total / completed * 1000, 2) if completed else 0
+            }
@@ -0,0 +1,161 @@
+# services/compression.py
+# Compression des réponses négociée via Accept-Encoding (brotli, gzip, deflate),
+# au-delà d'un seuil de taille et pour les seuls types compressibles
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Valeurs par défaut, remplacées par system_settings (compression_*)
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVEL = 6
+
+# Ordre de préférence du serveur à qualité égale côté client
+ENCODINGS = ('br', 'gzip', 'deflate')
+
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/dicom',
+    'image/svg+xml',
+}
+
+# Flux continus : chaque événement doit partir immédiatement, sans tampon intermédiaire
+EXCLUDED_TYPES = {'text/event-stream'}
+
+
+def is_compressible(mimetype):
+    if not mimetype or mimetype in EXCLUDED_TYPES:
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES or mimetype.endswith('+json')
+
+
+def make_compressor(encoding, level):
+    # Objet exposant compress(bytes) / flush() / finish() pour chaque codage
+    if encoding == 'br':
+        return BrotliStream(level)
+    wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    return ZlibStream(zlib.compressobj(level, zlib.DEFLATED, wbits))
+
+
+class ZlibStream:
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliStream:
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ResponseCompressor:
+    # Hook after_request : réponses complètes compressées en une fois, réponses
+    # en flux (générateurs, fichiers) compressées morceau par morceau sans mise en tampon
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.min_size = DEFAULT_MIN_SIZE
+        self.level = DEFAULT_LEVEL
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def configure(self, settings):
+        self.enabled = bool(settings.get('compression_enabled', True))
+        self.min_size = max(int(settings.get('compression_min_size', DEFAULT_MIN_SIZE)), 0)
+        self.level = min(max(int(settings.get('compression_level', DEFAULT_LEVEL)), 1), 9)
+
+    def available_encodings(self):
+        return [encoding for encoding in ENCODINGS if encoding != 'br' or brotli is not None]
+
+    def choose_encoding(self, accept_encodings):
+        best, best_quality = None, 0
+        for encoding in self.available_encodings():
+            quality = accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def after_request(self, response):
+        if not self.enabled or request.method == 'HEAD':
+            return response
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if 'Content-Encoding' in response.headers or not is_compressible(response.mimetype):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed or response.direct_passthrough:
+            length = response.content_length
+            if length is not None and length < self.min_size:
+                return response
+            response.response = self.compress_stream(response.response, encoding)
+            response.direct_passthrough = False
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            compressed = make_compressor(encoding, self.level)
+            body = compressed.compress(data) + compressed.finish()
+            if len(body) >= len(data):
+                return response
+            response.set_data(body)
+
+        response.headers['Content-Encoding'] = encoding
+        self.tag_etag(response, encoding)
+        return response
+
+    def compress_stream(self, chunks, encoding):
+        compressor = make_compressor(encoding, self.level)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if not chunk:
+                    continue
+                # Vidage à chaque morceau : le client reçoit les données au fil de l'eau
+                yield compressor.compress(chunk) + compressor.flush()
+            yield compressor.finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    @staticmethod
+    def tag_etag(response, encoding):
+        # Un ETag fort désigne une représentation précise : suffixe du codage appliqué
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f"{etag}-{encoding}")
+
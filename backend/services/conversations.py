@@ -0,0 +1,167 @@
+# services/conversations.py
+# Fils de discussion : résumé du dernier message et compteur de non-lus par participant
+
+PREVIEW_LENGTH = 200
+MAX_PAGE_SIZE = 200
+
+
+def record_message(cur, sender_id, receiver_id, content):
+    # Insère le message et met à jour le fil dans la même transaction
+    user_low, user_high = sorted((int(sender_id), int(receiver_id)))
+    cur.execute(
+        """
+        INSERT INTO conversations (user_low, user_high)
+        VALUES (%s, %s)
+        ON CONFLICT (user_low, user_high) DO UPDATE SET user_low = EXCLUDED.user_low
+        RETURNING id""",
+        (user_low, user_high)
+    )
+    conversation_id = cur.fetchone()['id']
+
+    cur.execute(
+        """
+        INSERT INTO messages (sender_id, receiver_id, content, conversation_id)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id, sent_at""",
+        (sender_id, receiver_id, content, conversation_id)
+    )
+    message = cur.fetchone()
+
+    cur.execute(
+        """
+        UPDATE conversations
+        SET last_message_id = %s,
+            last_sender_id = %s,
+            last_message_preview = LEFT(%s, %s),
+            last_message_at = %s
+        WHERE id = %s""",
+        (message['id'], sender_id, content, PREVIEW_LENGTH, message['sent_at'], conversation_id)
+    )
+    cur.execute(
+        """
+        INSERT INTO conversation_members (conversation_id, user_id, other_user_id, unread_count, last_message_at)
+        VALUES (%s, %s, %s, 0, %s), (%s, %s, %s, 1, %s)
+        ON CONFLICT (conversation_id, user_id) DO UPDATE SET
+            unread_count = conversation_members.unread_count + EXCLUDED.unread_count,
+            last_message_at = EXCLUDED.last_message_at""",
+        (conversation_id, sender_id, receiver_id, message['sent_at'],
+         conversation_id, receiver_id, sender_id, message['sent_at'])
+    )
+    return conversation_id, message
+
+
+def list_conversations(cur, user_id, limit=50, before=None):
+    # Une lecture de l'index (user_id, last_message_at DESC)
+    cur.execute(
+        """
+        SELECT
+            c.id,
+            cm.other_user_id,
+            u.name AS other_user_name,
+            u.role AS other_user_role,
+            c.last_message_id,
+            c.last_sender_id,
+            c.last_message_preview,
+            cm.last_message_at,
+            cm.unread_count
+        FROM conversation_members cm
+        JOIN conversations c ON c.id = cm.conversation_id
+        JOIN users u ON u.id = cm.other_user_id
+        WHERE cm.user_id = %s
+          AND (%s::timestamp IS NULL OR cm.last_message_at < %s::timestamp)
+        ORDER BY cm.last_message_at DESC
+        LIMIT %s""",
+        (user_id, before, before, min(limit, MAX_PAGE_SIZE))
+    )
+    return cur.fetchall()
+
+
+def get_membership(cur, conversation_id, user_id):
+    cur.execute(
+        "SELECT unread_count, last_read_at FROM conversation_members WHERE conversation_id = %s AND user_id = %s",
+        (conversation_id, user_id)
+    )
+    return cur.fetchone()
+
+
+def get_conversation_messages(cur, conversation_id, since=None, before=None, limit=50):
+    # Pagination par identifiant de message :
+    # since -> messages plus récents que le curseur, before -> historique plus ancien
+    limit = min(limit, MAX_PAGE_SIZE)
+    if since is not None:
+        cur.execute(
+            """
+            SELECT id, sender_id, receiver_id, content, sent_at
+            FROM messages
+            WHERE conversation_id = %s AND id > %s
+            ORDER BY id
+            LIMIT %s""",
+            (conversation_id, since, limit)
+        )
+        return cur.fetchall()
+
+    cur.execute(
+        """
+        SELECT id, sender_id, receiver_id, content, sent_at
+        FROM messages
+        WHERE conversation_id = %s
+          AND (%s::int IS NULL OR id < %s::int)
+        ORDER BY id DESC
+        LIMIT %s""",
+        (conversation_id, before, before, limit)
+    )
+    return list(reversed(cur.fetchall()))
+
+
+def mark_conversation_read(cur, conversation_id, user_id):
+    cur.execute(
+        """
+        UPDATE conversation_members
+        SET unread_count = 0, last_read_at = CURRENT_TIMESTAMP
+        WHERE conversation_id = %s AND user_id = %s
+        RETURNING unread_count""",
+        (conversation_id, user_id)
+    )
+    return cur.fetchone() is not None
+
+
+def rebuild_conversations(cur):
+    # Reconstruit les fils à partir de l'historique des messages existants
+    cur.execute("""
+        INSERT INTO conversations (user_low, user_high)
+        SELECT DISTINCT LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id)
+        FROM messages
+        ON CONFLICT (user_low, user_high) DO NOTHING
+    """)
+    cur.execute("""
+        UPDATE messages m
+        SET conversation_id = c.id
+        FROM conversations c
+        WHERE m.conversation_id IS NULL
+          AND c.user_low = LEAST(m.sender_id, m.receiver_id)
+          AND c.user_high = GREATEST(m.sender_id, m.receiver_id)
+    """)
+    cur.execute("""
+        UPDATE conversations c
+        SET last_message_id = last.id,
+            last_sender_id = last.sender_id,
+            last_message_preview = LEFT(last.content, %s),
+            last_message_at = last.sent_at
+        FROM (
+            SELECT DISTINCT ON (conversation_id) conversation_id, id, sender_id, content, sent_at
+            FROM messages
+            WHERE conversation_id IS NOT NULL
+            ORDER BY conversation_id, sent_at DESC, id DESC
+        ) last
+        WHERE last.conversation_id = c.id
+    """, (PREVIEW_LENGTH,))
+    cur.execute("""
+        INSERT INTO conversation_members (conversation_id, user_id, other_user_id, unread_count, last_message_at)
+        SELECT id, user_low, user_high, 0, last_message_at FROM conversations
+        UNION ALL
+        SELECT id, user_high, user_low, 0, last_message_at FROM conversations
+        ON CONFLICT (conversation_id, user_id) DO UPDATE SET
+            last_message_at = EXCLUDED.last_message_at
+    """)
+    cur.execute("SELECT COUNT(*) AS count FROM conversations")
+    return cur.fetchone()['count']
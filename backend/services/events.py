@@ -0,0 +1,205 @@
+# services/events.py
+# Diffusion d'événements temps réel (SSE) alimentée par LISTEN/NOTIFY
+import json
+import queue
+import select
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+
+from services.json_encoding import json_default
+from services.structured_logging import get_logger
+
+logger = get_logger('events')
+
+CHANNEL = 'user_events'
+
+# Au-delà de cette taille, la charge utile n'est pas envoyée dans le NOTIFY
+# (limite PostgreSQL : 8000 octets) et l'écouteur relit l'événement en base
+MAX_NOTIFY_PAYLOAD = 7000
+
+# Intervalle de purge et durée de conservation des événements rejouables
+PURGE_INTERVAL = 3600
+EVENT_RETENTION = '1 day'
+
+# Relecture après reconnexion : lue par pages ; au-delà de REPLAY_LIMIT événements, le
+# client reçoit un événement "resync" et doit recharger son état au lieu de tout rejouer
+REPLAY_PAGE_SIZE = 500
+REPLAY_LIMIT = 5000
+
+# Identifiants déjà transmis sur un flux, gardés pour écarter les doublons (relecture et
+# notification du même événement) ; les BIGSERIAL ne sont pas validés dans l'ordre, un
+# identifiant plus petit que le dernier transmis peut donc encore arriver
+SEEN_EVENTS_SIZE = 1000
+
+
+def publish_event(cur, user_ids, event_type, data):
+    # Même événement pour plusieurs destinataires
+    user_ids = sorted({int(user_id) for user_id in user_ids if user_id})
+    return publish_events(cur, [(user_id, event_type, data) for user_id in user_ids])
+
+
+def publish_events(cur, events):
+    # Enregistre les événements (user_id, type, données) et les notifie à la
+    # validation de la transaction (NOTIFY est transactionnel)
+    if not events:
+        return []
+
+    with cur.connection.cursor() as event_cur:
+        event_cur.execute(
+            """
+            WITH inserted AS (
+                INSERT INTO user_events (user_id, event_type, data)
+                SELECT user_id, event_type, data::jsonb
+                FROM unnest(%s::int[], %s::text[], %s::text[]) AS e(user_id, event_type, data)
+                RETURNING id, user_id, event_type, data
+            )
+            SELECT id, pg_notify(%s, (
+                jsonb_build_object('id', id, 'user_id', user_id, 'type', event_type)
+                || CASE WHEN octet_length(data::text) <= %s
+                        THEN jsonb_build_object('data', data)
+                        ELSE '{}'::jsonb END
+            )::text)
+            FROM inserted
+            ORDER BY id""",
+            (
+                [int(user_id) for user_id, _, _ in events],
+                [event_type for _, event_type, _ in events],
+                [json.dumps(data, default=json_default) for _, _, data in events],
+                CHANNEL,
+                MAX_NOTIFY_PAYLOAD
+            )
+        )
+        return [row[0] for row in event_cur.fetchall()]
+
+
+def fetch_missed_events(cur, user_id, last_event_id, limit=REPLAY_LIMIT):
+    # Événements manqués depuis Last-Event-ID, par pages ; renvoie (événements, tronqué)
+    events = []
+    after = last_event_id
+    while len(events) <= limit:
+        cur.execute(
+            """
+            SELECT id, event_type AS type, data
+            FROM user_events
+            WHERE user_id = %s AND id > %s
+            ORDER BY id
+            LIMIT %s""",
+            (user_id, after, min(REPLAY_PAGE_SIZE, limit - len(events) + 1))
+        )
+        page = cur.fetchall()
+        events.extend(page)
+        if len(page) < REPLAY_PAGE_SIZE:
+            break
+        after = page[-1]['id']
+    if len(events) > limit:
+        return events[:limit], True
+    return events, False
+
+
+class SeenEvents:
+    # Ensemble borné des derniers identifiants transmis
+
+    def __init__(self, size=SEEN_EVENTS_SIZE):
+        self.ids = set()
+        self.order = deque()
+        self.size = size
+
+    def add(self, event_id):
+        # False si l'identifiant a déjà été transmis
+        if event_id in self.ids:
+            return False
+        self.ids.add(event_id)
+        self.order.append(event_id)
+        if len(self.order) > self.size:
+            self.ids.discard(self.order.popleft())
+        return True
+
+
+def format_resync():
+    # Sans identifiant : Last-Event-ID reste celui de la position demandée par le client
+    return "event: resync\ndata: {}\n\n"
+
+
+def format_sse(event):
+    return (
+        f"id: {event['id']}\n"
+        f"event: {event['type']}\n"
+        f"data: {json.dumps(event['data'], default=json_default)}\n\n"
+    )
+
+
+class EventBroker:
+    # Une seule connexion d'écoute par processus, partagée par tous les flux ouverts
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self, user_id):
+        self.start()
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[user_id]
+
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name='event-broker', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {CHANNEL}")
+                last_purge = 0
+                while True:
+                    if time.monotonic() - last_purge > PURGE_INTERVAL:
+                        cur.execute(
+                            f"DELETE FROM user_events WHERE created_at < CURRENT_TIMESTAMP - INTERVAL '{EVENT_RETENTION}'"
+                        )
+                        last_purge = time.monotonic()
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.dispatch(cur, notify.payload)
+            except Exception:
+                logger.exception("Erreur de l'écouteur d'événements")
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def dispatch(self, cur, payload):
+        event = json.loads(payload)
+        with self.lock:
+            subscribers = list(self.subscribers.get(event['user_id'], ()))
+        if not subscribers:
+            return
+        if 'data' not in event:
+            cur.execute("SELECT data FROM user_events WHERE id = %s", (event['id'],))
+            row = cur.fetchone()
+            event['data'] = row[0] if row else None
+        for subscriber in subscribers:
+            subscriber.put(event)
@@ -0,0 +1,25 @@
+# services/fieldsets.py
+# Projection des listes (?fields=a,b,c) : seules les colonnes demandées sont lues en SQL
+
+
+def parse_fields(raw, allowed, default):
+    # raw : valeur brute de ?fields= ; ValueError si un champ n'est pas proposé par la route
+    if not raw:
+        return list(default)
+    fields = []
+    for field in raw.split(','):
+        field = field.strip()
+        if field and field not in fields:
+            fields.append(field)
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Champs inconnus: {', '.join(unknown)}. Valeurs autorisées: {', '.join(allowed)}")
+    if 'id' in allowed and 'id' not in fields:
+        # L'identifiant reste toujours présent (clés de liste, lien vers le détail)
+        fields.insert(0, 'id')
+    return fields
+
+
+def select_list(fields, allowed):
+    # allowed : champ -> expression SQL (noms fixés par la route, jamais issus de la requête)
+    return ",\n                ".join(f"{allowed[field]} AS {field}" for field in fields)
@@ -0,0 +1,116 @@
+# services/health_metrics.py
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Granularités acceptées par date_trunc pour l'agrégation
+BUCKETS = ('hour', 'day', 'week', 'month')
+
+# Taille des lots lus depuis le curseur serveur
+FETCH_SIZE = 5000
+
+
+def aggregate_metrics(cur, user_id, metric_type, start, end, bucket):
+    # Une ligne par intervalle : min, max, moyenne, nombre et dernière valeur
+    cur.execute(
+        """
+        SELECT
+            date_trunc(%s, recorded_at) AS bucket_start,
+            MIN(value) AS min,
+            MAX(value) AS max,
+            AVG(value)::float8 AS mean,
+            COUNT(*) AS count,
+            (ARRAY_AGG(value ORDER BY recorded_at DESC))[1] AS last
+        FROM health_metrics
+        WHERE user_id = %s
+          AND metric_type = %s
+          AND recorded_at >= %s
+          AND recorded_at < %s
+        GROUP BY 1
+        ORDER BY 1""",
+        (bucket, user_id, metric_type, start, end)
+    )
+    return cur.fetchall()
+
+
+def stream_metric_series(conn, user_id, metric_type, start, end):
+    # Curseur nommé (côté serveur) : les lignes arrivent par lots,
+    # seules deux colonnes numpy sont conservées en mémoire
+    cur = conn.cursor(name="health_metrics_stream")
+    cur.itersize = FETCH_SIZE
+    try:
+        cur.execute(
+            """
+            SELECT EXTRACT(EPOCH FROM recorded_at)::float8, value::float8
+            FROM health_metrics
+            WHERE user_id = %s
+              AND metric_type = %s
+              AND recorded_at >= %s
+              AND recorded_at < %s
+            ORDER BY recorded_at""",
+            (user_id, metric_type, start, end)
+        )
+        chunks = []
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    finally:
+        cur.close()
+
+    if not chunks:
+        return np.empty(0), np.empty(0)
+    data = np.concatenate(chunks)
+    return data[:, 0], data[:, 1]
+
+
+def lttb_downsample(x, y, threshold):
+    # Largest-Triangle-Three-Buckets : conserve la forme de la courbe
+    # avec un nombre de points fixe
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    every = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        stop = int((i + 1) * every) + 1
+        next_start = stop
+        next_stop = min(int((i + 2) * every) + 1, n)
+
+        # Point moyen de l'intervalle suivant
+        if next_start >= next_stop:
+            avg_x, avg_y = x[-1], y[-1]
+        else:
+            avg_x = x[next_start:next_stop].mean()
+            avg_y = y[next_start:next_stop].mean()
+
+        # Aire du triangle (a, candidat, moyenne suivante) pour chaque candidat
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a])
+            - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(areas.argmax())
+        keep[i + 1] = a
+
+    return x[keep], y[keep]
+
+
+def downsample_metrics(conn, user_id, metric_type, start, end, points):
+    x, y = stream_metric_series(conn, user_id, metric_type, start, end)
+    total = len(x)
+    x, y = lttb_downsample(x, y, points)
+    series = [
+        {
+            "recorded_at": datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat(),
+            "value": value
+        }
+        for ts, value in zip(x.tolist(), y.tolist())
+    ]
+    return series, total
@@ -0,0 +1,71 @@
+# services/invalidation.py
+# Invalidation des caches en mémoire entre processus : les triggers notify_table_change
+# publient le nom de la table modifiée sur le canal table_changes
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from services.structured_logging import get_logger
+
+logger = get_logger('invalidation')
+
+CHANNEL = 'table_changes'
+
+
+class ChangeListener:
+    # Une connexion d'écoute par processus ; chaque rappel reçoit le nom de la table modifiée,
+    # ou None à chaque (re)connexion : des notifications ont pu être perdues entre-temps
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.callbacks = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def on_change(self, callback):
+        with self.lock:
+            self.callbacks.append(callback)
+
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name='change-listener', daemon=True)
+            self.thread.start()
+
+    def notify(self, table):
+        with self.lock:
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback(table)
+            except Exception:
+                logger.exception("Erreur lors de l'invalidation du cache", extra={"table": table})
+
+    def run(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {CHANNEL}")
+                self.notify(None)
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    tables = set()
+                    while conn.notifies:
+                        tables.add(conn.notifies.pop(0).payload)
+                    for table in tables:
+                        self.notify(table)
+            except Exception:
+                logger.exception("Erreur de l'écouteur d'invalidation")
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
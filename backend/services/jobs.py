@@ -0,0 +1,348 @@
+# services/jobs.py
+# File de tâches durable dans PostgreSQL : réservation par FOR UPDATE SKIP LOCKED,
+# priorités, reprises avec délai exponentiel et limite de concurrence par file
+import json
+import os
+import random
+import select
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+from services.json_encoding import json_default
+from services.structured_logging import get_logger
+
+logger = get_logger('jobs')
+
+CHANNEL = 'jobs'
+
+# Tâches enregistrées : nom -> fonction(payload, job)
+TASKS = {}
+
+DEFAULT_QUEUE = 'default'
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Délai avant nouvelle tentative : BACKOFF_BASE * 2^(tentative - 1), plafonné, avec gigue
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+
+# Les tâches en cours sont signalées vivantes (locked_at) toutes les HEARTBEAT_INTERVAL
+# secondes ; sans signal depuis STALE_AFTER secondes, leur worker est considéré arrêté
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = 120
+
+# Conservation des tâches terminées (jours)
+DONE_RETENTION_DAYS = 7
+
+POLL_INTERVAL = 2
+MAINTENANCE_INTERVAL = 60
+
+
+def task(name):
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def enqueue(cur, task_name, payload=None, queue=DEFAULT_QUEUE, priority=0, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    # Utilise le curseur de l'appelant : la tâche n'existe que si sa transaction est validée
+    return enqueue_many(cur, task_name, [payload], queue, priority, delay, max_attempts)[0]
+
+
+def enqueue_many(cur, task_name, payloads, queue=DEFAULT_QUEUE, priority=0, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    if not payloads:
+        return []
+    with cur.connection.cursor() as job_cur:
+        job_cur.execute(
+            """
+            INSERT INTO jobs (queue, task, payload, priority, max_attempts, run_at)
+            SELECT %s, %s, payload::jsonb, %s, %s, clock_timestamp() + make_interval(secs => %s)
+            FROM unnest(%s::text[]) AS payload
+            RETURNING id""",
+            (
+                queue, task_name, priority, max_attempts, delay,
+                [json.dumps(payload, default=json_default) for payload in payloads]
+            )
+        )
+        ids = [row[0] for row in job_cur.fetchall()]
+        # Réveil des workers à la validation de la transaction
+        job_cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, queue))
+    return ids
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def queue_stats(cur):
+    cur.execute(
+        """
+        SELECT
+            queue,
+            COUNT(*) FILTER (WHERE status = 'queued' AND run_at <= clock_timestamp()) AS ready,
+            COUNT(*) FILTER (WHERE status = 'queued' AND run_at > clock_timestamp()) AS scheduled,
+            COUNT(*) FILTER (WHERE status = 'running') AS running,
+            COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+            COUNT(*) FILTER (WHERE status = 'done') AS done,
+            MIN(run_at) FILTER (WHERE status = 'queued') AS oldest_queued
+        FROM jobs
+        GROUP BY queue
+        ORDER BY queue"""
+    )
+    return cur.fetchall()
+
+
+class Worker:
+    # queues : {nom de file: nombre maximal de tâches simultanées pour cette file, tous workers confondus}
+    # Chaque processus lancé (flask jobs-worker) réserve au plus ce qu'il peut exécuter
+
+    def __init__(self, dsn, queues, threads=None, app=None):
+        self.dsn = dsn
+        self.queues = queues
+        self.app = app
+        self.threads = threads or sum(queues.values())
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='job')
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()
+        self.running = {queue: 0 for queue in queues}
+        self.active = set()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.periodic = []
+
+    def every(self, interval, function):
+        # Fonction exécutée toutes les `interval` secondes dans un fil dédié du worker
+        # (chaque processus worker l'exécute : elle doit être idempotente)
+        self.periodic.append((interval, function))
+
+    def run_periodic(self, interval, function):
+        while not self.stopping:
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        function()
+                else:
+                    function()
+            except Exception:
+                logger.exception("Erreur de la tâche périodique", extra={"function": function.__name__})
+            time.sleep(interval)
+
+    def connect(self):
+        conn = psycopg2.connect(**self.dsn)
+        return conn
+
+    def claim(self, conn, queue, slots):
+        # Réserve jusqu'à `slots` tâches prêtes ; le verrou consultatif de la file rend
+        # le comptage des tâches en cours exact entre processus
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"jobs:{queue}",))
+            cur.execute("SELECT COUNT(*) AS count FROM jobs WHERE queue = %s AND status = 'running'", (queue,))
+            slots = min(slots, self.queues[queue] - cur.fetchone()['count'])
+            if slots <= 0:
+                conn.rollback()
+                return []
+            cur.execute(
+                """
+                WITH next AS (
+                    SELECT id
+                    FROM jobs
+                    WHERE queue = %s AND status = 'queued' AND run_at <= clock_timestamp()
+                    ORDER BY priority DESC, run_at, id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE jobs
+                SET status = 'running',
+                    attempts = jobs.attempts + 1,
+                    locked_by = %s,
+                    locked_at = clock_timestamp()
+                FROM next
+                WHERE jobs.id = next.id
+                RETURNING jobs.id, jobs.queue, jobs.task, jobs.payload, jobs.attempts, jobs.max_attempts""",
+                (queue, slots, self.name)
+            )
+            jobs = cur.fetchall()
+        conn.commit()
+        return jobs
+
+    def execute(self, job):
+        conn = None
+        with self.lock:
+            self.active.add(job['id'])
+        try:
+            function = TASKS.get(job['task'])
+            if function is None:
+                raise LookupError(f"Tâche inconnue: {job['task']}")
+            if self.app is not None:
+                with self.app.app_context():
+                    function(job['payload'], job)
+            else:
+                function(job['payload'], job)
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+        try:
+            conn = self.connect()
+            with conn.cursor() as cur:
+                self.finish(cur, job, error)
+            conn.commit()
+        except Exception:
+            logger.exception("Impossible d'enregistrer le résultat de la tâche", extra={"job_id": job['id']})
+        finally:
+            if conn is not None:
+                conn.close()
+            with self.lock:
+                self.running[job['queue']] -= 1
+                self.active.discard(job['id'])
+            self.wakeup.set()
+
+    def finish(self, cur, job, error):
+        if error is None:
+            cur.execute(
+                """
+                UPDATE jobs SET status = 'done', finished_at = clock_timestamp(), locked_by = NULL
+                WHERE id = %s AND locked_by = %s""",
+                (job['id'], self.name)
+            )
+        elif job['attempts'] < job['max_attempts']:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'queued',
+                    run_at = clock_timestamp() + make_interval(secs => %s),
+                    last_error = %s,
+                    locked_by = NULL
+                WHERE id = %s AND locked_by = %s""",
+                (backoff(job['attempts']), error, job['id'], self.name)
+            )
+        else:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'failed', finished_at = clock_timestamp(), last_error = %s, locked_by = NULL
+                WHERE id = %s AND locked_by = %s""",
+                (error, job['id'], self.name)
+            )
+            logger.error(
+                "Tâche abandonnée",
+                extra={"job_id": job['id'], "task": job['task'], "attempts": job['attempts']}
+            )
+
+    def maintain(self, conn):
+        # Remet en file les tâches d'un worker arrêté (sans signal de vie) et purge les tâches
+        # terminées ; une tâche qui a épuisé ses tentatives (elle arrête peut-être son worker)
+        # passe en échec au lieu d'être relancée indéfiniment
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN clock_timestamp() END,
+                    locked_by = NULL,
+                    last_error = 'Worker interrompu (' || locked_by || ')'
+                WHERE status = 'running' AND locked_at < clock_timestamp() - make_interval(secs => %s)""",
+                (STALE_AFTER,)
+            )
+            cur.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND finished_at < clock_timestamp() - make_interval(days => %s)",
+                (DONE_RETENTION_DAYS,)
+            )
+        conn.commit()
+
+    def heartbeat(self):
+        # Connexion dédiée : un signal de vie ne doit pas attendre une réservation ou une maintenance
+        conn = None
+        while not self.stopping:
+            try:
+                if conn is None:
+                    conn = self.connect()
+                with self.lock:
+                    active = list(self.active)
+                if active:
+                    with conn.cursor() as cur:
+                        cur.execute(
+                            """
+                            UPDATE jobs SET locked_at = clock_timestamp()
+                            WHERE id = ANY(%s) AND status = 'running' AND locked_by = %s""",
+                            (active, self.name)
+                        )
+                    conn.commit()
+            except Exception:
+                logger.exception("Erreur du signal de vie des tâches")
+                if conn is not None:
+                    conn.close()
+                conn = None
+            time.sleep(HEARTBEAT_INTERVAL)
+        if conn is not None:
+            conn.close()
+
+    def listen(self):
+        # Réveil immédiat sur pg_notify('jobs'), sinon interrogation toutes les POLL_INTERVAL secondes
+        while not self.stopping:
+            conn = None
+            try:
+                conn = self.connect()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                while not self.stopping:
+                    if select.select([conn], [], [], POLL_INTERVAL) != ([], [], []):
+                        conn.poll()
+                        conn.notifies.clear()
+                    self.wakeup.set()
+            except Exception:
+                logger.exception("Erreur de l'écouteur de tâches")
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def run(self):
+        logger.info("Worker démarré", extra={
+            "worker": self.name,
+            # Chaîne plutôt que dictionnaire : une file "email" serait masquée comme un champ personnel
+            "queues": ','.join(f"{queue}:{limit}" for queue, limit in self.queues.items()),
+            "threads": self.threads
+        })
+        threading.Thread(target=self.listen, name='jobs-listener', daemon=True).start()
+        threading.Thread(target=self.heartbeat, name='jobs-heartbeat', daemon=True).start()
+        for interval, function in self.periodic:
+            threading.Thread(target=self.run_periodic, args=(interval, function), daemon=True).start()
+        conn = self.connect()
+        last_maintenance = 0
+        try:
+            while not self.stopping:
+                self.wakeup.wait(POLL_INTERVAL)
+                self.wakeup.clear()
+                try:
+                    if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                        self.maintain(conn)
+                        last_maintenance = time.monotonic()
+                    for queue, limit in self.queues.items():
+                        with self.lock:
+                            free = min(limit - self.running[queue], self.threads - sum(self.running.values()))
+                        if free <= 0:
+                            continue
+                        for job in self.claim(conn, queue, free):
+                            with self.lock:
+                                self.running[queue] += 1
+                            self.executor.submit(self.execute, job)
+                except psycopg2.Error:
+                    logger.exception("Erreur du worker", extra={"worker": self.name})
+                    conn.close()
+                    time.sleep(1)
+                    conn = self.connect()
+        except KeyboardInterrupt:
+            logger.info("Arrêt du worker : fin des tâches en cours", extra={"worker": self.name})
+        finally:
+            self.stopping = True
+            self.executor.shutdown(wait=True)
+            conn.close()
@@ -0,0 +1,115 @@
+# services/json_encoding.py
+# Encodage JSON des réponses : types renvoyés par psycopg2 sérialisés nativement,
+# JSONB transmis tel quel (sans décodage ni ré-encodage), grandes listes encodées en flux
+import json
+import re
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from flask import Response
+from flask.json.provider import JSONProvider
+from psycopg2.extras import Range, register_default_jsonb
+
+# Au-delà de ce nombre d'éléments, une liste est encodée et envoyée par morceaux
+STREAM_THRESHOLD = 2000
+STREAM_CHUNK_SIZE = 500
+
+# Marqueur des fragments JSON bruts dans la sortie de json.dumps : le caractère NUL
+# ne peut pas apparaître dans un texte PostgreSQL, le marqueur ne peut donc pas
+# provenir des données
+RAW_MARKER = '\x00raw\x00'
+RAW_PATTERN = re.compile(r'"\\u0000raw\\u0000(\d+)"')
+
+
+class RawJSON:
+    # Texte JSON déjà encodé (colonne JSONB lue sans décodage), recopié tel quel en sortie
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return f"RawJSON({self.text!r})"
+
+
+def raw_jsonb(cur):
+    # Les colonnes JSONB lues par ce curseur ne sont pas décodées en objets Python
+    register_default_jsonb(cur, loads=RawJSON)
+    return cur
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, Range):
+        # tsrange / daterange (ex. appointments.time_range) : bornes ISO 8601 et inclusivité
+        if value.isempty:
+            return None
+        return {
+            "lower": value.lower,
+            "upper": value.upper,
+            "bounds": ('[' if value.lower_inc else '(') + (']' if value.upper_inc else ')')
+        }
+    raise TypeError(f"Type non sérialisable: {type(value).__name__}")
+
+
+def dumps(obj, **kwargs):
+    # json.dumps avec recopie des fragments RawJSON : chacun est remplacé par un
+    # marqueur pendant l'encodage, puis substitué en une seule passe
+    fragments = []
+
+    def default(value):
+        if isinstance(value, RawJSON):
+            fragments.append(value.text)
+            return f"{RAW_MARKER}{len(fragments) - 1}"
+        return json_default(value)
+
+    kwargs.setdefault('ensure_ascii', False)
+    kwargs.setdefault('separators', (',', ':'))
+    encoded = json.dumps(obj, default=default, **kwargs)
+    if fragments:
+        encoded = RAW_PATTERN.sub(lambda match: fragments[int(match.group(1))], encoded)
+    return encoded
+
+
+def iter_json_array(items, chunk_size=STREAM_CHUNK_SIZE):
+    # Encode une liste par morceaux : la réponse complète n'est jamais matérialisée en mémoire
+    yield '['
+    for start in range(0, len(items), chunk_size):
+        chunk = dumps(items[start:start + chunk_size])
+        yield ('' if start == 0 else ',') + chunk[1:-1]
+    yield ']'
+
+
+def json_list_response(items, status=200):
+    # Petites listes : réponse classique ; au-delà du seuil : encodage en flux
+    if len(items) <= STREAM_THRESHOLD:
+        return Response(dumps(items), status=status, mimetype='application/json')
+    return Response(iter_json_array(items), status=status, mimetype='application/json')
+
+
+class FastJSONProvider(JSONProvider):
+    # Remplace le fournisseur par défaut de Flask : dates au format ISO 8601,
+    # Decimal en nombre, JSONB brut recopié, clés non triées
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(f"{self.dumps(obj)}\n", mimetype=self.mimetype)
@@ -0,0 +1,179 @@
+# services/mailer.py
+# Envoi d'e-mails hors requête : les messages sont écrits dans email_outbox dans la même
+# transaction que l'écriture qui les déclenche, puis envoyés par lots par le worker de
+# tâches (file 'email') sur une seule connexion SMTP
+import random
+import smtplib
+
+from flask_mail import Message
+from psycopg2.extras import RealDictCursor, execute_values
+
+from services.jobs import enqueue
+
+DELIVER_TASK = 'mail.deliver'
+MAIL_QUEUE = 'email'
+
+# Messages envoyés par connexion SMTP
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+
+# Nouvelle tentative : RETRY_BASE * 2^(tentative - 1) secondes, plafonné, avec gigue
+RETRY_BASE = 30
+RETRY_MAX = 3600
+
+# Refus propres à un message : le reste du lot peut être envoyé sur la même connexion
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def queue_email(cur, recipients, subject, body, html=None):
+    # Le message (et la tâche d'envoi) n'existe que si la transaction de l'appelant est validée
+    return queue_emails(cur, [{"recipients": recipients, "subject": subject, "body": body, "html": html}])[0]
+
+
+def queue_emails(cur, messages):
+    if not messages:
+        return []
+    with cur.connection.cursor() as mail_cur:
+        rows = execute_values(
+            mail_cur,
+            "INSERT INTO email_outbox (recipients, subject, body, html, max_attempts) VALUES %s RETURNING id",
+            [
+                (list(message['recipients']), message['subject'], message['body'], message.get('html'), MAX_ATTEMPTS)
+                for message in messages
+            ],
+            template="(%s::text[], %s, %s, %s, %s)",
+            fetch=True
+        )
+        ids = [row[0] for row in rows]
+    enqueue(cur, DELIVER_TASK, queue=MAIL_QUEUE)
+    return ids
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE * 2 ** max(attempts - 1, 0), RETRY_MAX) * random.uniform(0.8, 1.2)
+
+
+def deliver_batch(cur, mail, sender=None):
+    # Réserve un lot (les lignes restent verrouillées jusqu'à la validation, un worker arrêté
+    # en cours d'envoi laisse donc ses messages en attente) et l'envoie sur une connexion.
+    # Renvoie (envoyés, échecs) ; 0 message réservé signifie que la file est vide.
+    cur.execute(
+        """
+        SELECT id, recipients, subject, body, html, attempts, max_attempts
+        FROM email_outbox
+        WHERE status = 'queued' AND next_attempt_at <= clock_timestamp()
+        ORDER BY next_attempt_at, id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED""",
+        (BATCH_SIZE,)
+    )
+    batch = cur.fetchall()
+    if not batch:
+        return 0, 0
+
+    sent = []
+    failures = {}
+    try:
+        with mail.connect() as connection:
+            for message in batch:
+                try:
+                    connection.send(Message(
+                        subject=message['subject'],
+                        recipients=list(message['recipients']),
+                        body=message['body'],
+                        html=message['html'],
+                        sender=sender
+                    ))
+                    sent.append(message['id'])
+                except MESSAGE_ERRORS as e:
+                    failures[message['id']] = str(e)
+    except Exception as e:
+        # Connexion perdue ou refusée : les messages non envoyés seront retentés
+        for message in batch:
+            if message['id'] not in sent and message['id'] not in failures:
+                failures[message['id']] = str(e)
+
+    if sent:
+        # Le contenu (mots de passe temporaires...) n'est pas conservé après envoi
+        cur.execute(
+            """
+            UPDATE email_outbox
+            SET status = 'sent', sent_at = clock_timestamp(), attempts = attempts + 1,
+                body = '', html = NULL, last_error = NULL
+            WHERE id = ANY(%s)""",
+            (sent,)
+        )
+    for message in batch:
+        error = failures.get(message['id'])
+        if error is None:
+            continue
+        attempts = message['attempts'] + 1
+        if attempts < message['max_attempts']:
+            cur.execute(
+                """
+                UPDATE email_outbox
+                SET attempts = %s, last_error = %s,
+                    next_attempt_at = clock_timestamp() + make_interval(secs => %s)
+                WHERE id = %s""",
+                (attempts, error, retry_delay(attempts), message['id'])
+            )
+        else:
+            cur.execute(
+                """
+                UPDATE email_outbox
+                SET status = 'failed', attempts = %s, last_error = %s, body = '', html = NULL
+                WHERE id = %s""",
+                (attempts, error, message['id'])
+            )
+    return len(sent), len(failures)
+
+
+def deliver_pending(get_connection, release_connection, mail, sender=None):
+    # Vide la file des messages prêts, lot par lot ; si des messages restent en attente
+    # de nouvelle tentative, une tâche d'envoi est planifiée à leur échéance
+    conn = get_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_batch(cur, mail, sender)
+            conn.commit()
+            total_sent += sent
+            total_failed += failed
+            if sent + failed < BATCH_SIZE:
+                break
+            if sent == 0:
+                # Lot entier en échec (serveur SMTP indisponible) : attendre les nouvelles tentatives
+                break
+        # Une seule tâche de reprise, sauf si une tâche d'envoi est déjà prévue avant l'échéance
+        cur.execute(
+            """
+            SELECT EXTRACT(EPOCH FROM MIN(next_attempt_at) - clock_timestamp()) AS delay
+            FROM email_outbox
+            WHERE status = 'queued'
+              AND NOT EXISTS (
+                  SELECT 1 FROM jobs
+                  WHERE queue = %s AND task = %s AND status = 'queued'
+                    AND run_at <= (SELECT MIN(next_attempt_at) FROM email_outbox WHERE status = 'queued')
+              )""",
+            (MAIL_QUEUE, DELIVER_TASK)
+        )
+        delay = cur.fetchone()['delay']
+        if delay is not None:
+            enqueue(cur, DELIVER_TASK, queue=MAIL_QUEUE, delay=max(float(delay), 0))
+        conn.commit()
+        return total_sent, total_failed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
+
+
+def purge_sent(cur, days=30):
+    cur.execute(
+        "DELETE FROM email_outbox WHERE status = 'sent' AND sent_at < clock_timestamp() - make_interval(days => %s)",
+        (days,)
+    )
+    return cur.rowcount
@@ -0,0 +1,133 @@
+# services/notifications.py
+# Création et lecture des notifications, compteurs de non-lus maintenus par transaction
+import json
+
+from services.events import publish_events
+from services.json_encoding import json_default
+
+
+def create_notifications(cur, user_ids, type_, title, message, data=None):
+    # Diffusion vers plusieurs destinataires : une seule insertion multi-lignes
+    user_ids = sorted({int(user_id) for user_id in user_ids if user_id})
+    return insert_notifications(cur, [(user_id, type_, title, message, data) for user_id in user_ids])
+
+
+def insert_notifications(cur, notifications):
+    # Notifications individuelles (user_id, type, titre, message, données) en une insertion
+    notifications = [notification for notification in notifications if notification[0]]
+    if not notifications:
+        return []
+
+    columns = list(zip(*notifications))
+    encoded = [json.dumps(data, default=json_default) if data is not None else None for data in columns[4]]
+    with cur.connection.cursor() as notif_cur:
+        notif_cur.execute(
+            """
+            INSERT INTO notifications (user_id, type, title, message, data)
+            SELECT n.user_id, n.type, n.title, n.message, n.data::jsonb
+            FROM unnest(%s::int[], %s::text[], %s::text[], %s::text[], %s::text[])
+                AS n(user_id, type, title, message, data)
+            RETURNING id, user_id, created_at""",
+            ([int(user_id) for user_id in columns[0]], list(columns[1]), list(columns[2]), list(columns[3]), encoded)
+        )
+        created = notif_cur.fetchall()
+
+        notif_cur.execute(
+            """
+            INSERT INTO notification_counters (user_id, unread_count)
+            SELECT user_id, COUNT(*)
+            FROM unnest(%s::int[]) AS user_id
+            GROUP BY user_id
+            ORDER BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET
+                unread_count = notification_counters.unread_count + EXCLUDED.unread_count,
+                updated_at = CURRENT_TIMESTAMP""",
+            ([user_id for _, user_id, _ in created],)
+        )
+
+    # INSERT ... SELECT FROM unnest renvoie les lignes dans l'ordre des tableaux
+    publish_events(cur, [
+        (user_id, 'notification', {
+            "id": notification_id,
+            "type": notification[1],
+            "title": notification[2],
+            "message": notification[3],
+            "data": notification[4],
+            "created_at": created_at
+        })
+        for (notification_id, user_id, created_at), notification in zip(created, notifications)
+    ])
+    return [notification_id for notification_id, _, _ in created]
+
+
+def create_notification(cur, user_id, type_, title, message, data=None):
+    created = create_notifications(cur, [user_id], type_, title, message, data)
+    return created[0] if created else None
+
+
+def get_unread_count(cur, user_id):
+    cur.execute("SELECT unread_count FROM notification_counters WHERE user_id = %s", (user_id,))
+    row = cur.fetchone()
+    return row['unread_count'] if row else recount_unread(cur, user_id)
+
+
+def recount_unread(cur, user_id):
+    # Compteur absent (utilisateur antérieur aux compteurs, ligne supprimée) : recalculé
+    # et créé pour les appels suivants
+    cur.execute(
+        """
+        INSERT INTO notification_counters (user_id, unread_count)
+        SELECT %s, COUNT(*) FROM notifications WHERE user_id = %s AND is_read = FALSE
+        ON CONFLICT (user_id) DO UPDATE SET
+            unread_count = EXCLUDED.unread_count,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING unread_count""",
+        (user_id, user_id)
+    )
+    return cur.fetchone()['unread_count']
+
+
+def list_notifications(cur, user_id, limit=50, before=None, unread_only=False):
+    cur.execute(
+        """
+        SELECT id, type, title, message, data, is_read, created_at, read_at
+        FROM notifications
+        WHERE user_id = %s
+          AND (%s::timestamp IS NULL OR created_at < %s::timestamp)
+          AND (NOT %s OR is_read = FALSE)
+        ORDER BY created_at DESC
+        LIMIT %s""",
+        (user_id, before, before, unread_only, limit)
+    )
+    return cur.fetchall()
+
+
+def mark_notifications_read(cur, user_id, ids=None, before=None):
+    # Un seul UPDATE : marque les notifications et décrémente le compteur.
+    # ids et before vides -> toutes les notifications non lues
+    cur.execute(
+        """
+        WITH updated AS (
+            UPDATE notifications
+            SET is_read = TRUE, read_at = CURRENT_TIMESTAMP
+            WHERE user_id = %s
+              AND is_read = FALSE
+              AND (%s::int[] IS NULL OR id = ANY(%s::int[]))
+              AND (%s::timestamp IS NULL OR created_at <= %s::timestamp)
+            RETURNING id
+        ),
+        counter AS (
+            UPDATE notification_counters
+            SET unread_count = GREATEST(unread_count - (SELECT COUNT(*) FROM updated), 0),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = %s
+            RETURNING unread_count
+        )
+        SELECT (SELECT COUNT(*) FROM updated) AS marked, (SELECT unread_count FROM counter) AS unread_count""",
+        (user_id, ids, ids, before, before, user_id)
+    )
+    row = cur.fetchone()
+    if row['unread_count'] is not None:
+        return row['marked'], row['unread_count']
+    # Compteur absent : recalculé après le marquage
+    return row['marked'], recount_unread(cur, user_id)
@@ -0,0 +1,296 @@
+# services/partitions.py
+# Partitionnement mensuel des tables à forte volumétrie (ajout seul)
+import re
+from datetime import date, datetime, timedelta
+
+from services.sync import SYNC_ENTITIES
+
+# Nombre de mois créés à l'avance
+MONTHS_AHEAD = 3
+
+# Table -> colonne de partitionnement et index composites (les autres index et les clés
+# étrangères de la table d'origine sont recopiés depuis le catalogue lors de la conversion)
+PARTITIONED_TABLES = {
+    'health_metrics': {
+        'column': 'recorded_at',
+        'indexes': [
+            ('idx_health_metrics_user_recorded', '(user_id, recorded_at)'),
+            ('idx_health_metrics_user_type_recorded', '(user_id, metric_type, recorded_at)'),
+            ('idx_health_metrics_user_updated', '(user_id, updated_at, id)'),
+        ],
+        'retention_setting': 'health_metrics_retention_days',
+    },
+    'messages': {
+        'column': 'sent_at',
+        'indexes': [
+            ('idx_messages_sender_sent', '(sender_id, sent_at)'),
+            ('idx_messages_receiver_sent', '(receiver_id, sent_at)'),
+            ('idx_messages_conversation_id', '(conversation_id, id)'),
+        ],
+        'retention_setting': 'messages_retention_days',
+    },
+    'notifications': {
+        'column': 'created_at',
+        'indexes': [
+            ('idx_notifications_user_created', '(user_id, created_at)'),
+            ('idx_notifications_type', '(type)'),
+            ('idx_notifications_user_unread', '(user_id, created_at) WHERE is_read = FALSE'),
+        ],
+        'retention_setting': 'log_retention_days',
+    },
+}
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month.strftime('%Y%m')}"
+
+
+def is_partitioned(cur, table):
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p')", (table,))
+    row = cur.fetchone()
+    return bool(row) and row['relkind'] == 'p'
+
+
+def list_partitions(cur, table):
+    # Partitions mensuelles existantes, triées par mois
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+    """, (table,))
+    prefix = f"{table}_p"
+    partitions = []
+    for row in cur.fetchall():
+        name = row['relname']
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            partitions.append((datetime.strptime(suffix, '%Y%m').date(), name))
+    return sorted(partitions)
+
+
+def create_partition(cur, table, month):
+    name = partition_name(table, month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (name,))
+    if cur.fetchone()['present']:
+        return name
+
+    # Des lignes de ce mois dans la partition par défaut empêcheraient la création :
+    # elles sont déplacées dans la nouvelle partition avant son rattachement
+    column = PARTITIONED_TABLES[table]['column']
+    cur.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {column} >= %s AND {column} < %s) AS stray",
+        (lower, upper)
+    )
+    if not cur.fetchone()['stray']:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+        return name
+
+    cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(
+        f"INSERT INTO {name} SELECT * FROM {table}_default WHERE {column} >= %s AND {column} < %s",
+        (lower, upper)
+    )
+    cur.execute("SELECT COALESCE(MAX(id), 0) AS last FROM sync_tombstones")
+    last_tombstone = cur.fetchone()['last']
+    cur.execute(f"DELETE FROM {table}_default WHERE {column} >= %s AND {column} < %s", (lower, upper))
+    if table in SYNC_ENTITIES:
+        # Lignes déplacées, pas supprimées : les tombstones du trigger ne doivent pas être publiés
+        cur.execute(
+            f"DELETE FROM sync_tombstones WHERE id > %s AND entity = %s AND row_id IN (SELECT id FROM {name})",
+            (last_tombstone, table)
+        )
+    cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    return name
+
+
+def ensure_partitions(cur, table, months_ahead=MONTHS_AHEAD, today=None):
+    # Crée les partitions du mois courant et des mois suivants
+    current = month_start(today or date.today())
+    return [create_partition(cur, table, add_months(current, i)) for i in range(months_ahead + 1)]
+
+
+def convert_to_partitioned(cur, table, months_ahead=MONTHS_AHEAD):
+    # Migration d'une table classique vers une table partitionnée par mois :
+    # renommage, création de la table mère, recopie puis suppression de l'ancienne
+    if is_partitioned(cur, table):
+        return False
+
+    column = PARTITIONED_TABLES[table]['column']
+    legacy = f"{table}_legacy"
+
+    # Clés étrangères entrantes : elles ne peuvent viser la nouvelle table que si elles
+    # incluent la colonne de partitionnement (seule clé unique possible : (id, colonne))
+    inbound = inbound_foreign_keys(cur, table)
+    for foreign_key in inbound:
+        if column not in foreign_key['referenced_columns']:
+            raise ValueError(
+                f"{foreign_key['referencing_table']}.{foreign_key['name']} référence {table}"
+                f"({', '.join(foreign_key['referenced_columns'])}) : ajouter {column} à la clé "
+                f"ou supprimer la contrainte avant le partitionnement"
+            )
+    outbound = outbound_foreign_keys(cur, table)
+    indexes = secondary_indexes(cur, table)
+
+    for foreign_key in inbound:
+        cur.execute(f"ALTER TABLE {foreign_key['referencing_table']} DROP CONSTRAINT {foreign_key['name']}")
+    cur.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    cur.execute(f"UPDATE {legacy} SET {column} = CURRENT_TIMESTAMP WHERE {column} IS NULL")
+    # ALL sauf les index (recréés ensuite) : défauts, NOT NULL, CHECK, identités, commentaires
+    cur.execute(f"""
+        CREATE TABLE {table} (LIKE {legacy} INCLUDING ALL EXCLUDING INDEXES)
+        PARTITION BY RANGE ({column})
+    """)
+    cur.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    # Une partition par mois couvert par les données existantes
+    cur.execute(f"SELECT MIN({column}) AS first FROM {legacy}")
+    first = cur.fetchone()['first']
+    current = month_start(date.today())
+    month = month_start(first.date()) if first else current
+    while month < current:
+        create_partition(cur, table, month)
+        month = add_months(month, 1)
+    ensure_partitions(cur, table, months_ahead)
+
+    cur.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+    cur.execute(f"ALTER SEQUENCE IF EXISTS {table}_id_seq OWNED BY {table}.id")
+    cur.execute(f"DROP TABLE {legacy}")
+
+    # La clé primaire doit inclure la colonne de partitionnement
+    cur.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})")
+    for foreign_key in outbound:
+        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {foreign_key['name']} {foreign_key['definition']}")
+    for definition in indexes:
+        cur.execute(definition)
+    create_indexes(cur, table)
+    for foreign_key in inbound:
+        cur.execute(f"ALTER TABLE {foreign_key['referencing_table']} ADD CONSTRAINT {foreign_key['name']} {foreign_key['definition']}")
+    return True
+
+
+def inbound_foreign_keys(cur, table):
+    # Contraintes d'autres tables qui référencent `table` (la définition vise le nom de la
+    # table, elle reste donc valable une fois la table partitionnée recréée sous ce nom)
+    cur.execute("""
+        SELECT c.conname AS name, c.conrelid::regclass::text AS referencing_table,
+               pg_get_constraintdef(c.oid) AS definition,
+               ARRAY(
+                   SELECT a.attname FROM unnest(c.confkey) AS k(attnum)
+                   JOIN pg_attribute a ON a.attrelid = c.confrelid AND a.attnum = k.attnum
+               )::text[] AS referenced_columns
+        FROM pg_constraint c
+        WHERE c.contype = 'f' AND c.confrelid = %s::regclass AND c.conrelid <> c.confrelid
+    """, (table,))
+    return cur.fetchall()
+
+
+def outbound_foreign_keys(cur, table):
+    cur.execute("""
+        SELECT conname AS name, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = %s::regclass
+    """, (table,))
+    return cur.fetchall()
+
+
+def secondary_indexes(cur, table):
+    # Index non uniques de la table d'origine, à recréer sur la table mère (un index unique
+    # devrait inclure la colonne de partitionnement : la clé primaire est recréée à part)
+    cur.execute("""
+        SELECT pg_get_indexdef(i.indexrelid) AS definition
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass AND NOT i.indisunique
+    """, (table,))
+    pattern = re.compile(r'^CREATE INDEX (\S+) ON (ONLY )?\S+')
+    return [
+        pattern.sub(lambda match: f"CREATE INDEX IF NOT EXISTS {match.group(1)} ON {table}", row['definition'])
+        for row in cur.fetchall()
+    ]
+
+
+def create_indexes(cur, table):
+    # Les index créés sur la table mère sont propagés à chaque partition
+    for name, columns in PARTITIONED_TABLES[table]['indexes']:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {columns}")
+
+
+def apply_retention(cur, table, retention_days, archive=True, today=None):
+    # Détache (archive) ou supprime les partitions entièrement expirées
+    if not retention_days or retention_days <= 0:
+        return []
+
+    column = PARTITIONED_TABLES[table]['column']
+    cutoff = (today or date.today()) - timedelta(days=retention_days)
+    expired = []
+    for month, name in list_partitions(cur, table):
+        if add_months(month, 1) > cutoff:
+            continue
+        if table in SYNC_ENTITIES:
+            record_expired_tombstones(cur, table, name)
+        if table == 'notifications':
+            release_unread_counts(cur, f"SELECT user_id FROM {name} WHERE is_read = FALSE")
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        if archive:
+            cur.execute(f"ALTER TABLE {name} RENAME TO {table}_archive_{month.strftime('%Y%m')}")
+        else:
+            cur.execute(f"DROP TABLE {name}")
+        expired.append(name)
+
+    # Les lignes hors plage tombées dans la partition par défaut
+    if table == 'notifications':
+        release_unread_counts(cur, f"SELECT user_id FROM {table}_default WHERE is_read = FALSE AND {column} < %s", (cutoff,))
+    cur.execute(f"DELETE FROM {table}_default WHERE {column} < %s", (cutoff,))
+    return expired
+
+
+def release_unread_counts(cur, unread_query, params=()):
+    # notification_counters est maintenu par l'application : les notifications non lues
+    # qui expirent sont retirées des compteurs avant le détachement ou la suppression
+    cur.execute(f"""
+        UPDATE notification_counters c
+        SET unread_count = GREATEST(c.unread_count - expired.count, 0), updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT user_id, COUNT(*) AS count
+            FROM ({unread_query}) AS unread
+            GROUP BY user_id
+        ) AS expired
+        WHERE c.user_id = expired.user_id
+    """, params)
+
+
+def record_expired_tombstones(cur, table, partition):
+    # Le détachement d'une partition ne déclenche pas sync_record_tombstone : les lignes
+    # expirées sont signalées explicitement pour que les clients synchronisés les oublient
+    # (la suppression dans la partition par défaut passe, elle, par le trigger)
+    for column in SYNC_ENTITIES[table]:
+        cur.execute(f"""
+            INSERT INTO sync_tombstones (entity, row_id, user_id)
+            SELECT %s, id, {column}
+            FROM {partition}
+            WHERE {column} IS NOT NULL
+        """, (table,))
+
+
+def maintain_partitions(cur, settings, months_ahead=MONTHS_AHEAD):
+    # Maintenance périodique : partitions à venir et rétention
+    archive = settings.get('partition_archive_mode', 'archive') != 'drop'
+    report = {}
+    for table, config in PARTITIONED_TABLES.items():
+        if not is_partitioned(cur, table):
+            continue
+        created = ensure_partitions(cur, table, months_ahead)
+        expired = apply_retention(cur, table, int(settings.get(config['retention_setting'], 0)), archive)
+        report[table] = {"created": created, "expired": expired}
+    return report
@@ -0,0 +1,110 @@
+# services/patient_summary.py
+# Tableau de bord patient en un seul aller-retour : chaque section est une requête indexée
+
+UPCOMING_LIMIT = 10
+PRESCRIPTIONS_LIMIT = 5
+
+
+def upcoming_appointments(cur, patient_id):
+    cur.execute(
+        """
+        SELECT
+            a.id,
+            a.appointment_datetime,
+            a.doctor_id,
+            a.reason,
+            a.status,
+            a.duration,
+            d.name AS doctor_name,
+            d.speciality AS specialty
+        FROM appointments a
+        JOIN users d ON a.doctor_id = d.id
+        WHERE a.patient_id = %s
+          AND a.appointment_datetime >= CURRENT_TIMESTAMP
+          AND a.status NOT IN ('cancelled', 'no_show')
+        ORDER BY a.appointment_datetime
+        LIMIT %s""",
+        (patient_id, UPCOMING_LIMIT)
+    )
+    return cur.fetchall()
+
+
+def recent_prescriptions(cur, patient_id):
+    cur.execute(
+        """
+        SELECT
+            p.id,
+            p.doctor_id,
+            d.name AS doctor_name,
+            p.medications,
+            p.instructions,
+            p.duration,
+            p.created_at
+        FROM prescriptions p
+        JOIN users d ON p.doctor_id = d.id
+        WHERE p.patient_id = %s
+        ORDER BY p.created_at DESC
+        LIMIT %s""",
+        (patient_id, PRESCRIPTIONS_LIMIT)
+    )
+    return cur.fetchall()
+
+
+def latest_metrics(cur, patient_id):
+    # Dernière mesure par type (index user_id, metric_type, recorded_at)
+    cur.execute(
+        """
+        SELECT DISTINCT ON (metric_type) metric_type, value, recorded_at
+        FROM health_metrics
+        WHERE user_id = %s
+        ORDER BY metric_type, recorded_at DESC""",
+        (patient_id,)
+    )
+    return {row['metric_type']: {"value": row['value'], "recorded_at": row['recorded_at']} for row in cur.fetchall()}
+
+
+def unread_messages(cur, patient_id):
+    cur.execute(
+        "SELECT COALESCE(SUM(unread_count), 0) AS count FROM conversation_members WHERE user_id = %s",
+        (patient_id,)
+    )
+    return cur.fetchone()['count']
+
+
+def unread_notifications(cur, patient_id):
+    cur.execute("SELECT unread_count FROM notification_counters WHERE user_id = %s", (patient_id,))
+    row = cur.fetchone()
+    return row['unread_count'] if row else 0
+
+
+def doctors_seen(cur, patient_id):
+    cur.execute(
+        """
+        SELECT
+            d.id,
+            d.name,
+            d.speciality,
+            d.work_location,
+            r.total_appointments,
+            r.last_appointment
+        FROM doctor_patients r
+        JOIN users d ON r.doctor_id = d.id
+        WHERE r.patient_id = %s
+        ORDER BY r.last_appointment DESC""",
+        (patient_id,)
+    )
+    return cur.fetchall()
+
+
+SUMMARY_SECTIONS = {
+    'appointments': upcoming_appointments,
+    'prescriptions': recent_prescriptions,
+    'metrics': latest_metrics,
+    'unread_messages': unread_messages,
+    'unread_notifications': unread_notifications,
+    'doctors': doctors_seen,
+}
+
+
+def build_summary(cur, patient_id, sections):
+    return {section: SUMMARY_SECTIONS[section](cur, patient_id) for section in sections}
@@ -0,0 +1,111 @@
+# services/reference_cache.py
+# Cache versionné des données de référence (liste des médecins, paramètres système, rôles) :
+# chaque entrée dépend de tables dont la version est incrémentée à chaque modification
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, request
+
+from services.compression import ENCODINGS
+from services.json_encoding import dumps
+
+# Filet de sécurité si une notification d'invalidation était perdue (secondes)
+MAX_AGE = 300
+
+# Nombre d'entrées conservées (LRU) : les clés par utilisateur (('role', user_id)) ne doivent
+# pas faire croître le cache d'une entrée par utilisateur distinct tout au long du processus
+MAX_ENTRIES = 5000
+
+
+def strip_encoding_suffix(etag):
+    # Suffixe ajouté par la compression à l'ETag d'une représentation compressée
+    for encoding in ENCODINGS:
+        if etag.endswith(f"-{encoding}"):
+            return etag[:-len(encoding) - 1]
+    return etag
+
+
+class ReferenceCache:
+
+    def __init__(self, listener=None, max_age=MAX_AGE, max_entries=MAX_ENTRIES):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.versions = {}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.listener = listener
+        if listener is not None:
+            listener.on_change(self.on_table_change)
+
+    def on_table_change(self, table):
+        if table is None:
+            self.clear()
+        else:
+            self.bump(table)
+
+    def bump(self, *tables):
+        # Appelé localement après une écriture, et par l'écouteur pour les autres processus
+        with self.lock:
+            for table in tables:
+                self.versions[table] = self.versions.get(table, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get(self, key, tables, loader):
+        # Entrée {"value", "body", "etag"} ; loader() n'est appelé que si une table dépendante a changé
+        if self.listener is not None:
+            self.listener.start()
+        with self.lock:
+            versions = tuple(self.versions.get(table, 0) for table in tables)
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry and entry['versions'] == versions and entry['expires'] > time.monotonic():
+            return entry
+
+        value = loader()
+        body = dumps(value)
+        entry = {
+            "value": value,
+            "body": body,
+            "etag": hashlib.sha1(body.encode('utf-8')).hexdigest()[:20],
+            "versions": versions,
+            "expires": time.monotonic() + self.max_age
+        }
+        with self.lock:
+            # Une modification survenue pendant le chargement rend la valeur lue incertaine
+            if tuple(self.versions.get(table, 0) for table in tables) == versions:
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return entry
+
+
+def cached_json_response(entry):
+    # 304 si le client possède déjà cette version (If-None-Match), sinon le corps mis en cache
+    header = request.headers.get('If-None-Match')
+    if header:
+        for candidate in header.split(','):
+            candidate = candidate.strip()
+            if candidate == '*':
+                return not_modified(entry['etag'])
+            tag = candidate[2:] if candidate.startswith('W/') else candidate
+            if strip_encoding_suffix(tag.strip('"')) == entry['etag']:
+                return not_modified(tag.strip('"'))
+
+    response = Response(entry['body'], mimetype='application/json')
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,119 @@
+# services/reminders.py
+# Rappels de rendez-vous (paramètre reminder_before_appointment, en heures) : à chaque
+# passage, les rendez-vous entrés dans la fenêtre de rappel sont réservés dans
+# appointment_reminders (clé unique : plusieurs workers ne rappellent jamais deux fois),
+# puis notifiés et envoyés par e-mail en masse dans la même transaction
+from psycopg2.extras import RealDictCursor
+
+from services.mailer import queue_emails
+from services.notifications import insert_notifications
+
+# Rendez-vous réservés par transaction
+BATCH_SIZE = 1000
+
+# Intervalle entre deux passages du planificateur (secondes)
+TICK_INTERVAL = 60
+
+# Conservation des réservations après la date du rendez-vous (jours)
+RETENTION_DAYS = 30
+
+
+def claim_due_reminders(cur, hours, limit=BATCH_SIZE):
+    # Une seule requête par plage sur l'index partiel idx_appointments_scheduled_datetime.
+    # Un rendez-vous déplacé change de appointment_datetime et sera donc rappelé à nouveau.
+    cur.execute(
+        """
+        WITH due AS (
+            SELECT a.id, a.appointment_datetime, a.patient_id, a.doctor_id
+            FROM appointments a
+            WHERE a.status = 'scheduled'
+              AND a.appointment_datetime > LOCALTIMESTAMP
+              AND a.appointment_datetime <= LOCALTIMESTAMP + make_interval(hours => %s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM appointment_reminders r
+                  WHERE r.appointment_id = a.id AND r.appointment_datetime = a.appointment_datetime
+              )
+            ORDER BY a.appointment_datetime
+            LIMIT %s
+        ),
+        claimed AS (
+            INSERT INTO appointment_reminders (appointment_id, appointment_datetime)
+            SELECT id, appointment_datetime FROM due
+            ON CONFLICT DO NOTHING
+            RETURNING appointment_id, appointment_datetime
+        )
+        SELECT c.appointment_id, c.appointment_datetime, d.patient_id, d.doctor_id,
+               p.name AS patient_name, p.email AS patient_email, doc.name AS doctor_name
+        FROM claimed c
+        JOIN due d ON d.id = c.appointment_id
+        JOIN users p ON p.id = d.patient_id
+        JOIN users doc ON doc.id = d.doctor_id
+        ORDER BY c.appointment_datetime""",
+        (hours, limit)
+    )
+    return cur.fetchall()
+
+
+def reminder_text(reminder):
+    when = reminder['appointment_datetime'].strftime('%d/%m/%Y à %H:%M')
+    return f"Rappel : rendez-vous avec Dr. {reminder['doctor_name']} le {when}"
+
+
+def send_reminders(cur, reminders, email_enabled):
+    insert_notifications(cur, [
+        (
+            reminder['patient_id'],
+            'appointment_reminder',
+            "Rappel de rendez-vous",
+            reminder_text(reminder),
+            {
+                "appointment_id": reminder['appointment_id'],
+                "appointment_datetime": reminder['appointment_datetime']
+            }
+        )
+        for reminder in reminders
+    ])
+    if email_enabled:
+        queue_emails(cur, [
+            {
+                "recipients": [reminder['patient_email']],
+                "subject": "Rappel de rendez-vous",
+                "body": f"Bonjour {reminder['patient_name']},\n\n{reminder_text(reminder)}.\n"
+            }
+            for reminder in reminders if reminder['patient_email']
+        ])
+
+
+def run_reminders(get_connection, release_connection, settings):
+    # Un passage du planificateur : réserve et envoie les rappels par lots de BATCH_SIZE
+    hours = settings.get_int('reminder_before_appointment', 24)
+    if hours <= 0:
+        return 0
+    email_enabled = settings.get_bool('email_notifications')
+
+    conn = get_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        total = 0
+        while True:
+            reminders = claim_due_reminders(cur, hours)
+            if reminders:
+                send_reminders(cur, reminders, email_enabled)
+            conn.commit()
+            total += len(reminders)
+            if len(reminders) < BATCH_SIZE:
+                return total
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
+
+
+def purge_reminders(cur, days=RETENTION_DAYS):
+    cur.execute(
+        "DELETE FROM appointment_reminders WHERE appointment_datetime < LOCALTIMESTAMP - make_interval(days => %s)",
+        (days,)
+    )
+    return cur.rowcount
@@ -0,0 +1,90 @@
+# services/roster.py
+# Liste des patients par médecin, précalculée et maintenue à chaque écriture de rendez-vous
+
+# Statuts qui ne comptent pas comme prochain rendez-vous
+INACTIVE_STATUSES = ('cancelled', 'no_show')
+
+
+def refresh_roster_entry(cur, doctor_id, patient_id):
+    # Recalcule la ligne (médecin, patient) à partir de ses seuls rendez-vous (index dédié).
+    # Le verrou du couple sérialise les réservations concurrentes de ce seul couple : la requête
+    # suivante, exécutée après son obtention, voit les rendez-vous des transactions validées
+    # entre-temps (sinon chacune recalculerait sans celui de l'autre et la dernière gagnerait)
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"roster:{doctor_id}:{patient_id}",))
+    cur.execute(
+        """
+        INSERT INTO doctor_patients (doctor_id, patient_id, total_appointments, last_appointment, next_appointment, updated_at)
+        SELECT
+            %(doctor_id)s,
+            %(patient_id)s,
+            COUNT(*),
+            MAX(appointment_datetime),
+            MIN(appointment_datetime) FILTER (
+                WHERE appointment_datetime >= CURRENT_TIMESTAMP AND status NOT IN %(inactive)s
+            ),
+            CURRENT_TIMESTAMP
+        FROM appointments
+        WHERE doctor_id = %(doctor_id)s AND patient_id = %(patient_id)s
+        HAVING COUNT(*) > 0
+        ON CONFLICT (doctor_id, patient_id) DO UPDATE SET
+            total_appointments = EXCLUDED.total_appointments,
+            last_appointment = EXCLUDED.last_appointment,
+            next_appointment = EXCLUDED.next_appointment,
+            updated_at = EXCLUDED.updated_at""",
+        {"doctor_id": doctor_id, "patient_id": patient_id, "inactive": INACTIVE_STATUSES}
+    )
+
+
+def get_roster(cur, doctor_id):
+    # Lecture indexée ; le prochain rendez-vous n'est recalculé que s'il est déjà passé
+    cur.execute(
+        """
+        SELECT
+            u.id,
+            u.name,
+            u.email,
+            u.phone,
+            u.birthdate,
+            mr.medical_history,
+            mr.allergies,
+            r.total_appointments,
+            r.last_appointment,
+            CASE
+                WHEN r.next_appointment IS NULL OR r.next_appointment >= CURRENT_TIMESTAMP THEN r.next_appointment
+                ELSE (
+                    SELECT MIN(a.appointment_datetime)
+                    FROM appointments a
+                    WHERE a.doctor_id = r.doctor_id
+                      AND a.patient_id = r.patient_id
+                      AND a.appointment_datetime >= CURRENT_TIMESTAMP
+                      AND a.status NOT IN %(inactive)s
+                )
+            END AS next_appointment
+        FROM doctor_patients r
+        JOIN users u ON u.id = r.patient_id
+        LEFT JOIN medical_records mr ON u.id = mr.patient_id
+        WHERE r.doctor_id = %(doctor_id)s AND u.role = 'patient'
+        ORDER BY u.name""",
+        {"doctor_id": doctor_id, "inactive": INACTIVE_STATUSES}
+    )
+    return cur.fetchall()
+
+
+def rebuild_roster(cur):
+    cur.execute("TRUNCATE doctor_patients")
+    cur.execute(
+        """
+        INSERT INTO doctor_patients (doctor_id, patient_id, total_appointments, last_appointment, next_appointment)
+        SELECT
+            doctor_id,
+            patient_id,
+            COUNT(*),
+            MAX(appointment_datetime),
+            MIN(appointment_datetime) FILTER (
+                WHERE appointment_datetime >= CURRENT_TIMESTAMP AND status NOT IN %s
+            )
+        FROM appointments
+        GROUP BY doctor_id, patient_id""",
+        (INACTIVE_STATUSES,)
+    )
+    return cur.rowcount
@@ -0,0 +1,322 @@
+# services/scheduling.py
+# Recherche de créneaux libres : disponibilités moins rendez-vous réservés (arithmétique d'intervalles)
+import base64
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Statuts qui libèrent le créneau
+FREE_STATUSES = ('cancelled', 'no_show')
+
+DEFAULT_SLOT_MINUTES = 30
+
+# Résolution des cartes d'occupation (minutes)
+OCCUPANCY_RESOLUTION = 5
+
+
+def merge_intervals(intervals):
+    # Union d'intervalles [début, fin) triés
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(available, busy):
+    # available et busy fusionnés et triés ; renvoie available \ busy
+    free = []
+    busy = merge_intervals(busy)
+    i = 0
+    for start, end in available:
+        current = start
+        while i < len(busy) and busy[i][1] <= current:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > current:
+                free.append((current, busy[j][0]))
+            current = max(current, busy[j][1])
+            j += 1
+        if current < end:
+            free.append((current, end))
+    return free
+
+
+def split_by_day(intervals):
+    # Découpe les intervalles à minuit pour les ranger par jour
+    days = {}
+    for start, end in intervals:
+        while start < end:
+            midnight = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+            stop = min(end, midnight)
+            days.setdefault(start.date(), []).append((start, stop))
+            start = stop
+    return days
+
+
+def slots_in(intervals, minutes, not_before=None):
+    # Créneaux de `minutes` alignés sur le début de chaque intervalle
+    if minutes <= 0:
+        raise ValueError(f"Durée de créneau invalide: {minutes}")
+    step = timedelta(minutes=minutes)
+    for start, end in intervals:
+        current = start
+        while current + step <= end:
+            if not_before is None or current >= not_before:
+                yield current, current + step
+            current += step
+
+
+def expand_templates(templates, first_day, last_day):
+    # Matérialise les modèles hebdomadaires sur la période demandée uniquement
+    by_weekday = {}
+    for template in templates:
+        by_weekday.setdefault(template['weekday'], []).append(template)
+    windows = []
+    day = first_day
+    while day <= last_day:
+        for template in by_weekday.get(day.weekday(), ()):
+            if template['valid_from'] and day < template['valid_from']:
+                continue
+            if template['valid_until'] and day > template['valid_until']:
+                continue
+            windows.append((
+                datetime.combine(day, template['start_time']),
+                datetime.combine(day, template['end_time'])
+            ))
+        day += timedelta(days=1)
+    return windows
+
+
+def occupancy_bitmaps(doctor_ids, appointments, start, days, resolution=OCCUPANCY_RESOLUTION):
+    # Carte d'occupation par médecin : un bit par tranche de `resolution` minutes,
+    # construite par tableau de différences puis somme cumulée (sans boucle par tranche)
+    bins = days * 24 * 60 // resolution
+    rows = {doctor_id: index for index, doctor_id in enumerate(doctor_ids)}
+    diff = np.zeros((len(doctor_ids), bins + 1), dtype=np.int32)
+
+    active = [a for a in appointments if a['status'] not in FREE_STATUSES]
+    if active:
+        row = np.fromiter((rows[a['doctor_id']] for a in active), dtype=np.int64, count=len(active))
+        offsets = np.fromiter(
+            ((a['appointment_datetime'] - start).total_seconds() / 60 for a in active),
+            dtype=np.float64, count=len(active)
+        )
+        durations = np.fromiter((a['duration'] for a in active), dtype=np.float64, count=len(active))
+        first = np.clip(np.floor(offsets / resolution), 0, bins).astype(np.int64)
+        last = np.clip(np.ceil((offsets + durations) / resolution), 0, bins).astype(np.int64)
+        np.add.at(diff, (row, first), 1)
+        np.add.at(diff, (row, last), -1)
+
+    occupied = np.cumsum(diff[:, :bins], axis=1) > 0
+    packed = np.packbits(occupied, axis=1)
+    return {
+        doctor_id: {
+            "bitmap": base64.b64encode(packed[index].tobytes()).decode('ascii'),
+            "occupied_minutes": int(occupied[index].sum()) * resolution
+        }
+        for doctor_id, index in rows.items()
+    }
+
+
+class ScheduleCache:
+    # Intervalles par médecin et par jour : nombre de médecins et de jours par médecin bornés (LRU),
+    # avec expiration pour limiter l'écart entre processus ; invalidé localement à chaque modification
+
+    def __init__(self, max_doctors=500, max_days_per_doctor=120, ttl=60):
+        self.max_doctors = max_doctors
+        self.max_days_per_doctor = max_days_per_doctor
+        self.ttl = ttl
+        self.doctors = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        doctor_id, day = key
+        with self.lock:
+            days = self.doctors.get(doctor_id)
+            if days is None or day not in days:
+                return None
+            expires, value = days[day]
+            if expires < time.monotonic():
+                del days[day]
+                return None
+            days.move_to_end(day)
+            self.doctors.move_to_end(doctor_id)
+            return value
+
+    def set(self, key, value):
+        doctor_id, day = key
+        with self.lock:
+            days = self.doctors.setdefault(doctor_id, OrderedDict())
+            days[day] = (time.monotonic() + self.ttl, value)
+            days.move_to_end(day)
+            self.doctors.move_to_end(doctor_id)
+            while len(days) > self.max_days_per_doctor:
+                days.popitem(last=False)
+            while len(self.doctors) > self.max_doctors:
+                self.doctors.popitem(last=False)
+
+    def invalidate(self, doctor_id, day=None):
+        with self.lock:
+            if day is None:
+                self.doctors.pop(doctor_id, None)
+            elif doctor_id in self.doctors:
+                self.doctors[doctor_id].pop(day, None)
+
+
+class Scheduler:
+
+    def __init__(self, cache=None):
+        self.cache = cache or ScheduleCache()
+
+    def load_windows(self, cur, doctor_ids, start, end):
+        # Plages de disponibilité de tous les médecins demandés : modèles hebdomadaires
+        # développés sur la période, créneaux ponctuels, moins les exceptions (congés, fermetures)
+        windows = {doctor_id: [] for doctor_id in doctor_ids}
+        last_day = (end - timedelta(microseconds=1)).date()
+
+        cur.execute(
+            """
+            SELECT doctor_id, weekday, start_time, end_time, valid_from, valid_until
+            FROM availability_templates
+            WHERE doctor_id = ANY(%s)
+              AND (valid_from IS NULL OR valid_from <= %s)
+              AND (valid_until IS NULL OR valid_until >= %s)""",
+            (doctor_ids, last_day, start.date())
+        )
+        templates = {doctor_id: [] for doctor_id in doctor_ids}
+        for row in cur.fetchall():
+            templates[row['doctor_id']].append(row)
+        for doctor_id, doctor_templates in templates.items():
+            windows[doctor_id].extend(expand_templates(doctor_templates, start.date(), last_day))
+
+        cur.execute(
+            """
+            SELECT doctor_id, slot_date AS start, slot_date + make_interval(mins => duration) AS end
+            FROM availability_slots
+            WHERE doctor_id = ANY(%s)
+              AND status = 'available'
+              AND slot_date < %s
+              AND slot_date + make_interval(mins => duration) > %s""",
+            (doctor_ids, end, start)
+        )
+        for row in cur.fetchall():
+            windows[row['doctor_id']].append((row['start'], row['end']))
+
+        cur.execute(
+            """
+            SELECT doctor_id, start_datetime AS start, end_datetime AS end
+            FROM availability_exceptions
+            WHERE doctor_id = ANY(%s)
+              AND start_datetime < %s
+              AND end_datetime > %s""",
+            (doctor_ids, end, start)
+        )
+        closures = {doctor_id: [] for doctor_id in doctor_ids}
+        for row in cur.fetchall():
+            closures[row['doctor_id']].append((row['start'], row['end']))
+
+        for doctor_id in doctor_ids:
+            clipped = [(max(w_start, start), min(w_end, end)) for w_start, w_end in windows[doctor_id]]
+            merged = merge_intervals([(w_start, w_end) for w_start, w_end in clipped if w_start < w_end])
+            windows[doctor_id] = subtract_intervals(merged, closures[doctor_id])
+        return windows
+
+    def load_bookings(self, cur, doctor_ids, start, end):
+        # Rendez-vous actifs chevauchant la période, en une requête
+        cur.execute(
+            """
+            SELECT doctor_id, appointment_datetime AS start,
+                   appointment_datetime + make_interval(mins => duration) AS end
+            FROM appointments
+            WHERE doctor_id = ANY(%s)
+              AND status NOT IN %s
+              AND appointment_datetime < %s
+              AND appointment_datetime + make_interval(mins => duration) > %s""",
+            (doctor_ids, FREE_STATUSES, end, start)
+        )
+        bookings = {doctor_id: [] for doctor_id in doctor_ids}
+        for row in cur.fetchall():
+            bookings[row['doctor_id']].append((row['start'], row['end']))
+        return bookings
+
+    def day_intervals(self, cur, doctor_ids, first_day, last_day):
+        # {(médecin, jour): {"windows": [...], "free": [...]}} pour chaque jour de la période
+        days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+        result = {}
+        missing = set()
+        for doctor_id in doctor_ids:
+            for day in days:
+                cached = self.cache.get((doctor_id, day))
+                if cached is None:
+                    missing.add(doctor_id)
+                else:
+                    result[(doctor_id, day)] = cached
+
+        if missing:
+            missing = sorted(missing)
+            start = datetime.combine(first_day, datetime.min.time())
+            end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+            windows = self.load_windows(cur, missing, start, end)
+            bookings = self.load_bookings(cur, missing, start, end)
+            for doctor_id in missing:
+                windows_by_day = split_by_day(windows[doctor_id])
+                free_by_day = split_by_day(subtract_intervals(windows[doctor_id], bookings[doctor_id]))
+                for day in days:
+                    value = {"windows": windows_by_day.get(day, []), "free": free_by_day.get(day, [])}
+                    self.cache.set((doctor_id, day), value)
+                    result[(doctor_id, day)] = value
+        return result
+
+    def day_schedule(self, cur, doctor_id, day, minutes=DEFAULT_SLOT_MINUTES):
+        # Tous les créneaux d'une journée, avec leur disponibilité
+        intervals = self.day_intervals(cur, [doctor_id], day, day)[(doctor_id, day)]
+        free = intervals['free']
+        now = datetime.now()
+        schedule = []
+        for start, end in slots_in(intervals['windows'], minutes):
+            available = start >= now and any(f_start <= start and end <= f_end for f_start, f_end in free)
+            slot = {"time": start.strftime('%H:%M'), "start": start, "end": end, "available": available}
+            if not available:
+                slot["reason"] = 'Passé' if start < now else 'Réservé'
+            schedule.append(slot)
+        return schedule
+
+    def materialize(self, cur, doctor_id, first_day, last_day, minutes=DEFAULT_SLOT_MINUTES):
+        # Créneaux concrets de la période consultée, avec leur statut
+        intervals = self.day_intervals(cur, [doctor_id], first_day, last_day)
+        slots = []
+        for day in sorted(day for (_, day) in intervals):
+            free = intervals[(doctor_id, day)]['free']
+            for start, end in slots_in(intervals[(doctor_id, day)]['windows'], minutes):
+                available = any(f_start <= start and end <= f_end for f_start, f_end in free)
+                slots.append({
+                    "slot_date": start,
+                    "duration": minutes,
+                    "status": 'available' if available else 'booked'
+                })
+        return slots
+
+    def next_free_slots(self, cur, doctor_ids, start, end, limit=10, minutes=DEFAULT_SLOT_MINUTES):
+        # Les `limit` prochains créneaux libres, tous médecins confondus, par ordre chronologique
+        if limit <= 0:
+            raise ValueError(f"Nombre de créneaux invalide: {limit}")
+        start = max(start, datetime.now())
+        intervals = self.day_intervals(cur, doctor_ids, start.date(), (end - timedelta(microseconds=1)).date())
+        slots = []
+        for (doctor_id, _), value in intervals.items():
+            for slot_start, slot_end in slots_in(value['free'], minutes, not_before=start):
+                if slot_end <= end:
+                    slots.append({"doctor_id": doctor_id, "start": slot_start, "end": slot_end})
+        slots.sort(key=lambda slot: (slot['start'], slot['doctor_id']))
+        return slots[:limit]
+
+    def invalidate(self, doctor_id, day=None):
+        self.cache.invalidate(int(doctor_id), day)
@@ -0,0 +1,111 @@
+# services/settings.py
+# Paramètres système chargés une fois par processus, rechargés sur notification
+# (trigger system_settings_notify_change) : lecture sans accès à la base sur les chemins critiques
+import threading
+
+from psycopg2.extras import RealDictCursor
+
+
+def load_system_settings(cur):
+    cur.execute("""
+        SELECT setting_key, setting_value, setting_type, description
+        FROM system_settings
+        ORDER BY setting_key
+    """)
+    settings = cur.fetchall()
+
+    # Convertir les valeurs selon leur type
+    formatted_settings = {}
+    for setting in settings:
+        value = setting['setting_value']
+        if setting['setting_type'] == 'boolean':
+            value = value.lower() == 'true'
+        elif setting['setting_type'] == 'integer':
+            value = int(value)
+        elif setting['setting_type'] == 'float':
+            value = float(value)
+        formatted_settings[setting['setting_key']] = value
+    return formatted_settings
+
+
+class SettingsService:
+
+    def __init__(self, get_connection, release_connection, listener=None):
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+        self.lock = threading.Lock()
+        self.values = None
+        # Incrémentée à chaque invalidation : un rechargement commencé avant est écarté
+        self.version = 0
+        self.callbacks = []
+        self.listener = listener
+        if listener is not None:
+            listener.on_change(self.on_table_change)
+
+    def on_table_change(self, table):
+        # None : reconnexion de l'écouteur, des modifications ont pu être manquées
+        if table in (None, 'system_settings'):
+            self.invalidate()
+
+    def on_reload(self, callback):
+        # callback(settings) après chaque rechargement (configuration de composants dépendants)
+        self.callbacks.append(callback)
+
+    def invalidate(self):
+        with self.lock:
+            self.version += 1
+            self.values = None
+
+    def reload(self):
+        with self.lock:
+            version = self.version
+        conn = self.get_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            values = load_system_settings(cur)
+        finally:
+            conn.rollback()
+            cur.close()
+            self.release_connection(conn)
+        with self.lock:
+            # Une modification notifiée pendant la lecture rend ces valeurs incertaines :
+            # elles servent à cet appel, le suivant rechargera
+            if self.version != version:
+                return values
+            self.values = values
+        for callback in self.callbacks:
+            callback(dict(values))
+        return values
+
+    def snapshot(self):
+        if self.listener is not None:
+            self.listener.start()
+        values = self.values
+        if values is None:
+            values = self.reload()
+        return values
+
+    def get(self, key, default=None):
+        return self.snapshot().get(key, default)
+
+    def get_bool(self, key, default=False):
+        value = self.get(key, default)
+        if isinstance(value, str):
+            return value.lower() == 'true'
+        return bool(value)
+
+    def get_int(self, key, default=0):
+        try:
+            return int(self.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_float(self, key, default=0.0):
+        try:
+            return float(self.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_str(self, key, default=''):
+        value = self.get(key, default)
+        return default if value is None else str(value)
@@ -0,0 +1,117 @@
+# services/stats.py
+# Statistiques des tableaux de bord : une requête unique, mise en cache avec rafraîchissement en arrière-plan
+import threading
+import time
+
+from psycopg2.extras import RealDictCursor
+
+from services.structured_logging import get_logger
+
+logger = get_logger('stats')
+
+# Durée de validité du cache (secondes)
+STATS_TTL = 30
+
+# Au-delà de cet âge (secondes), une valeur expirée est recalculée immédiatement
+STATS_MAX_STALE = 300
+
+# Au-delà de ce nombre de lignes estimé, le total provient de pg_class.reltuples
+APPROXIMATE_THRESHOLD = 1000000
+
+STATS_QUERY = """
+    WITH user_counts AS (
+        SELECT
+            COUNT(*) AS total_users,
+            COUNT(*) FILTER (WHERE role = 'doctor') AS total_doctors,
+            COUNT(*) FILTER (WHERE role = 'patient') AS total_patients,
+            COUNT(*) FILTER (WHERE role = 'assistant') AS total_assistants,
+            COUNT(*) FILTER (WHERE is_active = TRUE) AS active_users
+        FROM users
+    ),
+    estimates AS (
+        SELECT reltuples::bigint AS appointments_estimate
+        FROM pg_class
+        WHERE oid = 'appointments'::regclass
+    )
+    SELECT
+        uc.*,
+        (
+            SELECT COUNT(*)
+            FROM appointments
+            WHERE appointment_datetime >= CURRENT_DATE
+              AND appointment_datetime < CURRENT_DATE + INTERVAL '1 day'
+        ) AS today_appointments,
+        e.appointments_estimate > %(threshold)s AS appointments_approximate,
+        CASE
+            WHEN e.appointments_estimate > %(threshold)s THEN e.appointments_estimate
+            ELSE (SELECT COUNT(*) FROM appointments)
+        END AS total_appointments
+    FROM user_counts uc, estimates e
+"""
+
+
+class StatsService:
+    # Sert la dernière valeur connue et relance le calcul en arrière-plan
+    # lorsqu'elle a expiré (stale-while-revalidate)
+
+    def __init__(self, get_connection, release_connection, ttl=STATS_TTL, threshold=APPROXIMATE_THRESHOLD):
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+        self.ttl = ttl
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.value = None
+        self.computed_at = 0
+        self.refreshing = False
+
+    def compute(self):
+        conn = self.get_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cur.execute(STATS_QUERY, {"threshold": self.threshold})
+            row = cur.fetchone()
+            conn.rollback()
+        finally:
+            cur.close()
+            self.release_connection(conn)
+
+        stats = {
+            'totalUsers': row['total_users'],
+            'totalDoctors': row['total_doctors'],
+            'totalPatients': row['total_patients'],
+            'totalAssistants': row['total_assistants'],
+            'activeUsers': row['active_users'],
+            'totalAppointments': row['total_appointments'],
+            'todayAppointments': row['today_appointments'],
+            'approximate': bool(row['appointments_approximate'])
+        }
+        with self.lock:
+            self.value = stats
+            self.computed_at = time.monotonic()
+        return stats
+
+    def refresh_in_background(self):
+        try:
+            self.compute()
+        except Exception:
+            logger.exception("Erreur lors du rafraîchissement des statistiques")
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def get(self):
+        with self.lock:
+            value = self.value
+            age = time.monotonic() - self.computed_at
+            if age > STATS_MAX_STALE:
+                value = None
+            elif value is not None and age > self.ttl and not self.refreshing:
+                self.refreshing = True
+                threading.Thread(target=self.refresh_in_background, name='stats-refresh', daemon=True).start()
+        if value is None:
+            value = self.compute()
+        return dict(value)
+
+    def invalidate(self):
+        with self.lock:
+            self.computed_at = 0
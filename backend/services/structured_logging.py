@@ -0,0 +1,188 @@
+# services/structured_logging.py
+# Journalisation structurée non bloquante : les requêtes ne font qu'empiler les
+# enregistrements (QueueHandler) ; un fil dédié (QueueListener) masque les données de santé
+# et écrit une ligne JSON par enregistrement, avec l'identifiant de la requête
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+LOGGER_NAME = 'telemedicine'
+
+# Enregistrements en attente d'écriture ; au-delà, ils sont abandonnés plutôt que de bloquer
+QUEUE_SIZE = 10000
+
+# Champs ajoutés par logging lui-même : tout autre attribut provient de `extra=`
+RESERVED_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+# Champs contenant des données personnelles ou de santé : jamais écrits en clair
+REDACTED_FIELDS = {
+    'password', 'plain_password', 'temp_password', 'token', 'access_token', 'authorization',
+    'email', 'name', 'phone', 'birthdate', 'address', 'notes', 'reason', 'value',
+    'diagnosis', 'medication', 'dosage', 'instructions', 'content', 'message_content'
+}
+REDACTED = '[masqué]'
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+# Numéros internationaux ou nationaux (0...), et mobiles sénégalais (7X XXX XX XX)
+PHONE_PATTERN = re.compile(r'(?<![\w-])(?:(?:\+\d{1,3}|0)[\s.]?\d(?:[\s.]?\d){7,12}|7[05-8](?:[\s.]?\d){7})(?!\d)')
+
+# En-tête transmis par le proxy ou le client ; une valeur invalide est remplacée
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Proportion des requêtes réussies journalisées pour les routes les plus sollicitées
+# (les erreurs et les requêtes lentes sont toujours journalisées)
+DEFAULT_SAMPLE_RATES = {
+    'get_appointments': 0.05,
+    'add_health_metric': 0.05,
+    'get_health_metrics': 0.05,
+    'get_notifications': 0.02,
+    'get_notifications_unread_count': 0.02,
+    'stream_events': 0.02,
+}
+SLOW_REQUEST_MS = 1000
+
+
+def redact(value, key=None):
+    if key is not None and key.lower() in REDACTED_FIELDS:
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return PHONE_PATTERN.sub(REDACTED, EMAIL_PATTERN.sub(REDACTED, value))
+    return value
+
+
+class RequestContextFilter(logging.Filter):
+    # Exécuté dans le fil de la requête : capture l'identifiant avant la mise en file
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    # Exécuté dans le fil d'écriture : masquage et sérialisation hors du chemin des requêtes
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRIBUTES and value is not None:
+                entry[key] = redact(value, key)
+        if record.exc_text:
+            # Les messages d'erreur PostgreSQL citent les valeurs (Key (email)=(...) already exists)
+            entry["exception"] = redact(record.exc_text)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # Le texte de l'exception est produit ici (la pile n'est plus disponible ensuite),
+        # le reste du formatage est laissé au fil d'écriture
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def configure_logging(level=logging.INFO, stream=None):
+    # Installe la file sur le logger de l'application ; renvoie le QueueListener démarré
+    log_queue = queue.Queue(QUEUE_SIZE)
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JSONFormatter())
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.handlers = [handler]
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    listener.running = True
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def stop_listener(listener):
+    # Écrit les enregistrements restants avant l'arrêt du processus (une seule fois)
+    if getattr(listener, 'running', False):
+        listener.running = False
+        listener.stop()
+
+
+def get_logger(name=None):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+class RequestLogger:
+    # Identifiant par requête (repris de X-Request-ID ou généré, renvoyé dans la réponse)
+    # et une ligne d'accès par requête, échantillonnée pour les routes les plus sollicitées
+
+    def __init__(self, app=None, sample_rates=None):
+        self.sample_rates = dict(DEFAULT_SAMPLE_RATES if sample_rates is None else sample_rates)
+        self.logger = get_logger('access')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    def sampled(self, endpoint, status, duration_ms):
+        if status >= 400 or duration_ms >= SLOW_REQUEST_MS:
+            return True
+        rate = self.sample_rates.get(endpoint, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def after_request(self, response):
+        request_id = g.get('request_id')
+        if request_id is None:
+            return response
+        response.headers[REQUEST_ID_HEADER] = request_id
+        duration_ms = round((time.perf_counter() - g.request_started) * 1000, 2)
+        if self.sampled(request.endpoint, response.status_code, duration_ms):
+            # Chemin et paramètres exclus : ils peuvent contenir des identifiants de patients
+            self.logger.info(
+                "requête",
+                extra={
+                    "method": request.method,
+                    "endpoint": request.endpoint,
+                    "status": response.status_code,
+                    "duration_ms": duration_ms,
+                    "sample_rate": self.sample_rates.get(request.endpoint, 1.0),
+                }
+            )
+        return response
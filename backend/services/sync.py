@@ -0,0 +1,158 @@
+# services/sync.py
+# Synchronisation différentielle : lignes modifiées (updated_at) et supprimées (tombstones)
+# depuis le dernier jeton de chaque entité
+import base64
+import json
+from datetime import datetime
+
+# Entité -> colonnes désignant les utilisateurs concernés par une ligne
+SYNC_ENTITIES = {
+    'appointments': ('patient_id', 'doctor_id'),
+    'prescriptions': ('patient_id', 'doctor_id'),
+    'health_metrics': ('user_id',),
+    'medical_records': ('patient_id',),
+}
+
+# Lignes renvoyées au plus par entité et par appel
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 2000
+
+# Les lignes modifiées dans les dernières secondes ne sont pas encore renvoyées :
+# une transaction plus ancienne mais pas encore validée ne peut pas passer derrière le jeton
+SYNC_LAG_SECONDS = 5
+
+# Durée de conservation des tombstones ; un jeton plus ancien impose une resynchronisation complète
+SYNC_TOMBSTONE_RETENTION_DAYS = 90
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode_token(position):
+    raw = json.dumps({
+        "u": position['updated_at'].isoformat(),
+        "i": position['id'],
+        "t": position['tombstone_id'],
+        "s": position['issued_at'].isoformat()
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode('ascii')
+
+
+def decode_token(token):
+    # ValueError si le jeton est illisible
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return {
+            "updated_at": datetime.fromisoformat(raw['u']),
+            "id": int(raw['i']),
+            "tombstone_id": int(raw['t']),
+            "issued_at": datetime.fromisoformat(raw['s'])
+        }
+    except (TypeError, KeyError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Jeton de synchronisation invalide: {str(e)}")
+
+
+def sync_bounds(cur):
+    # Borne haute commune à toutes les entités, horizon de rétention et dernier tombstone
+    cur.execute(
+        """
+        SELECT
+            LOCALTIMESTAMP AS now,
+            LOCALTIMESTAMP - make_interval(secs => %s) AS upper,
+            LOCALTIMESTAMP - make_interval(days => %s) AS horizon,
+            (SELECT COALESCE(MAX(id), 0) FROM sync_tombstones) AS last_tombstone""",
+        (SYNC_LAG_SECONDS, SYNC_TOMBSTONE_RETENTION_DAYS)
+    )
+    return cur.fetchone()
+
+
+def sync_entity(cur, entity, user_id, position, upper, limit):
+    owners = SYNC_ENTITIES[entity]
+    owner_filter = " OR ".join(f"{column} = %(user_id)s" for column in owners)
+    cur.execute(
+        f"""
+        SELECT *
+        FROM {entity}
+        WHERE ({owner_filter})
+          AND (updated_at, id) > (%(updated_at)s, %(id)s)
+          AND updated_at < %(upper)s
+        ORDER BY updated_at, id
+        LIMIT %(limit)s""",
+        {
+            "user_id": user_id,
+            "updated_at": position['updated_at'],
+            "id": position['id'],
+            "upper": upper,
+            "limit": limit + 1
+        }
+    )
+    changed = cur.fetchall()
+
+    cur.execute(
+        """
+        SELECT id, row_id
+        FROM sync_tombstones
+        WHERE user_id = %s AND entity = %s AND id > %s AND deleted_at < %s
+        ORDER BY id
+        LIMIT %s""",
+        (user_id, entity, position['tombstone_id'], upper, limit + 1)
+    )
+    deleted = cur.fetchall()
+
+    has_more = len(changed) > limit or len(deleted) > limit
+    changed = changed[:limit]
+    deleted = deleted[:limit]
+    if changed:
+        position = dict(position, updated_at=changed[-1]['updated_at'], id=changed[-1]['id'])
+    if deleted:
+        position = dict(position, tombstone_id=deleted[-1]['id'])
+    return {
+        "changed": changed,
+        "deleted": [row['row_id'] for row in deleted],
+        "has_more": has_more,
+        "position": position
+    }
+
+
+def sync_changes(cur, user_id, tokens, entities, limit=SYNC_DEFAULT_LIMIT):
+    # tokens : {entité: jeton} ; une entité sans jeton repart de zéro (synchronisation complète)
+    bounds = sync_bounds(cur)
+    result = {}
+    for entity in entities:
+        token = tokens.get(entity)
+        reset = False
+        position = decode_token(token) if token else None
+        if position and position['issued_at'] < bounds['horizon']:
+            # Des tombstones ont pu être purgés depuis : le client doit vider son cache
+            position = None
+            reset = True
+        if position is None:
+            # Synchronisation complète : les suppressions passées sont sans objet
+            position = {"updated_at": EPOCH, "id": 0, "tombstone_id": bounds['last_tombstone']}
+
+        changes = sync_entity(cur, entity, user_id, position, bounds['upper'], limit)
+        position = dict(changes.pop('position'), issued_at=bounds['now'])
+        changes['token'] = encode_token(position)
+        changes['reset'] = reset or not token
+        result[entity] = changes
+    return result
+
+
+def install_sync_triggers(cur, entity):
+    # Triggers de schema.sql, à recréer quand la table est reconstruite (partitionnement)
+    owners = ", ".join(f"'{column}'" for column in SYNC_ENTITIES[entity])
+    cur.execute(f"DROP TRIGGER IF EXISTS {entity}_sync_touch ON {entity}")
+    cur.execute(f"""
+        CREATE TRIGGER {entity}_sync_touch BEFORE INSERT OR UPDATE ON {entity}
+        FOR EACH ROW EXECUTE FUNCTION sync_touch_updated_at()""")
+    cur.execute(f"DROP TRIGGER IF EXISTS {entity}_sync_tombstone ON {entity}")
+    cur.execute(f"""
+        CREATE TRIGGER {entity}_sync_tombstone AFTER DELETE ON {entity}
+        FOR EACH ROW EXECUTE FUNCTION sync_record_tombstone('{entity}', {owners})""")
+
+
+def purge_tombstones(cur):
+    cur.execute(
+        "DELETE FROM sync_tombstones WHERE deleted_at < LOCALTIMESTAMP - make_interval(days => %s)",
+        (SYNC_TOMBSTONE_RETENTION_DAYS,)
+    )
+    return cur.rowcount
@@ -0,0 +1,153 @@
+# stress_booking.py - Test de charge des réservations concurrentes
+# Usage : python stress_booking.py <email> <mot de passe> <doctor_id> [<doctor_id> ...] [--url <url de base>]
+# WORKERS fils réservent en parallèle par POST /appointments (create_appointment), en deux phases :
+#   1. créneaux tous distincts : débit de référence, sans aucun conflit
+#   2. créneaux de 30 minutes décalés de 15 minutes : la contrainte appointments_no_overlap
+#      doit refuser tout double rendez-vous (409) sans faire chuter le débit
+# Le compte connecté réserve pour lui-même (patient ou admin). Relever au préalable
+# max_appointments_per_day (0 = illimité) pour que le plafond journalier ne fausse pas la mesure.
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    "dbname": "telemedicine",
+    "user": os.getenv("DB_USER", "telemed_user"),
+    "password": os.getenv("DB_PASSWORD", "telemed2025"),
+    "host": "localhost"
+}
+
+WORKERS = 32
+ATTEMPTS_PER_WORKER = 50
+MARKER = 'stress-test-booking'
+
+
+def book(session, base_url, patient_id, doctor_id, start, counters):
+    response = session.post(f"{base_url}/appointments", json={
+        "patient_id": patient_id,
+        "doctor_id": doctor_id,
+        "appointment_datetime": start.isoformat(),
+        "reason": MARKER,
+        "duration": 30
+    })
+    with counters['lock']:
+        counters[response.status_code] = counters.get(response.status_code, 0) + 1
+
+
+def run_phase(base_url, token, patient_id, next_slot):
+    # next_slot() -> (doctor_id, début) ; renvoie (durée, statuts HTTP)
+    counters = {'lock': threading.Lock()}
+
+    def worker():
+        session = requests.Session()
+        session.headers['Authorization'] = f"Bearer {token}"
+        for _ in range(ATTEMPTS_PER_WORKER):
+            doctor_id, start = next_slot()
+            book(session, base_url, patient_id, doctor_id, start, counters)
+
+    threads = [threading.Thread(target=worker) for _ in range(WORKERS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    counters.pop('lock')
+    return elapsed, counters
+
+
+def report(label, elapsed, counters):
+    attempts = sum(counters.values())
+    print(f"{label:<28} {attempts} tentatives en {elapsed:6.2f}s ({attempts / elapsed:6.0f}/s) - statuts : {counters}")
+    return attempts / elapsed
+
+
+def count_overlaps(cur):
+    cur.execute(
+        """
+        SELECT COUNT(*)
+        FROM appointments a
+        JOIN appointments b ON a.doctor_id = b.doctor_id AND a.id < b.id AND a.time_range && b.time_range
+        WHERE a.reason = %s AND b.reason = %s
+          AND a.status NOT IN ('cancelled', 'no_show') AND b.status NOT IN ('cancelled', 'no_show')""",
+        (MARKER, MARKER)
+    )
+    return cur.fetchone()[0]
+
+
+def main():
+    args = sys.argv[1:]
+    base_url = "http://localhost:5000"
+    if '--url' in args:
+        index = args.index('--url')
+        base_url = args[index + 1]
+        del args[index:index + 2]
+    if len(args) < 3:
+        print("Usage : python stress_booking.py <email> <mot de passe> <doctor_id> [<doctor_id> ...] [--url <url de base>]")
+        sys.exit(1)
+    email, password = args[0], args[1]
+    doctor_ids = [int(arg) for arg in args[2:]]
+
+    response = requests.post(f"{base_url}/login", json={"email": email, "password": password})
+    if response.status_code != 200:
+        print(f"❌ Connexion impossible ({response.status_code}) : {response.text}")
+        sys.exit(1)
+    token = response.json()['access_token']
+    patient_id = response.json()['user']['id']
+
+    # Dates lointaines distinctes par phase : aucun rendez-vous réel ni de la phase précédente
+    day = datetime.combine(datetime.now().date() + timedelta(days=365), datetime.min.time()) + timedelta(hours=8)
+    slots = itertools.count()
+    slots_lock = threading.Lock()
+
+    def distinct_slot():
+        # Créneaux consécutifs de 30 minutes répartis entre les médecins : jamais de chevauchement
+        with slots_lock:
+            index = next(slots)
+        return doctor_ids[index % len(doctor_ids)], day + timedelta(minutes=30 * (index // len(doctor_ids)))
+
+    rush_day = day + timedelta(days=60)
+
+    def overlapping_slot():
+        # 40 débuts possibles décalés de 15 minutes : chaque créneau chevauche ses voisins
+        return random.choice(doctor_ids), rush_day + timedelta(minutes=15 * random.randint(0, 39))
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    try:
+        print(f"{WORKERS} fils x {ATTEMPTS_PER_WORKER} réservations, {len(doctor_ids)} médecin(s), {base_url}")
+        baseline = report("Créneaux distincts", *run_phase(base_url, token, patient_id, distinct_slot))
+        elapsed, counters = run_phase(base_url, token, patient_id, overlapping_slot)
+        contended = report("Créneaux qui se chevauchent", elapsed, counters)
+        print(f"Débit sous contention : {contended / baseline * 100:.0f} % du débit sans conflit")
+
+        overlaps = count_overlaps(cur)
+        unexpected = {status: count for status, count in counters.items() if status not in (201, 409)}
+    finally:
+        cur.execute("DELETE FROM appointments WHERE reason = %s", (MARKER,))
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    print(f"Doubles réservations : {overlaps}")
+    if overlaps:
+        print("❌ Des rendez-vous se chevauchent")
+        sys.exit(1)
+    if unexpected:
+        print(f"❌ Réponses inattendues : {unexpected}")
+        sys.exit(1)
+    print("✅ Aucune double réservation")
+
+
+if __name__ == "__main__":
+    main()